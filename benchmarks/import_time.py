@@ -0,0 +1,45 @@
+"""
+Measure how long importing proteus takes in a fresh interpreter.
+
+    python benchmarks/import_time.py [--runs 20] [--statement "import proteus"]
+
+The time of an empty interpreter is subtracted. Use `python -X importtime`
+to see which modules a regression comes from.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+STATEMENTS = [
+    "import proteus",
+    "from proteus import LLMsConfig, ProteusTeller, llm_from_config",
+    "from proteus.storages import SQLiteHistoryStore",
+]
+
+
+def measure(statement: str, runs: int) -> float:
+    """Median seconds of starting an interpreter and running statement."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--statement", action="append")
+    args = parser.parse_args()
+    baseline = measure("pass", args.runs)
+    for statement in args.statement or STATEMENTS:
+        elapsed = measure(statement, args.runs) - baseline
+        print(f"{elapsed * 1000:8.1f} ms  {statement}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Benchmarks of the hot paths of proteus, run offline against SimulatedLLM.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --baseline results.json --threshold 0.2
+
+Each benchmark reports the mean, p50 and p95 time per operation. With
+--baseline, medians are compared against a previous run, as they are less
+noisy than means, and the exit code is 1 if any benchmark got slower by more
+than the threshold.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from proteus.config import LLMsConfig, ManagerConfig, PromptsConfig
+from proteus.llms.simulated import SimulatedLLM
+from proteus.manager import ProteusManager
+from proteus.manager.talker_store import TalkerStore
+from proteus.spec import ProteusMessage, ProteusMessagePrompt
+from proteus.storages.cached_store import CachedHistoryStore
+from proteus.storages.history_store import (
+    BaseHistoryStore,
+    FileHistoryStore,
+    MemoryHistoryStore,
+)
+from proteus.storages.log_store import LogHistoryStore
+from proteus.storages.sqlite_store import SQLiteDatabase, SQLiteHistoryStore
+from proteus.storages.write_behind import WriteBehindHistoryStore
+from proteus.talker import ProteusTalker
+from proteus.teller import ProteusTeller
+
+Result = Dict[str, float]
+
+# measures the overhead of proteus itself, not of a backend
+INSTANT = LLMsConfig.SimulatedConfig(
+    latency_ms=0, latency_sigma=0, tokens_per_second=-1, reply_tokens=64
+)
+# a fast provider, for the concurrency of the async paths
+FAST = LLMsConfig.SimulatedConfig(latency_ms=5, latency_sigma=0.3, tokens_per_second=-1)
+PROMPT = ProteusMessagePrompt(
+    identity=[ProteusMessage(role="system", content="You are a benchmark. " * 20)],
+    examples=[
+        ProteusMessage(role="user", content="Hello " * 10),
+        ProteusMessage(role="assistant", content="Hi " * 10),
+    ],
+)
+PROMPTS = PromptsConfig(prompts={"default": PROMPT})
+LIVE_HISTORY_SIZE = 20
+# messages per session already in the stores, and sessions
+HISTORY_SIZE = 200
+SESSIONS = 50
+
+
+def summarize(timings: List[float]) -> Result:
+    timings = sorted(timings)
+    return {
+        "ops": len(timings),
+        "mean_us": statistics.fmean(timings) * 1e6,
+        "p50_us": timings[len(timings) // 2] * 1e6,
+        "p95_us": timings[int(0.95 * (len(timings) - 1))] * 1e6,
+    }
+
+
+def timed(op: Callable[[int], object], n: int) -> Result:
+    timings = []
+    for i in range(n):
+        start = time.perf_counter()
+        op(i)
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+
+def turn(i: int) -> List[ProteusMessage]:
+    return [
+        ProteusMessage(role="user", content=f"question {i} " * 8),
+        ProteusMessage(role="assistant", content=f"answer {i} " * 24),
+    ]
+
+
+def bench_teller(n: int) -> Result:
+    history = MemoryHistoryStore(HISTORY_SIZE, max_messages=HISTORY_SIZE)
+    history.extend("bench", [m for i in range(HISTORY_SIZE // 2) for m in turn(i)])
+    teller = ProteusTeller(
+        "bench", SimulatedLLM(INSTANT), PROMPT, history, LIVE_HISTORY_SIZE
+    )
+    return timed(lambda i: teller.say(f"question {i}"), n)
+
+
+def new_talker() -> ProteusTalker:
+    return ProteusTalker.from_new(
+        "default", PROMPTS, SimulatedLLM(INSTANT), LIVE_HISTORY_SIZE
+    )
+
+
+def bench_talker_say(n: int) -> Result:
+    talker = new_talker()
+    return timed(lambda i: talker.say(f"question {i}"), n)
+
+
+def bench_talker_asay(n: int) -> Result:
+    """Concurrent turns of many talkers against a backend with a few ms of latency."""
+    llm = SimulatedLLM(FAST)
+    talkers = [
+        ProteusTalker.from_new("default", PROMPTS, llm, LIVE_HISTORY_SIZE)
+        for _ in range(SESSIONS)
+    ]
+
+    async def run() -> List[float]:
+        async def say(i: int) -> float:
+            start = time.perf_counter()
+            await talkers[i % len(talkers)].asay(f"question {i}")
+            return time.perf_counter() - start
+
+        return await asyncio.gather(*[say(i) for i in range(n)])
+
+    start = time.perf_counter()
+    result = summarize(asyncio.run(run()))
+    result["ops_per_s"] = n / (time.perf_counter() - start)
+    return result
+
+
+def bench_manager_churn(n: int, folder: Path) -> Result:
+    """get_talker over more talkers than the manager keeps in memory."""
+    manager = ProteusManager(
+        LLMsConfig(simulated=INSTANT),
+        PROMPTS,
+        ManagerConfig(
+            live_history_size=LIVE_HISTORY_SIZE,
+            cache_folder=str(folder),
+            cache_talkers_enabled=True,
+            cache_talkers_mem_capacity=SESSIONS,
+            cache_backend="sqlite",
+        ),
+    )
+    ids = [manager.new_talker("default") for _ in range(4 * SESSIONS)]
+    manager.save_all_talkers()
+    return timed(lambda i: manager.get_talker(ids[(i * 7) % len(ids)]), n)
+
+
+def bench_talker_store_eviction(n: int) -> Result:
+    store = TalkerStore(SESSIONS)
+    talkers = [new_talker() for _ in range(n)]
+    return timed(lambda i: store.append(talkers[i]), n)
+
+
+def history_stores(folder: Path) -> Iterator[Tuple[str, BaseHistoryStore]]:
+    yield (
+        "memory",
+        MemoryHistoryStore(HISTORY_SIZE, max_messages=SESSIONS * HISTORY_SIZE),
+    )
+    yield "file", FileHistoryStore(folder / "file")
+    yield "sqlite", SQLiteHistoryStore(SQLiteDatabase(folder / "proteus.sqlite3"))
+    yield "log", LogHistoryStore(folder / "log")
+    yield (
+        "cached_sqlite",
+        CachedHistoryStore(
+            SQLiteHistoryStore(SQLiteDatabase(folder / "cached.sqlite3")),
+            tail_size=LIVE_HISTORY_SIZE,
+        ),
+    )
+    yield (
+        "write_behind_sqlite",
+        WriteBehindHistoryStore(
+            SQLiteHistoryStore(SQLiteDatabase(folder / "write_behind.sqlite3"))
+        ),
+    )
+
+
+def bench_history_store(store: BaseHistoryStore, n: int) -> Dict[str, Result]:
+    session_ids = [f"session-{s}" for s in range(SESSIONS)]
+    for session_id in session_ids:
+        for i in range(0, HISTORY_SIZE, 2):
+            store.extend(session_id, turn(i))
+    return {
+        "extend": timed(lambda i: store.extend(session_ids[i % SESSIONS], turn(i)), n),
+        "get_k": timed(
+            lambda i: store.get_k(session_ids[i % SESSIONS], LIVE_HISTORY_SIZE), n
+        ),
+    }
+
+
+def run(n: int) -> Dict[str, Result]:
+    results = {
+        "teller.say": bench_teller(n),
+        "talker.say": bench_talker_say(n),
+        "talker.asay": bench_talker_asay(n),
+        "talker_store.eviction": bench_talker_store_eviction(n),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        results["manager.get_talker_churn"] = bench_manager_churn(n, folder / "manager")
+        for name, store in history_stores(folder / "history"):
+            for op, result in bench_history_store(store, n).items():
+                results[f"history.{name}.{op}"] = result
+            close = getattr(store, "close", None)
+            if close is not None:
+                close()
+    return results
+
+
+def compare(
+    results: Dict[str, Result], baseline: Dict[str, Result], threshold: float
+) -> bool:
+    """Print the change of each median against the baseline. Returns whether none regressed."""
+    ok = True
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:40} {result['p50_us']:12.1f} us  (new)")
+            continue
+        ratio = result["p50_us"] / before["p50_us"]
+        regressed = ratio > 1 + threshold
+        ok = ok and not regressed
+        print(
+            f"{name:40} {result['p50_us']:12.1f} us  {ratio - 1:+7.1%}"
+            + ("  REGRESSED" if regressed else "")
+        )
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=1000, help="operations per benchmark")
+    parser.add_argument("--output", type=Path, help="save the results as JSON")
+    parser.add_argument("--baseline", type=Path, help="results of a previous run")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 is 20%%"
+    )
+    args = parser.parse_args()
+
+    results = run(args.n)
+    if args.output is not None:
+        args.output.write_text(
+            json.dumps(
+                {
+                    "python": sys.version,
+                    "platform": platform.platform(),
+                    "ops": args.n,
+                    "results": results,
+                },
+                indent=2,
+            )
+        )
+    if args.baseline is None:
+        for name, result in results.items():
+            print(
+                f"{name:40} {result['p50_us']:12.1f} us  p95 {result['p95_us']:.1f} us"
+            )
+        return
+    baseline = json.loads(args.baseline.read_text())["results"]
+    if not compare(results, baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,31 @@
-from proteus.config import LLMsConfig
-from proteus.llms import llm_from_config
-from proteus.spec import ProteusMessage, ProteusMessagePrompt
-from proteus.storages import history_store
-from proteus.teller import ProteusTeller
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from proteus.config import LLMsConfig
+    from proteus.llms import llm_from_config
+    from proteus.spec import ProteusMessage, ProteusMessagePrompt
+    from proteus.storages import history_store
+    from proteus.teller import ProteusTeller
+
+# names are imported on first access, so that `import proteus` stays cheap
+_LAZY = {
+    "LLMsConfig": "proteus.config",
+    "ProteusMessagePrompt": "proteus.spec",
+    "ProteusMessage": "proteus.spec",
+    "ProteusTeller": "proteus.teller",
+    "llm_from_config": "proteus.llms",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name == "history_store":
+        return import_module("proteus.storages.history_store")
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(module), name)
+
 
 __all__ = [
     "LLMsConfig",
@@ -0,0 +1,169 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+from proteus.utils.logger import logger
+
+# replies to user_input in the session, e.g. `lambda sid, text: get_teller(sid).asay(text)`
+Say = Callable[[str, str], Awaitable[str]]
+
+
+class SessionAborted(Exception):
+    """An earlier input of the session failed, so this one was not sent. The cause is that failure."""
+
+
+class BatchResult:
+    __slots__ = ("error", "index", "reply", "session_id", "user_input")
+
+    # position of the input in the batch
+    index: int
+    session_id: str
+    user_input: str
+    # exactly one of reply and error is set
+    reply: Optional[str]
+    error: Optional[BaseException]
+
+    def __init__(
+        self,
+        index: int,
+        session_id: str,
+        user_input: str,
+        reply: Optional[str] = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        self.index = index
+        self.session_id = session_id
+        self.user_input = user_input
+        self.reply = reply
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class BatchProgress:
+    __slots__ = ("done", "failed", "started_at", "total")
+
+    total: int
+    done: int
+    failed: int
+    started_at: float
+
+    def __init__(self, total: int) -> None:
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+
+async def _run_batch(
+    say: Say,
+    items: Iterable[Tuple[str, str]],
+    concurrency: int,
+    on_progress: Optional[Callable[[BatchProgress], None]],
+) -> AsyncIterator[BatchResult]:
+    sessions: OrderedDict[str, List[Tuple[int, str]]] = OrderedDict()
+    total = 0
+    for session_id, user_input in items:
+        sessions.setdefault(session_id, []).append((total, user_input))
+        total += 1
+    progress = BatchProgress(total)
+    pending = list(sessions.items())
+    pending.reverse()
+    results: asyncio.Queue[BatchResult] = asyncio.Queue()
+
+    async def run_session(session_id: str, inputs: List[Tuple[int, str]]) -> None:
+        failure: Optional[BaseException] = None
+        for index, user_input in inputs:
+            result = BatchResult(index, session_id, user_input)
+            if failure is not None:
+                result.error = SessionAborted(session_id)
+                result.error.__cause__ = failure
+            else:
+                try:
+                    result.reply = await say(session_id, user_input)
+                except Exception as e:
+                    logger.warning(
+                        "Batch input %d of %s failed: %r", index, session_id, e
+                    )
+                    result.error = failure = e
+            results.put_nowait(result)
+
+    async def worker() -> None:
+        while pending:
+            await run_session(*pending.pop())
+
+    workers = len(sessions) if concurrency < 0 else min(concurrency, len(sessions))
+    tasks = [asyncio.ensure_future(worker()) for _ in range(workers)]
+    try:
+        for _ in range(total):
+            result = await results.get()
+            progress.done += 1
+            progress.failed += not result.ok
+            if on_progress is not None:
+                on_progress(progress)
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def run_batch(
+    say: Say,
+    items: Iterable[Tuple[str, str]],
+    concurrency: int = 16,
+    on_progress: Optional[Callable[[BatchProgress], None]] = None,
+) -> AsyncIterator[BatchResult]:
+    """
+    Run many (session id, input) pairs and yield their results as they complete.
+
+    say: sends one input, normally through an async method such as ProteusTeller.asay
+    concurrency: sessions in flight at the same time. -1 means all of them.
+    on_progress: called after each result
+
+    Inputs of one session are sent one after another in the order given, as each
+    turn builds on the history of the previous one. If one fails, the rest of
+    the session fails with SessionAborted. Different sessions run concurrently.
+    Closing the iterator early cancels the inputs in flight.
+    """
+    if concurrency == 0 or concurrency < -1:
+        raise ValueError(f"concurrency must be positive or -1, got {concurrency}")
+    return _run_batch(say, items, concurrency, on_progress)
+
+
+async def collect_batch(
+    say: Say,
+    items: Iterable[Tuple[str, str]],
+    concurrency: int = 16,
+    on_progress: Optional[Callable[[BatchProgress], None]] = None,
+) -> List[BatchResult]:
+    """Like run_batch, returning all results in the order of items."""
+    results: Dict[int, BatchResult] = {}
+    async for result in run_batch(say, items, concurrency, on_progress):
+        results[result.index] = result
+    return [results[i] for i in range(len(results))]
+
+
+__all__ = [
+    "BatchProgress",
+    "BatchResult",
+    "SessionAborted",
+    "collect_batch",
+    "run_batch",
+]
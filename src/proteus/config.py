@@ -1,13 +1,14 @@
 from pathlib import Path
-from typing import Any, Dict, Literal, Optional
+from typing import Any, Dict, List, Literal, Optional
 
 from msgspec import field
-from xdg import XDG_CACHE_HOME
 
 from proteus.spec import ProteusMessagePrompt
 from proteus.utils.spec import StructSpec
 
-LLMsName = Literal["openai", "llama_cpp", "testback", "gemini", "dashscope"]
+LLMsName = Literal[
+    "openai", "llama_cpp", "testback", "gemini", "dashscope", "simulated"
+]
 
 
 class LLMsConfig(StructSpec, kw_only=True, frozen=True):
@@ -16,16 +17,28 @@ class LLMsConfig(StructSpec, kw_only=True, frozen=True):
         generation_config: Dict[str, Any] = field(default_factory=dict)
 
     class TestBackConfig(StructSpec, kw_only=True, frozen=True):
+        """
+        max_batch_size: concurrent requests generated together in one padded batch. 1 disables batching.
+        max_batch_wait_ms: how long a request waits for others to join its batch
+        """
+
         model: str
         completion_extra: Dict[str, Any] = field(default_factory=dict)
+        max_batch_size: int = 1
+        max_batch_wait_ms: float = 10
 
     class OpenAIConfig(StructSpec, kw_only=True, frozen=True):
         model: str = "gpt-3.5-turbo"
 
     class LlamaCppConfig(StructSpec, kw_only=True, frozen=True):
+        """
+        state_cache_capacity_bytes: memory for evaluated KV states reused by prompts sharing a prefix. 0 disables it.
+        """
+
         model_path: str
         model_extra: Dict[str, Any] = field(default_factory=dict)
         completion_extra: Dict[str, Any] = field(default_factory=dict)
+        state_cache_capacity_bytes: int = 0
 
     class DashScopeConfig(StructSpec, kw_only=True, frozen=True):
         model: str = "qwen-turbo"
@@ -44,6 +57,85 @@ class LLMsConfig(StructSpec, kw_only=True, frozen=True):
         temperature: float = 0.75
         top_p: float = 0.8
 
+    class SimulatedConfig(StructSpec, kw_only=True, frozen=True):
+        """
+        Offline backend for benchmarks and tests, which replies after a simulated latency.
+
+        latency_ms: median time to the first token
+        latency_sigma: spread of the log-normal time to the first token. 0 makes it constant.
+        tokens_per_second: generation rate after the first token. -1 means instant.
+        reply_tokens: words in each reply
+        seed: seed of the latency samples. None means a random seed.
+        """
+
+        latency_ms: float = 100
+        latency_sigma: float = 0.5
+        tokens_per_second: float = 50
+        reply_tokens: int = 32
+        seed: Optional[int] = None
+
+    class ExecutorConfig(StructSpec, kw_only=True, frozen=True):
+        """
+        Run a blocking local backend in a worker pool.
+
+        kind: "thread" shares one model between threads, "process" loads a model in each worker process and cannot stream
+        max_workers: requests running at the same time
+        max_pending: requests admitted to wait for a worker. -1 means unlimited.
+        """
+
+        kind: Literal["thread", "process"] = "thread"
+        max_workers: int = 1
+        max_pending: int = -1
+
+    class CacheConfig(StructSpec, kw_only=True, frozen=True):
+        """
+        Cache replies keyed on the messages and the backend config.
+
+        capacity: replies kept in memory. -1 means unlimited.
+        ttl: seconds a reply stays valid. -1 means forever.
+        cache_folder: if set, replies are also kept there and survive restarts
+        force: cache even if the backend config does not ask for greedy decoding, i.e. a temperature of 0, do_sample false or top_k 1. Providers sample by default.
+        """
+
+        capacity: int = 1024
+        ttl: float = -1
+        cache_folder: Optional[str] = None
+        force: bool = False
+
+    class GovernorConfig(StructSpec, kw_only=True, frozen=True):
+        """
+        Keep the requests to a backend under the limits of its provider.
+
+        requests_per_minute: -1 means unlimited
+        tokens_per_minute: limit on estimated prompt and completion tokens. -1 means unlimited.
+        max_concurrency: requests in flight at the same time. -1 means unlimited.
+        max_retries: retries of a request rejected with 429 or 503, after the retry-after of the provider
+        expected_completion_tokens: tokens a reply is expected to take
+        """
+
+        requests_per_minute: float = -1
+        tokens_per_minute: float = -1
+        max_concurrency: int = -1
+        max_retries: int = 3
+        expected_completion_tokens: int = 256
+
+    class RouterConfig(StructSpec, kw_only=True, frozen=True):
+        """
+        Route requests between several of the configured backends.
+
+        backends: names of the backends, in order of preference
+        timeout: seconds before an async request fails over to the next backend. -1 means no timeout.
+        failure_threshold: consecutive failures after which a backend gets no requests
+        recovery_time: seconds after which a failing backend gets a trial request
+        hedge: whether a slow async request is also sent to the next backend after the p95 latency of the first
+        """
+
+        backends: List[LLMsName]
+        timeout: float = -1
+        failure_threshold: int = 3
+        recovery_time: float = 30
+        hedge: bool = False
+
     openai: Optional[OpenAIConfig] = None
     llama_cpp: Optional[LlamaCppConfig] = None
     testback: Optional[TestBackConfig] = None
@@ -51,6 +143,13 @@ class LLMsConfig(StructSpec, kw_only=True, frozen=True):
     dashscope: Optional[DashScopeConfig] = None
     mixtral_ins: Optional[ReplicateMixtralInsConfig] = None
     qwen14: Optional[ReplicateQwen14Config] = None
+    simulated: Optional[SimulatedConfig] = None
+    executor: Optional[ExecutorConfig] = None
+    governor: Optional[GovernorConfig] = None
+    # share one backend request between concurrent identical requests
+    coalesce: bool = False
+    cache: Optional[CacheConfig] = None
+    router: Optional[RouterConfig] = None
 
     @classmethod
     def from_path(cls, path: Path) -> "LLMsConfig":
@@ -70,20 +169,33 @@ class PromptsConfig(StructSpec, kw_only=True, frozen=True):
         return cls(prompts=prompts)
 
 
+def _default_cache_folder() -> str:
+    # xdg is only needed when no cache folder is configured
+    from xdg import XDG_CACHE_HOME  # noqa: PLC0415
+
+    return str(XDG_CACHE_HOME / "proteus")
+
+
 class ManagerConfig(StructSpec, kw_only=True, frozen=True):
     """
     live_history_size: size of live history (context window size)
+    live_history_token_budget: token limit of the whole prompt, history is filled newest-first up to it. -1 means only live_history_size applies.
     cache_folder: cache folder
     cache_history_enabled: whether to cache all history of all talkers
     cache_talkers_enabled: whether to cache states of all talkers, which can be used to resume a manager
     cache_talkers_mem_capacity: capacity of talker cache in memory. -1 means unlimited. If exceeded, the least recently used talker will be saved to cache_folder, or discarded if cache_history_enabled is False.
+    cache_backend: how to store the cache. "file" uses one file per session and per talker, "sqlite" uses a single SQLite database in cache_folder.
+    slow_turn_threshold_ms: turns that take longer are logged with their stage timings to slow_turns.jsonl in cache_folder. -1 means no log.
     """
 
     live_history_size: int = 0
-    cache_folder: str = str(XDG_CACHE_HOME / "proteus")
+    live_history_token_budget: int = -1
+    cache_folder: str = field(default_factory=_default_cache_folder)
     cache_history_enabled: bool = False
     cache_talkers_enabled: bool = False
     cache_talkers_mem_capacity: int = -1
+    cache_backend: Literal["file", "sqlite"] = "file"
+    slow_turn_threshold_ms: float = -1
 
     @classmethod
     def from_path(cls, path: Path) -> "ManagerConfig":
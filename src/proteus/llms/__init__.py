@@ -1,10 +1,26 @@
+from pathlib import Path
 from typing import Callable, Dict, Optional
 
+import msgspec
+
 from proteus.config import LLMsConfig, LLMsName
 from proteus.llms.base import BaseLLM
 
 
 def llm_from_config(config: LLMsConfig, name: Optional[LLMsName] = None) -> BaseLLM:
+    router = config.router
+    if name is None and router is not None:
+        from proteus.llms.router import RouterLLM
+
+        backend_config = msgspec.structs.replace(config, router=None)
+        return RouterLLM(
+            {n: llm_from_config(backend_config, n) for n in router.backends},
+            timeout=router.timeout,
+            failure_threshold=router.failure_threshold,
+            recovery_time=router.recovery_time,
+            hedge=router.hedge,
+        )
+
     def import_openai():
         from proteus.llms.openai import OpenAILLM
 
@@ -40,6 +56,11 @@ def llm_from_config(config: LLMsConfig, name: Optional[LLMsName] = None) -> Base
 
         return ReplicateQwen14LLM
 
+    def import_simulated():
+        from proteus.llms.simulated import SimulatedLLM
+
+        return SimulatedLLM
+
     _llm_name_map: Dict[str, Callable[[], BaseLLM]] = {
         "openai": import_openai,
         "llama_cpp": import_llama_cpp,
@@ -48,15 +69,66 @@ def llm_from_config(config: LLMsConfig, name: Optional[LLMsName] = None) -> Base
         "dashscope": import_dashscope,
         "mixtral_ins": import_mixtral_ins,
         "qwen14": import_qwen14,
+        "simulated": import_simulated,
     }
 
-    if name is not None:
-        return _llm_name_map[name]()(getattr(config, name))
-
-    for k, v in _llm_name_map.items():
-        if getattr(config, k) is not None:
-            return v()(getattr(config, k))
-    raise ValueError("No LLMs config provided")
+    if name is None:
+        for k in _llm_name_map:
+            if getattr(config, k) is not None:
+                name = k
+                break
+        else:
+            raise ValueError("No LLMs config provided")
+
+    executor = config.executor
+    llm: BaseLLM
+    if executor is not None and executor.kind == "process":
+        from proteus.llms.pool import ProcessPoolLLM
+
+        llm = ProcessPoolLLM(
+            msgspec.structs.replace(
+                config, executor=None, governor=None, coalesce=False, cache=None
+            ),
+            name,
+            executor.max_workers,
+            executor.max_pending,
+        )
+    else:
+        llm = _llm_name_map[name]()(getattr(config, name))
+        if executor is not None:
+            from proteus.llms.pool import ThreadPoolLLM
+
+            llm = ThreadPoolLLM(llm, executor.max_workers, executor.max_pending)
+    governor = config.governor
+    if governor is not None:
+        from proteus.llms.governor import GovernedLLM
+
+        llm = GovernedLLM(
+            llm,
+            governor.requests_per_minute,
+            governor.tokens_per_minute,
+            governor.max_concurrency,
+            governor.max_retries,
+            expected_completion_tokens=governor.expected_completion_tokens,
+        )
+    if config.coalesce:
+        from proteus.llms.coalesce import CoalescingLLM
+
+        llm = CoalescingLLM(llm, getattr(config, name))
+    # cache hits do not count against the limits of the provider
+    cache = config.cache
+    if cache is not None:
+        from proteus.llms.cache import CachedLLM
+
+        llm = CachedLLM(
+            llm,
+            getattr(config, name),
+            cache.capacity,
+            cache.ttl,
+            Path(cache.cache_folder) if cache.cache_folder is not None else None,
+            cache.force,
+        )
+    return llm
 
 
 __all__ = ["llm_from_config", "BaseLLM"]
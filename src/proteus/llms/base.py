@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import List
+from concurrent.futures import Executor
+from threading import Event
+from typing import AsyncIterator, Iterator, List, Optional, Union
 
 from proteus.config import LLMsConfig
 from proteus.spec import ProteusLLMResponse, ProteusMessage
@@ -20,3 +22,52 @@ class BaseLLM(ABC):
     @abstractmethod
     def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
         ...
+
+    def stream(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        """Yield the reply in chunks as they are generated. Backends that cannot stream yield it whole."""
+        yield self.request(messages).message.content
+
+    async def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        """Async version of stream."""
+        yield (await self.arequest(messages)).message.content
+
+
+async def iterate_in_thread(
+    iterator: Iterator[str], executor: Optional[Executor] = None
+) -> AsyncIterator[str]:
+    """
+    Consume a blocking iterator in a worker thread and yield its items to the event loop.
+
+    executor: runs the worker thread. Defaults to the default executor of the loop.
+    """
+    # asyncio takes longer to import than the rest of the base package
+    import asyncio  # noqa: PLC0415
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[Union[str, BaseException, None]] = asyncio.Queue()
+    stopped = Event()
+
+    def pump() -> None:
+        try:
+            for item in iterator:
+                if stopped.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            # release what a generator holds, e.g. a lock, in this thread
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    pumping = loop.run_in_executor(executor, pump)
+    try:
+        while (item := await queue.get()) is not None:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+        await pumping
@@ -0,0 +1,97 @@
+from concurrent.futures import Future
+from threading import Condition, Lock, Thread
+from time import monotonic
+from typing import Callable, Generic, List, Tuple, TypeVar
+
+from proteus.utils.logger import logger
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collect concurrent items and process them together in one call.
+
+    process: maps a batch of items to their results, in the same order
+    max_batch_size: a batch is processed as soon as it has this many items
+    max_wait: seconds the first item of a batch waits for more items
+    """
+
+    _process: Callable[[List[T]], List[R]]
+    _max_batch_size: int
+    _max_wait: float
+    _lock: Lock
+    _cond: Condition
+    _queue: List[Tuple[T, Future]]
+    _closed: bool
+    _thread: Thread
+
+    def __init__(
+        self,
+        process: Callable[[List[T]], List[R]],
+        max_batch_size: int = 8,
+        max_wait: float = 0.01,
+    ) -> None:
+        self._process = process
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._lock = Lock()
+        self._cond = Condition(self._lock)
+        self._queue = []
+        self._closed = False
+        self._thread = Thread(target=self._run, name="proteus-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: T) -> "Future[R]":
+        future: Future[R] = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._queue.append((item, future))
+            self._cond.notify()
+        return future
+
+    def _next_batch(self) -> List[Tuple[T, Future]]:
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            deadline = monotonic() + self._max_wait
+            while (
+                not self._closed
+                and len(self._queue) < self._max_batch_size
+                and (remaining := deadline - monotonic()) > 0
+            ):
+                self._cond.wait(remaining)
+            batch = self._queue[: self._max_batch_size]
+            del self._queue[: self._max_batch_size]
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            batch = [(item, f) for item, f in batch if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self._process([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise ValueError(
+                        f"Got {len(results)} results for a batch of {len(batch)}"
+                    )
+            except Exception as e:
+                logger.exception("Failed to process a batch of %d", len(batch))
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results, strict=True):
+                future.set_result(result)
+
+    def close(self) -> None:
+        """Process what is queued, then stop."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
@@ -0,0 +1,270 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import msgspec
+
+from proteus.llms.base import BaseLLM
+from proteus.spec import ProteusLLMResponse, ProteusMessage, StructSpec
+from proteus.utils.logger import logger
+
+# dicts in configs are encoded in key order, so equal configs give equal keys
+_key_encoder = msgspec.msgpack.Encoder(order="deterministic")
+
+
+def request_key(config: StructSpec, messages: List[ProteusMessage]) -> str:
+    """Stable digest of a request to the backend described by config."""
+    encoded = _key_encoder.encode([type(config).__qualname__, config, messages])
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def _dicts(value: Any) -> Iterator[Dict[str, Any]]:
+    if isinstance(value, dict):
+        yield value
+        for v in value.values():
+            yield from _dicts(v)
+
+
+def is_deterministic(config: StructSpec) -> bool:
+    """
+    Whether a config explicitly asks for greedy decoding, so the same prompt gets the same reply.
+
+    That is a temperature of 0, do_sample false or top_k 1, and nothing that
+    asks for sampling. Providers sample by default, so a config that leaves
+    the temperature unset is not deterministic.
+    """
+    greedy = False
+    for value in _dicts(config.to_dict()):
+        temperature = value.get("temperature")
+        if isinstance(temperature, (int, float)):
+            if temperature > 0:
+                return False
+            greedy = True
+        do_sample = value.get("do_sample")
+        if do_sample is True:
+            return False
+        if do_sample is False or value.get("top_k") == 1:
+            greedy = True
+    return greedy
+
+
+class _CachedResponse(StructSpec, kw_only=True, frozen=True):
+    # wall-clock time after which the response is stale, -1 means never
+    expires_at: float
+    response: ProteusLLMResponse
+
+
+class CachedLLM(BaseLLM):
+    """
+    Cache replies of a backend, keyed on the messages and the backend config.
+
+    llm: the backend
+    config: the backend config, part of the key. Defaults to `llm.config`.
+    capacity: number of replies kept in memory. -1 means unlimited.
+    ttl: seconds a reply stays valid. -1 means forever.
+    cache_folder: if set, replies are also kept there, one file per key, and survive restarts
+    force: cache even if the config does not ask for greedy decoding (see is_deterministic), where a repeated prompt would otherwise get a new reply
+    """
+
+    hits: int
+    misses: int
+    _llm: BaseLLM
+    _config: StructSpec
+    _capacity: int
+    _ttl: float
+    _cache_folder: Optional[Path]
+    _enabled: bool
+    _cache: OrderedDict[str, _CachedResponse]
+    _cache_lock: Lock
+
+    def __init__(
+        self,
+        llm: BaseLLM,
+        config: Optional[StructSpec] = None,
+        capacity: int = 1024,
+        ttl: float = -1,
+        cache_folder: Optional[Path] = None,
+        force: bool = False,
+    ) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._llm = llm
+        self._config = config if config is not None else llm.config
+        self._capacity = capacity
+        self._ttl = ttl
+        self._cache_folder = cache_folder
+        self._enabled = force or is_deterministic(self._config)
+        if not self._enabled:
+            logger.info(
+                "Not caching replies of %s, its config may sample",
+                type(self._config).__qualname__,
+            )
+        self._cache = OrderedDict()
+        self._cache_lock = Lock()
+        if cache_folder is not None:
+            cache_folder.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        assert self._cache_folder is not None
+        return self._cache_folder / f"{key}.json"
+
+    def _remember(self, key: str, cached: _CachedResponse) -> None:
+        with self._cache_lock:
+            self._cache[key] = cached
+            self._cache.move_to_end(key)
+            while 0 <= self._capacity < len(self._cache):
+                self._cache.popitem(last=False)
+
+    def _lookup_memory(self, key: str) -> Optional[ProteusLLMResponse]:
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is None:
+                return None
+            if 0 <= cached.expires_at < time.time():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached.response
+
+    def _lookup_disk(self, key: str) -> Optional[ProteusLLMResponse]:
+        # counts the miss, so only called once the memory tier missed
+        if self._cache_folder is not None:
+            path = self._path(key)
+            try:
+                cached = _CachedResponse.from_json(path.read_bytes())
+            except FileNotFoundError:
+                cached = None
+            except msgspec.DecodeError:
+                logger.warning("Ignoring the corrupted cached reply %s", path)
+                cached = None
+            if cached is not None:
+                if 0 <= cached.expires_at < time.time():
+                    path.unlink(missing_ok=True)
+                else:
+                    self._remember(key, cached)
+                    with self._cache_lock:
+                        self.hits += 1
+                    return cached.response
+        with self._cache_lock:
+            self.misses += 1
+        return None
+
+    def _lookup(self, key: str) -> Optional[ProteusLLMResponse]:
+        response = self._lookup_memory(key)
+        return response if response is not None else self._lookup_disk(key)
+
+    async def _alookup(self, key: str) -> Optional[ProteusLLMResponse]:
+        response = self._lookup_memory(key)
+        if response is not None:
+            return response
+        if self._cache_folder is None:
+            return self._lookup_disk(key)
+        # only awaited inside a running loop, so asyncio is already loaded
+        import asyncio  # noqa: PLC0415
+
+        return await asyncio.to_thread(self._lookup_disk, key)
+
+    def _remember_response(
+        self, key: str, response: ProteusLLMResponse
+    ) -> _CachedResponse:
+        cached = _CachedResponse(
+            expires_at=time.time() + self._ttl if self._ttl >= 0 else -1,
+            response=response,
+        )
+        self._remember(key, cached)
+        return cached
+
+    def _write(self, key: str, cached: _CachedResponse) -> None:
+        assert self._cache_folder is not None
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(cached.to_json())
+        os.replace(tmp_path, path)
+
+    def _store(self, key: str, response: ProteusLLMResponse) -> None:
+        cached = self._remember_response(key, response)
+        if self._cache_folder is not None:
+            self._write(key, cached)
+
+    async def _astore(self, key: str, response: ProteusLLMResponse) -> None:
+        cached = self._remember_response(key, response)
+        if self._cache_folder is not None:
+            import asyncio  # noqa: PLC0415
+
+            await asyncio.to_thread(self._write, key, cached)
+
+    def _key(self, messages: List[ProteusMessage]) -> Optional[str]:
+        return request_key(self._config, messages) if self._enabled else None
+
+    async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        key = self._key(messages)
+        if key is None:
+            return await self._llm.arequest(messages)
+        response = await self._alookup(key)
+        if response is None:
+            response = await self._llm.arequest(messages)
+            await self._astore(key, response)
+        return response
+
+    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        key = self._key(messages)
+        if key is None:
+            return self._llm.request(messages)
+        response = self._lookup(key)
+        if response is None:
+            response = self._llm.request(messages)
+            self._store(key, response)
+        return response
+
+    def _joined(self, chunks: List[str]) -> ProteusLLMResponse:
+        return ProteusLLMResponse(
+            message=ProteusMessage(role="assistant", content="".join(chunks))
+        )
+
+    def stream(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        key = self._key(messages)
+        if key is None:
+            yield from self._llm.stream(messages)
+            return
+        response = self._lookup(key)
+        if response is not None:
+            yield response.message.content
+            return
+        chunks = []
+        for chunk in self._llm.stream(messages):
+            chunks.append(chunk)
+            yield chunk
+        self._store(key, self._joined(chunks))
+
+    async def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        key = self._key(messages)
+        response = await self._alookup(key) if key is not None else None
+        if response is not None:
+            yield response.message.content
+            return
+        chunks = []
+        async for chunk in self._llm.astream(messages):
+            chunks.append(chunk)
+            yield chunk
+        if key is not None:
+            await self._astore(key, self._joined(chunks))
+
+    def clear(self) -> None:
+        """Drop all cached replies, in memory and on disk."""
+        with self._cache_lock:
+            self._cache.clear()
+        if self._cache_folder is not None:
+            for path in self._cache_folder.glob("*.json"):
+                path.unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cache_lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._cache)}
+
+
+__all__ = ["CachedLLM", "is_deterministic", "request_key"]
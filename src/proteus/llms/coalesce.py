@@ -0,0 +1,88 @@
+import asyncio
+from concurrent.futures import Future
+from threading import Lock
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from proteus.llms.base import BaseLLM
+from proteus.llms.cache import request_key
+from proteus.spec import ProteusLLMResponse, ProteusMessage, StructSpec
+
+
+class CoalescingLLM(BaseLLM):
+    """
+    Share one backend request between concurrent identical requests.
+
+    llm: the backend
+    config: the backend config, part of the key together with the messages. Defaults to `llm.config`.
+
+    Callers that arrive while an identical request is in flight get its
+    response, or its error, instead of sending their own. Even with a sampling
+    config they all get the same reply. Cancelling one async caller does not
+    cancel the shared request. Streams are not shared.
+    """
+
+    coalesced: int
+    _llm: BaseLLM
+    _config: StructSpec
+    _lock: Lock
+    _inflight: Dict[str, "Future[ProteusLLMResponse]"]
+    _ainflight: Dict[Tuple[int, str], "asyncio.Task[ProteusLLMResponse]"]
+
+    def __init__(self, llm: BaseLLM, config: Optional[StructSpec] = None) -> None:
+        self.coalesced = 0
+        self._llm = llm
+        self._config = config if config is not None else llm.config
+        self._lock = Lock()
+        self._inflight = {}
+        self._ainflight = {}
+
+    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        key = request_key(self._config, messages)
+        with self._lock:
+            shared = self._inflight.get(key)
+            if shared is None:
+                future: Future[ProteusLLMResponse] = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+        if shared is not None:
+            return shared.result()
+        try:
+            response = self._llm.request(messages)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(response)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+        return response
+
+    async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        # tasks belong to a loop, so requests are only shared within one loop
+        key = (id(asyncio.get_running_loop()), request_key(self._config, messages))
+        with self._lock:
+            task = self._ainflight.get(key)
+            if task is not None:
+                self.coalesced += 1
+            else:
+                task = self._ainflight[key] = asyncio.ensure_future(
+                    self._llm.arequest(messages)
+                )
+                task.add_done_callback(lambda _: self._forget(key))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Tuple[int, str]) -> None:
+        with self._lock:
+            del self._ainflight[key]
+
+    def stream(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        yield from self._llm.stream(messages)
+
+    async def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        async for chunk in self._llm.astream(messages):
+            yield chunk
+
+
+__all__ = ["CoalescingLLM"]
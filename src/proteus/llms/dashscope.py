@@ -1,13 +1,23 @@
 import os
-from typing import List
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
 
 import httpx
+import msgspec
 
 from proteus.config import LLMsConfig
 from proteus.llms.base import BaseLLM
 from proteus.spec import ProteusLLMResponse, ProteusMessage, StructSpec
 
 
+class DashScopeRequest(StructSpec, kw_only=True, frozen=True):
+    class Input(StructSpec, kw_only=True, frozen=True):
+        messages: List[ProteusMessage]
+
+    model: str
+    input: Input
+    parameters: Dict[str, Any]
+
+
 class DashScopeResponse(StructSpec):
     class Output(StructSpec):
         class Choice(StructSpec):
@@ -20,8 +30,30 @@ class DashScopeResponse(StructSpec):
         input_tokens: int
 
     output: Output
-    usage: Usage
-    request_id: str
+    usage: Optional[Usage] = None
+    request_id: Optional[str] = None
+
+
+_URL = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
+_encoder = msgspec.json.Encoder()
+_decoder = msgspec.json.Decoder(DashScopeResponse)
+
+
+def _to_response(data: bytes) -> ProteusLLMResponse:
+    completion = _decoder.decode(data)
+    usage = completion.usage
+    return ProteusLLMResponse(
+        message=completion.output.choices[0].message,
+        token_cnt=None if usage is None else usage.input_tokens + usage.output_tokens,
+    )
+
+
+def _sse_content(line: str) -> Optional[str]:
+    """Content of a server-sent event line of an incremental output, if any."""
+    if not line.startswith("data:"):
+        return None
+    completion = _decoder.decode(line[len("data:") :].strip())
+    return completion.output.choices[0].message.content or None
 
 
 class DashScopeLLM(BaseLLM):
@@ -32,46 +64,75 @@ class DashScopeLLM(BaseLLM):
         self.config = config
         headers = {
             "Authorization": f"Bearer {os.environ['DASHSCOPE_API_KEY']}",
+            "Content-Type": "application/json",
         }
         self._aclient = httpx.AsyncClient(headers=headers, timeout=60)
         self._client = httpx.Client(headers=headers, timeout=60)
 
-    async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
-        response = await self._aclient.post(
-            "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation",
-            json={
-                "model": self.config.model,
-                "input": {"messages": [msg.to_json() for msg in messages]},
-                "parameters": self.config.parameters,
-            },
+    def _body(self, messages: List[ProteusMessage], stream: bool = False) -> bytes:
+        parameters = self.config.parameters
+        if stream:
+            parameters = {
+                **parameters,
+                "incremental_output": True,
+                "result_format": "message",
+            }
+        return _encoder.encode(
+            DashScopeRequest(
+                model=self.config.model,
+                input=DashScopeRequest.Input(messages=messages),
+                parameters=parameters,
+            )
         )
+
+    async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        response = await self._aclient.post(_URL, content=self._body(messages))
         try:
             response.raise_for_status()
         except Exception:
             print(await response.aread())
             raise
-        completion = DashScopeResponse.from_json(await response.aread())
-        return ProteusLLMResponse(
-            message=completion.output.choices[0].message,
-            token_cnt=completion.usage.input_tokens + completion.usage.output_tokens,
-        )
+        return _to_response(await response.aread())
 
     def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
-        response = self._client.post(
-            "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation",
-            json={
-                "model": self.config.model,
-                "input": {"messages": [msg.to_dict() for msg in messages]},
-                "parameters": self.config.parameters,
-            },
-        )
+        response = self._client.post(_URL, content=self._body(messages))
         try:
             response.raise_for_status()
         except Exception:
             print(response.read().decode())
             raise
-        completion = DashScopeResponse.from_json(response.read())
-        return ProteusLLMResponse(
-            message=completion.output.choices[0].message,
-            token_cnt=completion.usage.input_tokens + completion.usage.output_tokens,
-        )
+        return _to_response(response.read())
+
+    def stream(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        with self._client.stream(
+            "POST",
+            _URL,
+            content=self._body(messages, stream=True),
+            headers={"X-DashScope-SSE": "enable"},
+        ) as response:
+            try:
+                response.raise_for_status()
+            except Exception:
+                print(response.read().decode())
+                raise
+            for line in response.iter_lines():
+                content = _sse_content(line)
+                if content is not None:
+                    yield content
+
+    async def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        async with self._aclient.stream(
+            "POST",
+            _URL,
+            content=self._body(messages, stream=True),
+            headers={"X-DashScope-SSE": "enable"},
+        ) as response:
+            try:
+                response.raise_for_status()
+            except Exception:
+                print(await response.aread())
+                raise
+            async for line in response.aiter_lines():
+                content = _sse_content(line)
+                if content is not None:
+                    yield content
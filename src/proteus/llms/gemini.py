@@ -1,4 +1,4 @@
-from typing import List
+from typing import AsyncIterator, Iterator, List
 
 import google.generativeai as genai
 from google.generativeai.types import ContentDict
@@ -73,5 +73,19 @@ class GeminiLLM(BaseLLM):
             # token_cnt=completion.candidates[0].token_count,
         )
 
+    def stream(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        for chunk in self._llm.generate_content(
+            self._adapt_to_gemini(messages),
+            stream=True,
+        ):
+            yield chunk.text
+
+    async def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        async for chunk in await self._llm.generate_content_async(
+            self._adapt_to_gemini(messages),
+            stream=True,
+        ):
+            yield chunk.text
+
 
 __all__ = ["GeminiLLM"]
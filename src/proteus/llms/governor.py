@@ -0,0 +1,277 @@
+import asyncio
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from threading import Event, Lock
+from typing import AsyncIterator, Callable, Deque, Iterator, List, Optional
+
+from proteus.llms.base import BaseLLM
+from proteus.spec import ProteusLLMResponse, ProteusMessage
+from proteus.tokens import TokenCounter
+from proteus.utils.logger import logger
+
+# status codes after which a request is retried
+_RETRY_STATUS = (429, 503)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """
+    Seconds to wait before retrying a request that failed with exc, or None if it should not be retried.
+
+    Errors of httpx and of the OpenAI SDK carry the HTTP response they failed with.
+    """
+    response = getattr(exc, "response", None)
+    if getattr(response, "status_code", None) not in _RETRY_STATUS:
+        return None
+    headers = getattr(response, "headers", {})
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return 0.0
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class _TokenBucket:
+    """
+    Token bucket that hands out reservations, so callers are served in arrival order.
+
+    A reservation may drive the bucket negative, the caller then waits until
+    the refill covers it and later callers queue behind it.
+    """
+
+    _rate: float
+    _capacity: float
+    _tokens: float
+    _updated_at: float
+    _lock: Lock
+
+    def __init__(self, per_minute: float) -> None:
+        self._rate = per_minute / 60
+        self._capacity = per_minute
+        self._tokens = per_minute
+        self._updated_at = time.monotonic()
+        self._lock = Lock()
+
+    def reserve(self, n: float) -> float:
+        """Take n tokens and return the seconds to wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self._capacity, self._tokens + (now - self._updated_at) * self._rate
+            )
+            self._updated_at = now
+            self._tokens -= n
+            return max(-self._tokens / self._rate, 0)
+
+
+class _Waiter:
+    __slots__ = ("granted", "wake")
+
+    granted: bool
+    wake: Callable[[], None]
+
+    def __init__(self, wake: Callable[[], None]) -> None:
+        self.granted = False
+        self.wake = wake
+
+
+class _FairGate:
+    """Concurrency limit whose slots go to sync and async waiters in arrival order."""
+
+    _limit: int
+    _active: int
+    _waiters: Deque[_Waiter]
+    _lock: Lock
+
+    def __init__(self, limit: int) -> None:
+        self._limit = limit
+        self._active = 0
+        self._waiters = deque()
+        self._lock = Lock()
+
+    def _try_acquire(self, wake: Callable[[], None]) -> Optional[_Waiter]:
+        with self._lock:
+            if self._active < self._limit and not self._waiters:
+                self._active += 1
+                return None
+            waiter = _Waiter(wake)
+            self._waiters.append(waiter)
+            return waiter
+
+    def acquire(self) -> None:
+        event = Event()
+        if self._try_acquire(event.set) is not None:
+            event.wait()
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._try_acquire(wake)
+        if waiter is None:
+            return
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            if not self._waiters:
+                self._active -= 1
+                return
+            # hand the slot over, the number of active callers stays the same
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+        waiter.wake()
+
+
+class GovernedLLM(BaseLLM):
+    """
+    Keep the requests to a backend under the limits of its provider.
+
+    llm: the backend
+    requests_per_minute: -1 means unlimited
+    tokens_per_minute: limit on estimated tokens, the prompt tokens counted by counter plus expected_completion_tokens. -1 means unlimited.
+    max_concurrency: requests in flight at the same time. -1 means unlimited.
+    max_retries: retries of a request rejected with 429 or 503. The retry-after of the provider is honored, and pauses every caller of this backend.
+    counter: counts the prompt tokens
+    expected_completion_tokens: tokens a reply is expected to take
+
+    Callers wait for capacity in arrival order, sync callers by blocking and
+    async callers without blocking the event loop.
+    """
+
+    _llm: BaseLLM
+    _requests: Optional[_TokenBucket]
+    _tokens: Optional[_TokenBucket]
+    _gate: Optional[_FairGate]
+    _max_retries: int
+    _counter: TokenCounter
+    _expected_completion_tokens: int
+    _paused_until: float
+
+    def __init__(
+        self,
+        llm: BaseLLM,
+        requests_per_minute: float = -1,
+        tokens_per_minute: float = -1,
+        max_concurrency: int = -1,
+        max_retries: int = 3,
+        counter: Optional[TokenCounter] = None,
+        expected_completion_tokens: int = 256,
+    ) -> None:
+        self._llm = llm
+        self._requests = (
+            _TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        )
+        self._tokens = (
+            _TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        )
+        self._gate = _FairGate(max_concurrency) if max_concurrency > 0 else None
+        self._max_retries = max_retries
+        self._counter = counter if counter is not None else TokenCounter()
+        self._expected_completion_tokens = expected_completion_tokens
+        self._paused_until = 0.0
+
+    def _reserve(self, messages: List[ProteusMessage]) -> float:
+        delay = max(self._paused_until - time.monotonic(), 0)
+        if self._requests is not None:
+            delay = max(delay, self._requests.reserve(1))
+        if self._tokens is not None:
+            estimate = (
+                self._counter.count_all(messages) + self._expected_completion_tokens
+            )
+            delay = max(delay, self._tokens.reserve(estimate))
+        return delay
+
+    def _backoff(self, exc: BaseException, attempt: int) -> Optional[float]:
+        if attempt >= self._max_retries:
+            return None
+        delay = retry_after(exc)
+        if delay is None:
+            return None
+        # without a hint from the provider, back off exponentially
+        delay = delay or 2.0**attempt
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        logger.warning("Rate limited, retrying in %.2fs: %r", delay, exc)
+        return delay
+
+    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        attempt = 0
+        while True:
+            time.sleep(self._reserve(messages))
+            if self._gate is not None:
+                self._gate.acquire()
+            try:
+                return self._llm.request(messages)
+            except Exception as e:
+                if self._backoff(e, attempt) is None:
+                    raise
+            finally:
+                if self._gate is not None:
+                    self._gate.release()
+            attempt += 1
+
+    async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._reserve(messages))
+            if self._gate is not None:
+                await self._gate.aacquire()
+            try:
+                return await self._llm.arequest(messages)
+            except Exception as e:
+                if self._backoff(e, attempt) is None:
+                    raise
+            finally:
+                if self._gate is not None:
+                    self._gate.release()
+            attempt += 1
+
+    def stream(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        """Streams are not retried, as chunks may already have been used."""
+        time.sleep(self._reserve(messages))
+        if self._gate is not None:
+            self._gate.acquire()
+        try:
+            yield from self._llm.stream(messages)
+        finally:
+            if self._gate is not None:
+                self._gate.release()
+
+    async def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        """Streams are not retried, as chunks may already have been used."""
+        await asyncio.sleep(self._reserve(messages))
+        if self._gate is not None:
+            await self._gate.aacquire()
+        try:
+            async for chunk in self._llm.astream(messages):
+                yield chunk
+        finally:
+            if self._gate is not None:
+                self._gate.release()
+
+
+__all__ = ["GovernedLLM", "retry_after"]
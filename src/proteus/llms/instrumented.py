@@ -0,0 +1,112 @@
+import time
+from typing import AsyncIterator, Iterator, List, Optional
+
+from proteus.llms.base import BaseLLM
+from proteus.spec import ProteusLLMResponse, ProteusMessage
+from proteus.utils.metrics import Counter, Histogram, MetricsRegistry, registry
+
+
+class InstrumentedLLM(BaseLLM):
+    """
+    Record the latency, tokens and errors of a backend.
+
+    llm: the backend
+    backend: value of the backend label. Defaults to the class name of llm.
+    metrics: defaults to the shared registry of proteus.utils.metrics
+
+    proteus_llm_request_seconds: latency of request and arequest, and the time to the first chunk of streams
+    proteus_llm_tokens_total: sum of ProteusLLMResponse.token_cnt, where the backend reports it
+    proteus_llm_errors_total: failed requests by exception type
+    """
+
+    _llm: BaseLLM
+    _backend: str
+    _latency: Histogram
+    _tokens: Counter
+    _errors: Counter
+
+    def __init__(
+        self,
+        llm: BaseLLM,
+        backend: Optional[str] = None,
+        metrics: Optional[MetricsRegistry] = None,
+    ) -> None:
+        metrics = metrics if metrics is not None else registry
+        self._llm = llm
+        self._backend = backend if backend is not None else type(llm).__name__
+        self._latency = metrics.histogram(
+            "proteus_llm_request_seconds", "Latency of LLM requests"
+        )
+        self._tokens = metrics.counter(
+            "proteus_llm_tokens_total", "Tokens reported by LLM responses"
+        )
+        self._errors = metrics.counter(
+            "proteus_llm_errors_total", "Failed LLM requests"
+        )
+
+    def _record(self, method: str, start: float, response: ProteusLLMResponse) -> None:
+        self._latency.observe(
+            time.perf_counter() - start, backend=self._backend, method=method
+        )
+        if response.token_cnt is not None:
+            self._tokens.inc(response.token_cnt, backend=self._backend)
+
+    def _record_error(self, method: str, e: BaseException) -> None:
+        self._errors.inc(backend=self._backend, method=method, error=type(e).__name__)
+
+    async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        start = time.perf_counter()
+        try:
+            response = await self._llm.arequest(messages)
+        except Exception as e:
+            self._record_error("arequest", e)
+            raise
+        self._record("arequest", start, response)
+        return response
+
+    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        start = time.perf_counter()
+        try:
+            response = self._llm.request(messages)
+        except Exception as e:
+            self._record_error("request", e)
+            raise
+        self._record("request", start, response)
+        return response
+
+    def stream(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        start = time.perf_counter()
+        first = True
+        try:
+            for chunk in self._llm.stream(messages):
+                if first:
+                    first = False
+                    self._latency.observe(
+                        time.perf_counter() - start,
+                        backend=self._backend,
+                        method="stream",
+                    )
+                yield chunk
+        except Exception as e:
+            self._record_error("stream", e)
+            raise
+
+    async def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        start = time.perf_counter()
+        first = True
+        try:
+            async for chunk in self._llm.astream(messages):
+                if first:
+                    first = False
+                    self._latency.observe(
+                        time.perf_counter() - start,
+                        backend=self._backend,
+                        method="astream",
+                    )
+                yield chunk
+        except Exception as e:
+            self._record_error("astream", e)
+            raise
+
+
+__all__ = ["InstrumentedLLM"]
@@ -1,9 +1,11 @@
-from typing import List
+import asyncio
+from threading import Lock
+from typing import AsyncIterator, Iterator, List
 
-from llama_cpp import Llama
+from llama_cpp import Llama, LlamaRAMCache
 
 from proteus.config import LLMsConfig
-from proteus.llms.base import BaseLLM
+from proteus.llms.base import BaseLLM, iterate_in_thread
 from proteus.spec import ProteusLLMResponse, ProteusMessage
 
 
@@ -17,19 +19,53 @@ class LlamaCppLLM(BaseLLM):
             self.config.model_path,
             **self.config.model_extra,
         )
+        # a Llama has a single context, so completions must not interleave
+        self._lock = Lock()
+        if self.config.state_cache_capacity_bytes > 0:
+            # The state after each completion is kept in an LRU and looked up
+            # by the longest common token prefix, so a new turn of a session,
+            # or any prompt sharing a cached persona prefix, only evaluates
+            # the tokens after that prefix.
+            self._llm.set_cache(
+                LlamaRAMCache(capacity_bytes=self.config.state_cache_capacity_bytes)
+            )
+
+    def preload_prefix(self, messages: List[ProteusMessage]) -> None:
+        """Evaluate a static prompt prefix, e.g. identity + instruct + examples, and keep its state in the cache."""
+        with self._lock:
+            self._llm.create_chat_completion(
+                [m.to_dict() for m in messages],
+                **{**self.config.completion_extra, "max_tokens": 1},
+            )
 
     async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
-        return self.request(messages)
+        return await asyncio.to_thread(self.request, messages)
 
     def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
-        completion = self._llm.create_chat_completion(
-            [m.to_dict() for m in messages],
-            **self.config.completion_extra,
-        )
+        with self._lock:
+            completion = self._llm.create_chat_completion(
+                [m.to_dict() for m in messages],
+                **self.config.completion_extra,
+            )
         return ProteusLLMResponse(
             message=ProteusMessage.from_any(completion["choices"][0]["message"]),
             token_cnt=completion["usage"]["completion_tokens"],
         )
 
+    def stream(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        with self._lock:
+            for chunk in self._llm.create_chat_completion(
+                [m.to_dict() for m in messages],
+                stream=True,
+                **self.config.completion_extra,
+            ):
+                content = chunk["choices"][0]["delta"].get("content")
+                if content:
+                    yield content
+
+    async def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        async for content in iterate_in_thread(self.stream(messages)):
+            yield content
+
 
 __all__ = ["LlamaCppLLM"]
@@ -1,11 +1,36 @@
-from typing import List, cast
+from typing import AsyncIterator, Iterator, List, Optional, cast
 
+import msgspec
 import openai
-from openai.types.chat import ChatCompletion, ChatCompletionMessageParam
+from openai.types.chat import ChatCompletionChunk, ChatCompletionMessageParam
 
 from proteus.config import LLMsConfig
 from proteus.llms.base import BaseLLM
-from proteus.spec import ProteusLLMResponse, ProteusMessage
+from proteus.spec import ProteusLLMResponse, ProteusMessage, StructSpec
+
+
+class OpenAIResponse(StructSpec):
+    class Choice(StructSpec):
+        message: ProteusMessage
+
+    class Usage(StructSpec):
+        completion_tokens: int
+
+    choices: List[Choice]
+    usage: Optional[Usage] = None
+
+
+_decoder = msgspec.json.Decoder(OpenAIResponse)
+
+
+def _to_response(data: bytes) -> ProteusLLMResponse:
+    completion = _decoder.decode(data)
+    return ProteusLLMResponse(
+        message=completion.choices[0].message,
+        token_cnt=None
+        if completion.usage is None
+        else completion.usage.completion_tokens,
+    )
 
 
 class OpenAILLM(BaseLLM):
@@ -17,34 +42,50 @@ class OpenAILLM(BaseLLM):
         self._allm = openai.AsyncOpenAI().chat.completions
         self._llm = openai.OpenAI().chat.completions
 
+    def _messages(
+        self, messages: List[ProteusMessage]
+    ) -> List[ChatCompletionMessageParam]:
+        return cast(List[ChatCompletionMessageParam], msgspec.to_builtins(messages))
+
     async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
-        completion: ChatCompletion = await self._allm.create(
-            messages=cast(
-                List[ChatCompletionMessageParam], [m.to_dict() for m in messages]
-            ),
+        # the raw response skips building the pydantic models of the SDK
+        raw = await self._allm.with_raw_response.create(
+            messages=self._messages(messages),
             **self.config.to_dict(),
         )
-        if not isinstance(completion, ChatCompletion):
-            raise TypeError("OpenAI returned an unexpected type")
-        return ProteusLLMResponse(
-            message=ProteusMessage.from_any(completion.choices[0].message),
-            token_cnt=None
-            if completion.usage is None
-            else completion.usage.completion_tokens,
-        )
+        return _to_response(raw.content)
 
     def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
-        completion: ChatCompletion = self._llm.create(
-            messages=cast(
-                List[ChatCompletionMessageParam], [m.to_dict() for m in messages]
-            ),
+        raw = self._llm.with_raw_response.create(
+            messages=self._messages(messages),
+            **self.config.to_dict(),
+        )
+        return _to_response(raw.content)
+
+    def stream(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        chunks = self._llm.create(
+            messages=self._messages(messages),
+            stream=True,
             **self.config.to_dict(),
         )
-        if not isinstance(completion, ChatCompletion):
-            raise TypeError("OpenAI returned an unexpected type")
-        return ProteusLLMResponse(
-            message=ProteusMessage.from_any(completion.choices[0].message),
-            token_cnt=None
-            if completion.usage is None
-            else completion.usage.completion_tokens,
+        for chunk in chunks:
+            content = _chunk_content(chunk)
+            if content:
+                yield content
+
+    async def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        chunks = await self._allm.create(
+            messages=self._messages(messages),
+            stream=True,
+            **self.config.to_dict(),
         )
+        async for chunk in chunks:
+            content = _chunk_content(chunk)
+            if content:
+                yield content
+
+
+def _chunk_content(chunk: ChatCompletionChunk) -> Optional[str]:
+    if not chunk.choices:
+        return None
+    return chunk.choices[0].delta.content
@@ -0,0 +1,162 @@
+import asyncio
+import multiprocessing
+import queue
+from abc import abstractmethod
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import AbstractAsyncContextManager, nullcontext
+from threading import Event
+from typing import AsyncIterator, Iterator, List, Optional, Union
+
+from proteus.config import LLMsConfig, LLMsName
+from proteus.llms import llm_from_config
+from proteus.llms.base import BaseLLM, iterate_in_thread
+from proteus.spec import ProteusLLMResponse, ProteusMessage
+
+_worker_llm: Optional[BaseLLM] = None
+
+
+def _init_worker(config: bytes, name: LLMsName) -> None:
+    global _worker_llm  # noqa: PLW0603
+    _worker_llm = llm_from_config(LLMsConfig.from_json(config), name)
+
+
+def _worker_request(messages: List[ProteusMessage]) -> ProteusLLMResponse:
+    if _worker_llm is None:
+        raise RuntimeError("LLM worker is not initialized")
+    return _worker_llm.request(messages)
+
+
+class _PoolLLM(BaseLLM):
+    """
+    Run blocking requests in an executor so that arequest never blocks the event loop.
+
+    max_workers: requests running at the same time
+    max_pending: requests admitted to wait for a worker. -1 means unlimited. Further arequest callers wait for a slot.
+    """
+
+    _executor: Executor
+    _max_admitted: int
+    _admitted: Optional[asyncio.Semaphore]
+
+    def __init__(self, executor: Executor, max_workers: int, max_pending: int) -> None:
+        self._executor = executor
+        self._max_admitted = max_workers + max_pending if max_pending >= 0 else -1
+        self._admitted = None
+
+    @abstractmethod
+    def _submit(self, messages: List[ProteusMessage]) -> Future[ProteusLLMResponse]: ...
+
+    def _admission(self) -> AbstractAsyncContextManager:
+        if self._max_admitted < 0:
+            return nullcontext()
+        if self._admitted is None:
+            self._admitted = asyncio.Semaphore(self._max_admitted)
+        return self._admitted
+
+    async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        async with self._admission():
+            return await asyncio.wrap_future(self._submit(messages))
+
+    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        return self._submit(messages).result()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown()
+
+
+class ThreadPoolLLM(_PoolLLM):
+    """Run a blocking backend in a thread pool. All threads share the wrapped LLM."""
+
+    _llm: BaseLLM
+
+    def __init__(
+        self, llm: BaseLLM, max_workers: int = 1, max_pending: int = -1
+    ) -> None:
+        super().__init__(
+            ThreadPoolExecutor(max_workers, thread_name_prefix="proteus-llm"),
+            max_workers,
+            max_pending,
+        )
+        self._llm = llm
+
+    def _submit(self, messages: List[ProteusMessage]) -> Future[ProteusLLMResponse]:
+        return self._executor.submit(self._llm.request, messages)
+
+    def stream(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        """The stream of the wrapped LLM, consumed by a worker of the pool."""
+        chunks: queue.SimpleQueue[Union[str, BaseException, None]] = queue.SimpleQueue()
+        stopped = Event()
+
+        def pump() -> None:
+            iterator = self._llm.stream(messages)
+            try:
+                for chunk in iterator:
+                    if stopped.is_set():
+                        break
+                    chunks.put(chunk)
+            except BaseException as e:
+                chunks.put(e)
+            finally:
+                # release what the generator holds in the worker
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+                chunks.put(None)
+
+        pumping = self._executor.submit(pump)
+        try:
+            while (chunk := chunks.get()) is not None:
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                yield chunk
+        finally:
+            stopped.set()
+            pumping.result()
+
+    async def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        async with self._admission():
+            async for chunk in iterate_in_thread(
+                self._llm.stream(messages), self._executor
+            ):
+                yield chunk
+
+
+class ProcessPoolLLM(_PoolLLM):
+    """Run a backend in worker processes, each of which loads its own model from the config."""
+
+    def __init__(
+        self,
+        config: LLMsConfig,
+        name: LLMsName,
+        max_workers: int = 1,
+        max_pending: int = -1,
+    ) -> None:
+        super().__init__(
+            ProcessPoolExecutor(
+                max_workers,
+                # forking a process that already holds a model or threads is unsafe
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(config.to_json(), name),
+            ),
+            max_workers,
+            max_pending,
+        )
+
+    def _submit(self, messages: List[ProteusMessage]) -> Future[ProteusLLMResponse]:
+        return self._executor.submit(_worker_request, messages)
+
+    def stream(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        """Not supported, as chunks cannot be sent back from a worker process."""
+        raise NotImplementedError(
+            'ProcessPoolLLM cannot stream, use an executor of kind "thread" to stream'
+        )
+
+    def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        """Not supported, see stream."""
+        raise NotImplementedError(
+            'ProcessPoolLLM cannot stream, use an executor of kind "thread" to stream'
+        )
+
+
+__all__ = ["ProcessPoolLLM", "ThreadPoolLLM"]
@@ -1,9 +1,10 @@
-from typing import List
+import asyncio
+from typing import AsyncIterator, Iterator, List
 
 import replicate
 
 from proteus.config import LLMsConfig
-from proteus.llms.base import BaseLLM
+from proteus.llms.base import BaseLLM, iterate_in_thread
 from proteus.spec import ProteusLLMResponse, ProteusMessage
 
 
@@ -15,9 +16,9 @@ class ReplicateMixtralInsLLM(BaseLLM):
         self.config = config
 
     async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
-        return self.request(messages)
+        return await asyncio.to_thread(self.request, messages)
 
-    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+    def _run(self, messages: List[ProteusMessage]) -> Iterator[str]:
         prompt = ""
         last_role = "assistant"
         for msg in messages:
@@ -31,7 +32,7 @@ class ReplicateMixtralInsLLM(BaseLLM):
             last_role = msg.role
         prompt += "[/INST]\n"
 
-        response = replicate.run(
+        return replicate.run(
             "mistralai/mixtral-8x7b-instruct-v0.1",
             input={
                 **self.config.to_dict(),
@@ -39,9 +40,18 @@ class ReplicateMixtralInsLLM(BaseLLM):
                 "prompt": prompt,
             },
         )
+
+    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
         return ProteusLLMResponse(
             message=ProteusMessage(
                 role="assistant",
-                content="".join(response),
+                content="".join(self._run(messages)),
             )
         )
+
+    def stream(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        yield from self._run(messages)
+
+    async def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        async for content in iterate_in_thread(self.stream(messages)):
+            yield content
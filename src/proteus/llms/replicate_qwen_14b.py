@@ -1,9 +1,10 @@
-from typing import List
+import asyncio
+from typing import AsyncIterator, Iterator, List
 
 import replicate
 
 from proteus.config import LLMsConfig
-from proteus.llms.base import BaseLLM
+from proteus.llms.base import BaseLLM, iterate_in_thread
 from proteus.spec import ProteusLLMResponse, ProteusMessage
 
 
@@ -15,10 +16,10 @@ class ReplicateQwen14LLM(BaseLLM):
         self.config = config
 
     async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
-        return self.request(messages)
+        return await asyncio.to_thread(self.request, messages)
 
-    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
-        response = replicate.run(
+    def _run(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        return replicate.run(
             "nomagick/qwen-14b-chat:f9e1ed25e2073f72ff9a3f46545d909b1078e674da543e791dec79218072ae70",
             input={
                 **self.config.to_dict(),
@@ -31,9 +32,18 @@ class ReplicateQwen14LLM(BaseLLM):
                 + "\n<|im_start|>assistant\n",
             },
         )
+
+    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
         return ProteusLLMResponse(
             message=ProteusMessage(
                 role="assistant",
-                content="".join(response),
+                content="".join(self._run(messages)),
             )
         )
+
+    def stream(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        yield from self._run(messages)
+
+    async def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        async for content in iterate_in_thread(self.stream(messages)):
+            yield content
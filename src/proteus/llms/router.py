@@ -0,0 +1,282 @@
+import asyncio
+import time
+from collections import deque
+from threading import Lock
+from typing import (
+    Any,
+    AsyncIterator,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+)
+
+from proteus.llms.base import BaseLLM
+from proteus.spec import ProteusLLMResponse, ProteusMessage
+from proteus.utils.logger import logger
+
+# latencies kept per backend to estimate its p95
+_LATENCY_WINDOW = 128
+# latencies needed before the p95 is trusted for hedging
+_MIN_HEDGE_SAMPLES = 20
+
+
+class _Backend:
+    __slots__ = (
+        "error_rate",
+        "failures",
+        "latencies",
+        "latency",
+        "llm",
+        "name",
+        "opened_at",
+    )
+
+    name: str
+    llm: BaseLLM
+    # moving averages, latency is None until the first success
+    latency: Optional[float]
+    error_rate: float
+    latencies: Deque[float]
+    # consecutive failures, the circuit is open from failure_threshold on
+    failures: int
+    opened_at: float
+
+    def __init__(self, name: str, llm: BaseLLM) -> None:
+        self.name = name
+        self.llm = llm
+        self.latency = None
+        self.error_rate = 0.0
+        self.latencies = deque(maxlen=_LATENCY_WINDOW)
+        self.failures = 0
+        self.opened_at = 0.0
+
+
+class RouterLLM(BaseLLM):
+    """
+    Route requests between several backends, preferring the fastest healthy one.
+
+    llms: backends by name, in order of preference while nothing is known about them
+    timeout: seconds before an async request fails over to the next backend. -1 means no timeout.
+    ewma_alpha: weight of the latest request in the moving averages of latency and error rate
+    failure_threshold: consecutive failures that open the circuit of a backend, which then gets no requests
+    recovery_time: seconds after which an open circuit lets one trial request through, ahead of the healthy backends
+    hedge: whether an async request is also sent to the next backend once it takes longer than the p95 latency of the first, the first reply wins
+
+    Errors fail over to the next backend, and the last error is raised once
+    every backend has failed. If every circuit is open, all backends are tried.
+    """
+
+    _backends: List[_Backend]
+    _timeout: float
+    _ewma_alpha: float
+    _failure_threshold: int
+    _recovery_time: float
+    _hedge: bool
+    _lock: Lock
+
+    def __init__(
+        self,
+        llms: Dict[str, BaseLLM],
+        timeout: float = -1,
+        ewma_alpha: float = 0.2,
+        failure_threshold: int = 3,
+        recovery_time: float = 30,
+        hedge: bool = False,
+    ) -> None:
+        if not llms:
+            raise ValueError("RouterLLM needs at least one backend")
+        self._backends = [_Backend(name, llm) for name, llm in llms.items()]
+        self._timeout = timeout
+        self._ewma_alpha = ewma_alpha
+        self._failure_threshold = failure_threshold
+        self._recovery_time = recovery_time
+        self._hedge = hedge
+        self._lock = Lock()
+
+    def _score(self, backend: _Backend) -> float:
+        """Expected latency counting retries. Must hold the lock."""
+        if backend.latency is None:
+            # unknown backends are tried first, in order of preference
+            return 0.0
+        return backend.latency / max(1 - backend.error_rate, 0.05)
+
+    def _candidates(self) -> List[_Backend]:
+        now = time.monotonic()
+        with self._lock:
+            candidates = []
+            trials = []
+            for backend in self._backends:
+                if backend.failures < self._failure_threshold:
+                    candidates.append(backend)
+                elif now - backend.opened_at >= self._recovery_time:
+                    # half open, the next trial waits for another recovery_time
+                    backend.opened_at = now
+                    trials.append(backend)
+            if not candidates and not trials:
+                candidates = list(self._backends)
+            # a trial goes first, as its score would rank it behind every
+            # healthy backend and it would never recover. sorted is stable,
+            # so ties keep the order of preference.
+            return trials + sorted(candidates, key=self._score)
+
+    def _record(self, backend: _Backend, latency: Optional[float]) -> None:
+        """Record a success with its latency, or a failure if latency is None."""
+        alpha = self._ewma_alpha
+        with self._lock:
+            failed = latency is None
+            backend.error_rate += alpha * (failed - backend.error_rate)
+            if latency is None:
+                backend.failures += 1
+                if backend.failures == self._failure_threshold:
+                    backend.opened_at = time.monotonic()
+                    logger.warning("Opened the circuit of backend %s", backend.name)
+                return
+            if backend.failures >= self._failure_threshold:
+                logger.info("Closed the circuit of backend %s", backend.name)
+            backend.failures = 0
+            backend.latencies.append(latency)
+            backend.latency = (
+                latency
+                if backend.latency is None
+                else backend.latency + alpha * (latency - backend.latency)
+            )
+
+    def _hedge_delay(self, backend: _Backend) -> Optional[float]:
+        with self._lock:
+            if len(backend.latencies) < _MIN_HEDGE_SAMPLES:
+                return None
+            latencies = sorted(backend.latencies)
+        return latencies[int(0.95 * (len(latencies) - 1))]
+
+    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        error: Optional[Exception] = None
+        for backend in self._candidates():
+            start = time.monotonic()
+            try:
+                response = backend.llm.request(messages)
+            except Exception as e:
+                self._record(backend, None)
+                logger.warning("Backend %s failed: %r", backend.name, e)
+                error = e
+                continue
+            self._record(backend, time.monotonic() - start)
+            return response
+        assert error is not None
+        raise error
+
+    async def _arequest(
+        self, backend: _Backend, messages: List[ProteusMessage]
+    ) -> ProteusLLMResponse:
+        start = time.monotonic()
+        try:
+            if self._timeout >= 0:
+                response = await asyncio.wait_for(
+                    backend.llm.arequest(messages), self._timeout
+                )
+            else:
+                response = await backend.llm.arequest(messages)
+        except Exception as e:
+            # a cancelled hedge is not a failure, CancelledError is not an Exception
+            self._record(backend, None)
+            logger.warning("Backend %s failed: %r", backend.name, e)
+            raise
+        self._record(backend, time.monotonic() - start)
+        return response
+
+    async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        candidates = self._candidates()
+        error: Optional[BaseException] = None
+        i = 0
+        while i < len(candidates):
+            primary = candidates[i]
+            i += 1
+            pending: Set[asyncio.Task[ProteusLLMResponse]] = {
+                asyncio.ensure_future(self._arequest(primary, messages))
+            }
+            try:
+                delay = self._hedge_delay(primary) if self._hedge else None
+                if delay is not None and i < len(candidates):
+                    done, _ = await asyncio.wait(pending, timeout=delay)
+                    if not done:
+                        hedge = candidates[i]
+                        i += 1
+                        pending.add(
+                            asyncio.ensure_future(self._arequest(hedge, messages))
+                        )
+                while pending:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        error = task.exception()
+                        if error is None:
+                            return task.result()
+            finally:
+                for task in pending:
+                    task.cancel()
+        assert error is not None
+        raise error
+
+    def stream(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        """Fail over until a backend yields its first chunk, then stay with it."""
+        error: Optional[Exception] = None
+        for backend in self._candidates():
+            start = time.monotonic()
+            chunks = backend.llm.stream(messages)
+            try:
+                first = next(chunks, None)
+            except Exception as e:
+                self._record(backend, None)
+                logger.warning("Backend %s failed: %r", backend.name, e)
+                error = e
+                continue
+            # the time to the first chunk stands for the latency of a stream
+            self._record(backend, time.monotonic() - start)
+            if first is not None:
+                yield first
+            yield from chunks
+            return
+        assert error is not None
+        raise error
+
+    async def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        """Fail over until a backend yields its first chunk, then stay with it."""
+        error: Optional[Exception] = None
+        for backend in self._candidates():
+            start = time.monotonic()
+            chunks = backend.llm.astream(messages)
+            try:
+                if self._timeout >= 0:
+                    first = await asyncio.wait_for(anext(chunks, None), self._timeout)
+                else:
+                    first = await anext(chunks, None)
+            except Exception as e:
+                self._record(backend, None)
+                logger.warning("Backend %s failed: %r", backend.name, e)
+                error = e
+                continue
+            self._record(backend, time.monotonic() - start)
+            if first is not None:
+                yield first
+            async for chunk in chunks:
+                yield chunk
+            return
+        assert error is not None
+        raise error
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                backend.name: {
+                    "latency": backend.latency,
+                    "error_rate": backend.error_rate,
+                    "open": backend.failures >= self._failure_threshold,
+                }
+                for backend in self._backends
+            }
+
+
+__all__ = ["RouterLLM"]
@@ -0,0 +1,74 @@
+import asyncio
+import random
+import time
+from threading import Lock
+from typing import AsyncIterator, Iterator, List
+
+from proteus.config import LLMsConfig
+from proteus.llms.base import BaseLLM
+from proteus.spec import ProteusLLMResponse, ProteusMessage
+
+_WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit"]
+
+
+class SimulatedLLM(BaseLLM):
+    """Reply with filler words after a latency drawn from the config, without any network or model."""
+
+    def __init__(
+        self,
+        config: LLMsConfig.SimulatedConfig,
+    ) -> None:
+        self.config = config
+        self._random = random.Random(config.seed)
+        self._random_lock = Lock()
+
+    def _first_token_delay(self) -> float:
+        median = self.config.latency_ms / 1000
+        if self.config.latency_sigma <= 0:
+            return median
+        with self._random_lock:
+            return median * self._random.lognormvariate(0, self.config.latency_sigma)
+
+    def _token_delay(self) -> float:
+        if self.config.tokens_per_second < 0:
+            return 0
+        return 1 / self.config.tokens_per_second
+
+    def _words(self) -> List[str]:
+        return [_WORDS[i % len(_WORDS)] + " " for i in range(self.config.reply_tokens)]
+
+    def _response(self) -> ProteusLLMResponse:
+        return ProteusLLMResponse(
+            message=ProteusMessage(role="assistant", content="".join(self._words())),
+            token_cnt=self.config.reply_tokens,
+        )
+
+    def _delay(self) -> float:
+        return self._first_token_delay() + self._token_delay() * max(
+            self.config.reply_tokens - 1, 0
+        )
+
+    async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        await asyncio.sleep(self._delay())
+        return self._response()
+
+    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        time.sleep(self._delay())
+        return self._response()
+
+    def stream(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        delay = self._first_token_delay()
+        for word in self._words():
+            time.sleep(delay)
+            yield word
+            delay = self._token_delay()
+
+    async def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        delay = self._first_token_delay()
+        for word in self._words():
+            await asyncio.sleep(delay)
+            yield word
+            delay = self._token_delay()
+
+
+__all__ = ["SimulatedLLM"]
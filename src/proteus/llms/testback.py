@@ -1,4 +1,5 @@
-from typing import List
+import asyncio
+from typing import List, Optional
 
 import torch
 from transformers import (
@@ -11,31 +12,46 @@ from transformers import (
 
 from proteus.config import LLMsConfig
 from proteus.llms.base import BaseLLM
+from proteus.llms.batching import MicroBatcher
 from proteus.spec import ProteusLLMResponse, ProteusMessage
 
 
 class TestBackLLM(BaseLLM):
+    _batcher: Optional[MicroBatcher[str, str]]
+
     def __init__(
         self,
         config: LLMsConfig.TestBackConfig,
     ) -> None:
         self.config = config
 
-        model: MistralForCausalLM = AutoModelForCausalLM.from_pretrained(
-            self.config.model,
-            return_dict=True,
-            quantization_config=BitsAndBytesConfig(
-                load_in_4bit=True,
-                bnb_4bit_compute_dtype=torch.bfloat16,
-                bnb_4bit_quant_type="nf4",
-            ),
-            torch_dtype=torch.bfloat16,
-            device_map="auto",
-        )
+        if torch.cuda.is_available():
+            model: MistralForCausalLM = AutoModelForCausalLM.from_pretrained(
+                self.config.model,
+                return_dict=True,
+                quantization_config=BitsAndBytesConfig(
+                    load_in_4bit=True,
+                    bnb_4bit_compute_dtype=torch.bfloat16,
+                    bnb_4bit_quant_type="nf4",
+                ),
+                torch_dtype=torch.bfloat16,
+                device_map="auto",
+            )
+        else:
+            # bitsandbytes 4-bit quantization needs CUDA
+            model = AutoModelForCausalLM.from_pretrained(
+                self.config.model,
+                return_dict=True,
+                torch_dtype=torch.float32,
+            )
 
         self.tokenizer = AutoTokenizer.from_pretrained(
             self.config.model, use_fast=False
         )
+        # decoder-only models continue from the right, so pad batches on the left
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
 
         # Define the text generation pipeline
         self.generator = pipeline(
@@ -44,22 +60,49 @@ class TestBackLLM(BaseLLM):
             tokenizer=self.tokenizer,
         )
 
-    async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
-        return self.request(messages)
+        self._batcher = (
+            MicroBatcher(
+                self._generate,
+                max_batch_size=self.config.max_batch_size,
+                max_wait=self.config.max_batch_wait_ms / 1000,
+            )
+            if self.config.max_batch_size > 1
+            else None
+        )
 
-    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
-        prompt = self.tokenizer.apply_chat_template(
-            messages,
+    def _prompt(self, messages: List[ProteusMessage]) -> str:
+        return self.tokenizer.apply_chat_template(
+            [m.to_dict() for m in messages],
             tokenize=False,
             add_generation_prompt=True,
         )
-        output = self.generator(
-            prompt,
+
+    def _generate(self, prompts: List[str]) -> List[str]:
+        outputs = self.generator(
+            prompts,
+            batch_size=len(prompts),
             num_return_sequences=1,
             return_full_text=False,
             **self.config.completion_extra,
-        )[0]["generated_text"]
+        )
+        return [str(output[0]["generated_text"]) for output in outputs]
+
+    async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        if self._batcher is None:
+            return await asyncio.to_thread(self.request, messages)
+        output = await asyncio.wrap_future(self._batcher.submit(self._prompt(messages)))
+        return ProteusLLMResponse(
+            message=ProteusMessage(role="assistant", content=output),
+            token_cnt=None,
+        )
+
+    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        prompt = self._prompt(messages)
+        if self._batcher is None:
+            output = self._generate([prompt])[0]
+        else:
+            output = self._batcher.submit(prompt).result()
         return ProteusLLMResponse(
-            message=ProteusMessage(role="assistant", content=str(output)),
+            message=ProteusMessage(role="assistant", content=output),
             token_cnt=None,
         )
@@ -1,15 +1,28 @@
+import asyncio
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, Callable, Iterable, Optional, Tuple
 
+from proteus.batch import BatchProgress, BatchResult, run_batch
 from proteus.config import LLMsConfig, LLMsName, ManagerConfig, PromptsConfig
 from proteus.llms import BaseLLM, llm_from_config
-from proteus.manager.talker_store import TalkerStore
+from proteus.llms.instrumented import InstrumentedLLM
+from proteus.manager.talker_store import (
+    BaseTalkerStorePersisted,
+    SQLiteTalkerStorePersisted,
+    TalkerStore,
+    TalkerStorePersisted,
+)
 from proteus.storages.history_store import (
     BaseHistoryStore,
     FakeHistoryStore,
     FileHistoryStore,
 )
+from proteus.storages.instrumented import InstrumentedHistoryStore
+from proteus.storages.sqlite_store import SQLiteDatabase, SQLiteHistoryStore
 from proteus.talker import ProteusTalker
+from proteus.timing import SlowTurnLog
+from proteus.tokens import TokenBudget, TokenCounter
+from proteus.utils.metrics import MetricsRegistry
 
 
 class ProteusManager:
@@ -19,6 +32,8 @@ class ProteusManager:
     llm: BaseLLM
     talker_store: TalkerStore
     history_store: BaseHistoryStore
+    token_budget: Optional[TokenBudget]
+    slow_turn_log: Optional[SlowTurnLog]
 
     def __init__(
         self,
@@ -26,22 +41,69 @@ class ProteusManager:
         prompts_conf: PromptsConfig,
         manager_conf: ManagerConfig,
         llm_name: Optional[LLMsName] = None,
+        token_counter: Optional[TokenCounter] = None,
+        metrics: Optional[MetricsRegistry] = None,
     ) -> None:
         self.llms_conf = llms_conf
         self.prompts_conf = prompts_conf
         self.manager_conf = manager_conf
         self.llm = llm_from_config(llms_conf, llm_name)
-        self.talker_store = TalkerStore(
-            manager_conf.cache_talkers_mem_capacity,
-            cache_folder=Path(manager_conf.cache_folder) / "talkers"
-            if manager_conf.cache_talkers_enabled
-            else None,
+        self.token_budget = (
+            TokenBudget(manager_conf.live_history_token_budget, token_counter)
+            if manager_conf.live_history_token_budget >= 0
+            else None
         )
-        self.history_store = (
-            FileHistoryStore(Path(manager_conf.cache_folder) / "history")
-            if manager_conf.cache_history_enabled
-            else FakeHistoryStore()
+        cache_folder = Path(manager_conf.cache_folder)
+        self.slow_turn_log = (
+            SlowTurnLog(
+                cache_folder / "slow_turns.jsonl",
+                manager_conf.slow_turn_threshold_ms / 1000,
+            )
+            if manager_conf.slow_turn_threshold_ms >= 0
+            else None
         )
+        persisted: Optional[BaseTalkerStorePersisted] = None
+        self.history_store = FakeHistoryStore()
+        if manager_conf.cache_backend == "sqlite":
+            if manager_conf.cache_talkers_enabled or manager_conf.cache_history_enabled:
+                db = SQLiteDatabase(cache_folder / "proteus.sqlite3")
+                if manager_conf.cache_talkers_enabled:
+                    persisted = SQLiteTalkerStorePersisted(db)
+                if manager_conf.cache_history_enabled:
+                    self.history_store = SQLiteHistoryStore(db)
+        else:
+            if manager_conf.cache_talkers_enabled:
+                persisted = TalkerStorePersisted(cache_folder / "talkers")
+            if manager_conf.cache_history_enabled:
+                self.history_store = FileHistoryStore(cache_folder / "history")
+        self.talker_store = TalkerStore(
+            manager_conf.cache_talkers_mem_capacity, persisted=persisted
+        )
+        # the LLM, the history store and the talker store record into metrics
+        if metrics is not None:
+            self._instrument(metrics, llm_name)
+
+    def _instrument(
+        self, metrics: MetricsRegistry, llm_name: Optional[LLMsName]
+    ) -> None:
+        self.llm = InstrumentedLLM(self.llm, llm_name, metrics)
+        if not isinstance(self.history_store, FakeHistoryStore):
+            self.history_store = InstrumentedHistoryStore(
+                self.history_store, metrics=metrics
+            )
+        store = self.talker_store
+        metrics.counter(
+            "proteus_talker_store_hits_total", "Talkers found in memory"
+        ).set_function(lambda: store.hits)
+        metrics.counter(
+            "proteus_talker_store_misses_total", "Talkers not found in memory"
+        ).set_function(lambda: store.misses)
+        metrics.counter(
+            "proteus_talker_store_evictions_total", "Talkers evicted from memory"
+        ).set_function(lambda: store.evictions)
+        metrics.gauge(
+            "proteus_talker_store_size", "Talkers kept in memory"
+        ).set_function(lambda: store.stats()["size"])
 
     def new_talker(self, prompt_name: str) -> str:
         talker = ProteusTalker.from_new(
@@ -51,6 +113,8 @@ class ProteusManager:
             live_history_size=self.manager_conf.live_history_size,
             save_history=self.history_store.extend,
             persist=self.talker_store.persist,
+            token_budget=self.token_budget,
+            slow_turn_log=self.slow_turn_log,
         )
         self.talker_store.append(talker)
         return talker.state.id
@@ -66,6 +130,8 @@ class ProteusManager:
                     self.manager_conf.live_history_size,
                     self.history_store.extend,
                     self.talker_store.persist,
+                    token_budget=self.token_budget,
+                    slow_turn_log=self.slow_turn_log,
                 )
                 self.talker_store.append(talker)
             return talker
@@ -74,3 +140,19 @@ class ProteusManager:
 
     def save_all_talkers(self):
         self.talker_store.persist_all()
+
+    async def _asay(self, proteus_id: str, user_input: str) -> str:
+        # loading a talker may read it from disk and persist an evicted one
+        talker = await asyncio.to_thread(self.get_talker, proteus_id)
+        if talker is None:
+            raise KeyError(f"Talker {proteus_id} not found.")
+        return await talker.asay(user_input)
+
+    def run_batch(
+        self,
+        items: Iterable[Tuple[str, str]],
+        concurrency: int = 16,
+        on_progress: Optional[Callable[[BatchProgress], None]] = None,
+    ) -> AsyncIterator[BatchResult]:
+        """Say each (talker id, input) through asay, see proteus.batch.run_batch."""
+        return run_batch(self._asay, items, concurrency, on_progress)
@@ -1,12 +1,24 @@
+from abc import abstractmethod
 from collections import OrderedDict
 from pathlib import Path
 from threading import Lock
-from typing import Optional, Union
+from typing import Dict, List, Optional, Union
 
+from proteus.storages.sqlite_store import SQLiteDatabase
 from proteus.talker import ProteusTalker
 
 
-class TalkerStorePersisted:
+class BaseTalkerStorePersisted:
+    @abstractmethod
+    def upsert(self, talker_id: str, talker_state: bytes) -> None: ...
+
+    @abstractmethod
+    def get(self, talker_id: str) -> bytes:
+        """Raise KeyError if the talker is not persisted."""
+        ...
+
+
+class TalkerStorePersisted(BaseTalkerStorePersisted):
     _folder_path: Path
 
     def __init__(self, folder_path: Path) -> None:
@@ -19,44 +31,103 @@ class TalkerStorePersisted:
 
     def get(self, talker_id: str) -> bytes:
         path = self._folder_path / f"{talker_id}.json"
-        return path.read_bytes()
+        try:
+            return path.read_bytes()
+        except FileNotFoundError as e:
+            raise KeyError(talker_id) from e
+
+
+class SQLiteTalkerStorePersisted(BaseTalkerStorePersisted):
+    _db: SQLiteDatabase
+
+    def __init__(self, db: SQLiteDatabase) -> None:
+        self._db = db
+
+    def upsert(self, talker_id: str, talker_state: bytes) -> None:
+        with self._db.connection() as conn:
+            conn.execute(
+                "INSERT INTO proteus_talkers (talker_id, state) VALUES (?, ?) "
+                "ON CONFLICT (talker_id) DO UPDATE SET state = excluded.state",
+                (talker_id, talker_state),
+            )
+
+    def get(self, talker_id: str) -> bytes:
+        row = (
+            self._db.connection()
+            .execute(
+                "SELECT state FROM proteus_talkers WHERE talker_id = ?", (talker_id,)
+            )
+            .fetchone()
+        )
+        if row is None:
+            raise KeyError(talker_id)
+        return row[0]
 
 
 class TalkerStore:
+    hits: int
+    misses: int
+    evictions: int
     _store: OrderedDict[str, ProteusTalker]
     _store_lock: Lock
-    _persisted: Optional[TalkerStorePersisted]
+    _persisted: Optional[BaseTalkerStorePersisted]
     _capacity: int
 
-    def __init__(self, capacity: int, cache_folder: Optional[Path] = None) -> None:
+    def __init__(
+        self,
+        capacity: int,
+        cache_folder: Optional[Path] = None,
+        persisted: Optional[BaseTalkerStorePersisted] = None,
+    ) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
         self._store = OrderedDict()
         self._store_lock = Lock()
-        self._persisted = TalkerStorePersisted(cache_folder) if cache_folder else None
+        if persisted is None and cache_folder:
+            persisted = TalkerStorePersisted(cache_folder)
+        self._persisted = persisted
         self._capacity = capacity
 
+    def _evict(self) -> List[ProteusTalker]:
+        """Must hold the store lock. Returns the evicted talkers, to be persisted after releasing it."""
+        evicted = []
+        while self._capacity > 0 and len(self._store) > self._capacity:
+            evicted.append(self._store.popitem(last=False)[1])
+            self.evictions += 1
+        return evicted
+
+    def _persist_evicted(self, evicted: List[ProteusTalker]) -> None:
+        if self._persisted:
+            for talker in evicted:
+                self._persisted.upsert(talker.state.id, talker.state.to_json())
+
     def append(self, talker: ProteusTalker) -> None:
         with self._store_lock:
             self._store[talker.state.id] = talker
             self._store.move_to_end(talker.state.id)
-            while self._capacity > 0 and len(self._store) > self._capacity:
-                self._store.popitem(last=False)
+            evicted = self._evict()
+        self._persist_evicted(evicted)
 
     def get(self, talker_id: str) -> Union[ProteusTalker, bytes]:
         with self._store_lock:
             if talker_id not in self._store:
+                self.misses += 1
                 if self._persisted:
                     try:
                         talker_state = self._persisted.get(talker_id)
-                    except FileNotFoundError as e:
+                    except KeyError as e:
                         raise KeyError(f"Talker {talker_id} not found.") from e
                     return talker_state
                 else:
                     raise KeyError(f"Talker {talker_id} not found.")
 
+            self.hits += 1
             self._store.move_to_end(talker_id)
-            while self._capacity > 0 and len(self._store) > self._capacity:
-                self._store.popitem(last=False)
-            return self._store[talker_id]
+            talker = self._store[talker_id]
+            evicted = self._evict()
+        self._persist_evicted(evicted)
+        return talker
 
     def persist(self, talker_id: str, talker_state: bytes) -> None:
         if self._persisted:
@@ -70,3 +141,12 @@ class TalkerStore:
             with self._store_lock:
                 for talker_id, talker in self._store.items():
                     self._persisted.upsert(talker_id, talker.state.to_json())
+
+    def stats(self) -> Dict[str, int]:
+        with self._store_lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._store),
+            }
@@ -1,38 +1,162 @@
-from typing import Optional
+from collections import OrderedDict
+from threading import Lock
+from typing import AsyncIterator, Callable, Iterable, Optional, Self, Tuple, Union
 
-from psycopg_pool import ConnectionPool
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
 
+from proteus.batch import BatchProgress, BatchResult, run_batch
 from proteus.config import LLMsConfig, PromptsConfig
 from proteus.llms import BaseLLM, llm_from_config
 from proteus.storages.history_store import (
+    AsyncPGHistoryStore,
+    BaseAsyncHistoryStore,
+    BaseHistoryStore,
     PGHistoryStore,
 )
 from proteus.teller import ProteusTeller
+from proteus.timing import SlowTurnLog
 
 
-class ProteusFactory:
+class _TellerCache:
+    """Build tellers that share an LLM and a history store, and keep them for reuse."""
+
     _llm: BaseLLM
     _prompts_conf: PromptsConfig
-    _pg_conn_pool: ConnectionPool
+    _history: Union[BaseHistoryStore, BaseAsyncHistoryStore]
+    _tellers: OrderedDict[Tuple[str, str, int], ProteusTeller]
+    _tellers_lock: Lock
+    _tellers_capacity: int
+    _slow_turn_log: Optional[SlowTurnLog]
 
     def __init__(
         self,
-        llm_config: LLMsConfig,
-        llm_name: str,
+        llm: BaseLLM,
         prompts_config: PromptsConfig,
-        pg_conn_pool: ConnectionPool,
+        history: Union[BaseHistoryStore, BaseAsyncHistoryStore],
+        tellers_capacity: int,
+        slow_turn_log: Optional[SlowTurnLog],
     ) -> None:
-        self._llm = llm_from_config(llm_config, llm_name)
+        self._llm = llm
         self._prompts_conf = prompts_config
-        self._pg_conn_pool = pg_conn_pool
+        self._history = history
+        self._tellers = OrderedDict()
+        self._tellers_lock = Lock()
+        self._tellers_capacity = tellers_capacity
+        self._slow_turn_log = slow_turn_log
 
     def get_teller(
         self, id: str, prompt_name: str, live_history_size: int = 8
     ) -> Optional[ProteusTeller]:
-        return ProteusTeller(
+        key = (id, prompt_name, live_history_size)
+        with self._tellers_lock:
+            teller = self._tellers.get(key)
+            if teller is not None:
+                self._tellers.move_to_end(key)
+                return teller
+        # tellers are stateless, a duplicate built by a concurrent call is harmless
+        teller = ProteusTeller(
             id,
             llm=self._llm,
             prompt=self._prompts_conf.prompts[prompt_name],
-            history=PGHistoryStore(self._pg_conn_pool),
+            history=self._history,
             live_history_size=live_history_size,
+            prompt_name=prompt_name,
+            slow_turn_log=self._slow_turn_log,
+        )
+        with self._tellers_lock:
+            self._tellers[key] = teller
+            while 0 <= self._tellers_capacity < len(self._tellers):
+                self._tellers.popitem(last=False)
+        return teller
+
+    def say_many(
+        self,
+        items: Iterable[Tuple[str, str]],
+        prompt_name: str,
+        live_history_size: int = 8,
+        concurrency: int = 16,
+        on_progress: Optional[Callable[[BatchProgress], None]] = None,
+    ) -> AsyncIterator[BatchResult]:
+        """Say each (session id, input) through asay, see proteus.batch.run_batch."""
+
+        async def say(id: str, user_input: str) -> str:
+            teller = self.get_teller(id, prompt_name, live_history_size)
+            assert teller is not None
+            return await teller.asay(user_input)
+
+        return run_batch(say, items, concurrency, on_progress)
+
+
+class ProteusFactory(_TellerCache):
+    """
+    tellers_capacity: number of tellers kept for reuse. -1 means unlimited. If exceeded, the least recently used teller is dropped.
+    slow_turn_log: if set, tellers log their slow turns to it
+    """
+
+    _pg_conn_pool: ConnectionPool
+
+    def __init__(
+        self,
+        llm_config: LLMsConfig,
+        llm_name: str,
+        prompts_config: PromptsConfig,
+        pg_conn_pool: ConnectionPool,
+        tellers_capacity: int = 1024,
+        slow_turn_log: Optional[SlowTurnLog] = None,
+    ) -> None:
+        self._pg_conn_pool = pg_conn_pool
+        # the schema is set up once here, tellers share this store
+        super().__init__(
+            llm_from_config(llm_config, llm_name),
+            prompts_config,
+            PGHistoryStore(pg_conn_pool),
+            tellers_capacity,
+            slow_turn_log,
+        )
+
+
+class AsyncProteusFactory(_TellerCache):
+    """
+    Like ProteusFactory, on an AsyncConnectionPool. Its tellers only support the async methods, e.g. asay.
+
+    Construct it with `await AsyncProteusFactory.create(...)`, which also makes
+    sure the table exists.
+    """
+
+    def __init__(
+        self,
+        llm_config: LLMsConfig,
+        llm_name: str,
+        prompts_config: PromptsConfig,
+        history: AsyncPGHistoryStore,
+        tellers_capacity: int = 1024,
+        slow_turn_log: Optional[SlowTurnLog] = None,
+    ) -> None:
+        super().__init__(
+            llm_from_config(llm_config, llm_name),
+            prompts_config,
+            history,
+            tellers_capacity,
+            slow_turn_log,
+        )
+
+    @classmethod
+    async def create(
+        cls,
+        llm_config: LLMsConfig,
+        llm_name: str,
+        prompts_config: PromptsConfig,
+        pg_conn_pool: AsyncConnectionPool,
+        tellers_capacity: int = 1024,
+        slow_turn_log: Optional[SlowTurnLog] = None,
+    ) -> Self:
+        # tellers share this store
+        history = await AsyncPGHistoryStore.create(pg_conn_pool)
+        return cls(
+            llm_config,
+            llm_name,
+            prompts_config,
+            history,
+            tellers_capacity,
+            slow_turn_log,
         )
@@ -20,3 +20,40 @@ class ProteusMessagePrompt(StructSpec, kw_only=True, frozen=True):
 class ProteusLLMResponse(StructSpec, kw_only=True, frozen=True):
     message: ProteusMessage
     token_cnt: Optional[int] = None
+
+
+class TurnStage(StructSpec, kw_only=True, frozen=True):
+    """Stage of a turn, between two `time.monotonic()` timestamps."""
+
+    name: str
+    start: float
+    end: float
+
+
+class ProteusTurn(StructSpec, kw_only=True, frozen=True):
+    """
+    Reply of a turn together with where its time went.
+
+    started_at, ended_at: `time.monotonic()` timestamps of the whole turn
+    stages: in time order and not overlapping. A stage run within another one, e.g. "history" within "prompt" for a teller, splits it in two pieces.
+    prompt_messages, prompt_chars: size of the prompt sent to the LLM
+    """
+
+    reply: str
+    token_cnt: Optional[int] = None
+    started_at: float
+    ended_at: float
+    stages: List[TurnStage]
+    prompt_messages: int
+    prompt_chars: int
+
+    @property
+    def duration(self) -> float:
+        return self.ended_at - self.started_at
+
+    def breakdown(self) -> Dict[str, float]:
+        """Seconds per stage name, which add up to at most the duration."""
+        seconds: Dict[str, float] = {}
+        for stage in self.stages:
+            seconds[stage.name] = seconds.get(stage.name, 0.0) + stage.end - stage.start
+        return seconds
@@ -0,0 +1,62 @@
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from proteus.storages.cached_store import CachedHistoryStore
+    from proteus.storages.history_store import (
+        AsyncPGHistoryStore,
+        BaseAsyncHistoryStore,
+        BaseHistoryStore,
+        FakeHistoryStore,
+        FileHistoryStore,
+        MemoryHistoryStore,
+        PGHistoryStore,
+        ThreadedHistoryStore,
+    )
+    from proteus.storages.instrumented import InstrumentedHistoryStore
+    from proteus.storages.log_store import LogHistoryStore
+    from proteus.storages.sqlite_store import SQLiteDatabase, SQLiteHistoryStore
+    from proteus.storages.write_behind import WriteBehindHistoryStore
+
+# stores are imported on first access, so that unused drivers are never loaded
+_LAZY = {
+    "AsyncPGHistoryStore": "proteus.storages.history_store",
+    "BaseAsyncHistoryStore": "proteus.storages.history_store",
+    "BaseHistoryStore": "proteus.storages.history_store",
+    "FakeHistoryStore": "proteus.storages.history_store",
+    "FileHistoryStore": "proteus.storages.history_store",
+    "MemoryHistoryStore": "proteus.storages.history_store",
+    "PGHistoryStore": "proteus.storages.history_store",
+    "ThreadedHistoryStore": "proteus.storages.history_store",
+    "CachedHistoryStore": "proteus.storages.cached_store",
+    "InstrumentedHistoryStore": "proteus.storages.instrumented",
+    "LogHistoryStore": "proteus.storages.log_store",
+    "SQLiteDatabase": "proteus.storages.sqlite_store",
+    "SQLiteHistoryStore": "proteus.storages.sqlite_store",
+    "WriteBehindHistoryStore": "proteus.storages.write_behind",
+}
+
+
+def __getattr__(name: str) -> Any:
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(module), name)
+
+
+__all__ = [
+    "AsyncPGHistoryStore",
+    "BaseAsyncHistoryStore",
+    "BaseHistoryStore",
+    "CachedHistoryStore",
+    "FakeHistoryStore",
+    "FileHistoryStore",
+    "InstrumentedHistoryStore",
+    "LogHistoryStore",
+    "MemoryHistoryStore",
+    "PGHistoryStore",
+    "SQLiteDatabase",
+    "SQLiteHistoryStore",
+    "ThreadedHistoryStore",
+    "WriteBehindHistoryStore",
+]
@@ -0,0 +1,168 @@
+from collections import OrderedDict, deque
+from threading import Lock
+from typing import Deque, Dict, List, Optional, Tuple
+
+from proteus.spec import ProteusMessage
+from proteus.storages.history_store import BaseHistoryStore, _message_nbytes
+
+# a message and its token count, None where unknown
+_Entry = Tuple[ProteusMessage, Optional[int]]
+
+
+class _CachedTail:
+    __slots__ = ("complete", "messages", "nbytes")
+
+    messages: Deque[_Entry]
+    # whether messages hold the whole history of the session
+    complete: bool
+    nbytes: int
+
+    def __init__(self, tail_size: int) -> None:
+        self.messages = deque(maxlen=tail_size)
+        self.complete = False
+        self.nbytes = 0
+
+
+class CachedHistoryStore(BaseHistoryStore):
+    """
+    Read-through cache of the latest messages of each session, in front of another store.
+
+    tail_size: messages cached per session
+    max_sessions: number of cached sessions. -1 means unlimited.
+    max_bytes: budget on the UTF-8 size of cached message contents. -1 means unlimited.
+    The least recently used sessions are evicted first. Writes go through this
+    store, so the cache is only valid while no other process writes the same sessions.
+    """
+
+    hits: int
+    misses: int
+    _store: BaseHistoryStore
+    _tail_size: int
+    _max_sessions: int
+    _max_bytes: int
+    _cache: OrderedDict[str, _CachedTail]
+    _cache_lock: Lock
+    _nbytes: int
+    _session_locks: List[Lock]
+
+    def __init__(
+        self,
+        store: BaseHistoryStore,
+        tail_size: int = 32,
+        max_sessions: int = 10000,
+        max_bytes: int = -1,
+    ) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._store = store
+        self._tail_size = tail_size
+        self._max_sessions = max_sessions
+        self._max_bytes = max_bytes
+        self._cache = OrderedDict()
+        self._cache_lock = Lock()
+        self._nbytes = 0
+        # serialize writes and cache fills of the same session, so a fill
+        # never installs a tail that misses a concurrent write
+        self._session_locks = [Lock() for _ in range(64)]
+
+    def _session_lock(self, session_id: str) -> Lock:
+        return self._session_locks[hash(session_id) % len(self._session_locks)]
+
+    def _append(self, tail: _CachedTail, entries: List[_Entry]) -> None:
+        """Must hold the cache lock."""
+        messages = tail.messages
+        for entry in entries:
+            if len(messages) == messages.maxlen:
+                if not messages:
+                    break
+                dropped = _message_nbytes(messages[0][0])
+                tail.nbytes -= dropped
+                self._nbytes -= dropped
+                tail.complete = False
+            nbytes = _message_nbytes(entry[0])
+            messages.append(entry)
+            tail.nbytes += nbytes
+            self._nbytes += nbytes
+
+    def _evict(self) -> None:
+        """Must hold the cache lock."""
+        while self._cache and (
+            0 <= self._max_sessions < len(self._cache)
+            or 0 <= self._max_bytes < self._nbytes
+        ):
+            _, evicted = self._cache.popitem(last=False)
+            self._nbytes -= evicted.nbytes
+
+    def _get_cached(self, session_id: str, k: int) -> Optional[List[_Entry]]:
+        """Must hold the cache lock."""
+        tail = self._cache.get(session_id)
+        if tail is None or (k > len(tail.messages) and not tail.complete):
+            return None
+        self._cache.move_to_end(session_id)
+        messages = tail.messages
+        return [messages[i] for i in range(-min(k, len(messages)), 0)]
+
+    def _write(self, session_id: str, entries: List[_Entry]) -> None:
+        """Must hold the session lock, after writing entries to the store."""
+        with self._cache_lock:
+            tail = self._cache.get(session_id)
+            if tail is None:
+                # the new messages are the latest ones even without the older history
+                tail = self._cache[session_id] = _CachedTail(self._tail_size)
+            else:
+                self._cache.move_to_end(session_id)
+            self._append(tail, entries)
+            self._evict()
+
+    def extend(self, session_id: str, msg: List[ProteusMessage]) -> None:
+        with self._session_lock(session_id):
+            self._store.extend(session_id, msg)
+            self._write(session_id, [(m, None) for m in msg])
+
+    def extend_with_token_cnt(
+        self, session_id: str, msg: List[ProteusMessage], token_cnt: List[int]
+    ) -> None:
+        with self._session_lock(session_id):
+            self._store.extend_with_token_cnt(session_id, msg, token_cnt)
+            self._write(session_id, list(zip(msg, token_cnt, strict=True)))
+
+    def get_k_with_token_cnt(self, session_id: str, k: int) -> List[_Entry]:
+        if k <= 0:
+            return []
+        with self._cache_lock:
+            cached = self._get_cached(session_id, k)
+            if cached is not None:
+                self.hits += 1
+                return cached
+            self.misses += 1
+        with self._session_lock(session_id):
+            with self._cache_lock:
+                cached = self._get_cached(session_id, k)
+                if cached is not None:
+                    return cached
+            size = max(k, self._tail_size)
+            # fills keep the token counts, so both kinds of reads are served
+            retrieved = self._store.get_k_with_token_cnt(session_id, size)
+            with self._cache_lock:
+                stale = self._cache.pop(session_id, None)
+                if stale is not None:
+                    self._nbytes -= stale.nbytes
+                tail = self._cache[session_id] = _CachedTail(self._tail_size)
+                self._append(tail, retrieved)
+                tail.complete = len(retrieved) < size and len(tail.messages) == len(
+                    retrieved
+                )
+                self._evict()
+        return retrieved[-k:]
+
+    def get_k(self, session_id: str, k: int) -> List[ProteusMessage]:
+        return [m for m, _ in self.get_k_with_token_cnt(session_id, k)]
+
+    def stats(self) -> Dict[str, int]:
+        with self._cache_lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "sessions": len(self._cache),
+                "bytes": self._nbytes,
+            }
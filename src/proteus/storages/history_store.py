@@ -1,12 +1,33 @@
+import os
 from abc import abstractmethod
+from collections import OrderedDict, deque
+from datetime import UTC, date, datetime, timedelta
 from pathlib import Path
 from threading import Lock
-from typing import Dict, List, Tuple
-
-from psycopg_pool import ConnectionPool
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    BinaryIO,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Self,
+    Set,
+    Tuple,
+    TypeVar,
+)
 
 from proteus.spec import ProteusMessage
 
+if TYPE_CHECKING:
+    # an optional dependency of the server extra
+    from psycopg_pool import AsyncConnectionPool, ConnectionPool
+
+T = TypeVar("T")
+
 
 class BaseHistoryStore:
     @abstractmethod
@@ -15,6 +36,104 @@ class BaseHistoryStore:
     @abstractmethod
     def get_k(self, session_id: str, k: int) -> List[ProteusMessage]: ...
 
+    def extend_many(self, batch: List[Tuple[str, List[ProteusMessage]]]) -> None:
+        """Extend several sessions at once. Override this if the store can batch writes."""
+        for session_id, msg in batch:
+            self.extend(session_id, msg)
+
+    def get_k_many(
+        self, session_ids: List[str], k: int
+    ) -> Dict[str, List[ProteusMessage]]:
+        """Get the last k messages of several sessions. Override this if the store can batch reads."""
+        return {session_id: self.get_k(session_id, k) for session_id in session_ids}
+
+    def extend_with_token_cnt(
+        self, session_id: str, msg: List[ProteusMessage], token_cnt: List[int]
+    ) -> None:
+        """Extend, keeping the token count of each message if the store can persist it."""
+        self.extend(session_id, msg)
+
+    def get_k_with_token_cnt(
+        self, session_id: str, k: int
+    ) -> List[Tuple[ProteusMessage, Optional[int]]]:
+        """Like get_k, along with the persisted token counts, or None where unknown."""
+        return [(m, None) for m in self.get_k(session_id, k)]
+
+    def extend_many_with_token_cnt(
+        self, batch: List[Tuple[str, List[ProteusMessage], Optional[List[int]]]]
+    ) -> None:
+        """Like extend_many, keeping the token counts of the writes that have them. Override this if the store can batch writes."""
+        for session_id, msg, token_cnt in batch:
+            if token_cnt is None:
+                self.extend(session_id, msg)
+            else:
+                self.extend_with_token_cnt(session_id, msg, token_cnt)
+
+
+class BaseAsyncHistoryStore:
+    @abstractmethod
+    async def extend(self, session_id: str, msg: List[ProteusMessage]) -> None: ...
+
+    @abstractmethod
+    async def get_k(self, session_id: str, k: int) -> List[ProteusMessage]: ...
+
+    async def get_k_many(
+        self, session_ids: List[str], k: int
+    ) -> Dict[str, List[ProteusMessage]]:
+        """Get the last k messages of several sessions. Override this if the store can batch reads."""
+        return {
+            session_id: await self.get_k(session_id, k) for session_id in session_ids
+        }
+
+    async def extend_with_token_cnt(
+        self, session_id: str, msg: List[ProteusMessage], token_cnt: List[int]
+    ) -> None:
+        """Extend, keeping the token count of each message if the store can persist it."""
+        await self.extend(session_id, msg)
+
+    async def get_k_with_token_cnt(
+        self, session_id: str, k: int
+    ) -> List[Tuple[ProteusMessage, Optional[int]]]:
+        """Like get_k, along with the persisted token counts, or None where unknown."""
+        return [(m, None) for m in await self.get_k(session_id, k)]
+
+
+async def _to_thread(call: Callable[..., T], *args: Any) -> T:
+    # a loop is running whenever this is awaited, so asyncio is already loaded
+    import asyncio  # noqa: PLC0415
+
+    return await asyncio.to_thread(call, *args)
+
+
+class ThreadedHistoryStore(BaseAsyncHistoryStore):
+    """Async interface to a sync history store, which runs each call in the default executor of the loop."""
+
+    store: BaseHistoryStore
+
+    def __init__(self, store: BaseHistoryStore) -> None:
+        self.store = store
+
+    async def extend(self, session_id: str, msg: List[ProteusMessage]) -> None:
+        await _to_thread(self.store.extend, session_id, msg)
+
+    async def get_k(self, session_id: str, k: int) -> List[ProteusMessage]:
+        return await _to_thread(self.store.get_k, session_id, k)
+
+    async def get_k_many(
+        self, session_ids: List[str], k: int
+    ) -> Dict[str, List[ProteusMessage]]:
+        return await _to_thread(self.store.get_k_many, session_ids, k)
+
+    async def extend_with_token_cnt(
+        self, session_id: str, msg: List[ProteusMessage], token_cnt: List[int]
+    ) -> None:
+        await _to_thread(self.store.extend_with_token_cnt, session_id, msg, token_cnt)
+
+    async def get_k_with_token_cnt(
+        self, session_id: str, k: int
+    ) -> List[Tuple[ProteusMessage, Optional[int]]]:
+        return await _to_thread(self.store.get_k_with_token_cnt, session_id, k)
+
 
 class FakeHistoryStore(BaseHistoryStore):
     def extend(self, session_id: str, msg: List[ProteusMessage]) -> None:
@@ -24,85 +143,646 @@ class FakeHistoryStore(BaseHistoryStore):
         return []
 
 
+class _MemorySession:
+    __slots__ = ("messages", "nbytes")
+
+    messages: Deque[ProteusMessage]
+    nbytes: int
+
+    def __init__(self, size: int) -> None:
+        self.messages = deque(maxlen=size)
+        self.nbytes = 0
+
+
+def _message_nbytes(msg: ProteusMessage) -> int:
+    return len(msg.content.encode())
+
+
 class MemoryHistoryStore(BaseHistoryStore):
-    _store: Dict[str, Tuple[List[ProteusMessage], Lock]]
+    """
+    size: number of messages kept per session, older ones are dropped
+    max_messages: store-wide message budget. -1 means unlimited.
+    max_bytes: store-wide budget on the UTF-8 size of message contents. -1 means unlimited.
+    When a budget is exceeded, the least recently used sessions are evicted.
+    """
+
+    _store: OrderedDict[str, _MemorySession]
+    _store_lock: Lock
     _size: int
+    _max_messages: int
+    _max_bytes: int
+    _total_messages: int
+    _total_bytes: int
 
-    def __init__(self, size: int = 10) -> None:
-        self._store = {}
+    def __init__(
+        self, size: int = 10, max_messages: int = -1, max_bytes: int = -1
+    ) -> None:
+        self._store = OrderedDict()
+        self._store_lock = Lock()
         self._size = size
+        self._max_messages = max_messages
+        self._max_bytes = max_bytes
+        self._total_messages = 0
+        self._total_bytes = 0
+
+    def _over_budget(self) -> bool:
+        return (0 <= self._max_messages < self._total_messages) or (
+            0 <= self._max_bytes < self._total_bytes
+        )
 
     def extend(self, session_id: str, msg: List[ProteusMessage]) -> None:
-        if session_id not in self._store:
-            self._store[session_id] = ([], Lock())
-        with self._store[session_id][1]:
-            self._store[session_id][0].extend(msg)
-            while len(self._store[session_id][0]) > self._size:
-                self._store[session_id][0].pop(0)
+        with self._store_lock:
+            session = self._store.get(session_id)
+            if session is None:
+                session = self._store[session_id] = _MemorySession(self._size)
+            else:
+                self._store.move_to_end(session_id)
+            messages = session.messages
+            for m in msg:
+                if len(messages) == messages.maxlen:
+                    if not messages:
+                        break
+                    dropped = _message_nbytes(messages[0])
+                    session.nbytes -= dropped
+                    self._total_messages -= 1
+                    self._total_bytes -= dropped
+                nbytes = _message_nbytes(m)
+                messages.append(m)
+                session.nbytes += nbytes
+                self._total_messages += 1
+                self._total_bytes += nbytes
+            # never evict the session that is being written
+            while self._over_budget() and len(self._store) > 1:
+                _, evicted = self._store.popitem(last=False)
+                self._total_messages -= len(evicted.messages)
+                self._total_bytes -= evicted.nbytes
 
     def get_k(self, session_id: str, k: int) -> List[ProteusMessage]:
-        if session_id not in self._store:
+        if k <= 0:
             return []
-        with self._store[session_id][1]:
-            return self._store[session_id][0][-k:]
+        with self._store_lock:
+            session = self._store.get(session_id)
+            if session is None:
+                return []
+            self._store.move_to_end(session_id)
+            messages = session.messages
+            return [messages[i] for i in range(-min(k, len(messages)), 0)]
+
+
+def _read_tail_lines(file: BinaryIO, k: int, block_size: int) -> List[bytes]:
+    """Read the last k complete lines of a file by scanning blocks backwards.
+
+    A trailing record without its newline (an interrupted append) is ignored.
+    """
+    pos = file.seek(0, os.SEEK_END)
+    blocks: List[bytes] = []
+    newlines = 0
+    while pos > 0 and newlines <= k:
+        read_size = min(block_size, pos)
+        pos -= read_size
+        file.seek(pos)
+        block = file.read(read_size)
+        blocks.append(block)
+        newlines += block.count(b"\n")
+    blocks.reverse()
+    lines = b"".join(blocks).split(b"\n")
+    # the last element is either empty or a torn record
+    lines.pop()
+    if pos > 0:
+        # the first element may start in the middle of a record
+        lines.pop(0)
+    return [line for line in lines if line][-k:]
+
+
+def _truncate_torn_tail(file: BinaryIO, size: int, block_size: int) -> None:
+    """Drop the bytes after the last newline, left by an interrupted append."""
+    pos = size
+    while pos > 0:
+        read_size = min(block_size, pos)
+        pos -= read_size
+        file.seek(pos)
+        idx = file.read(read_size).rfind(b"\n")
+        if idx >= 0:
+            file.truncate(pos + idx + 1)
+            return
+    file.truncate(0)
 
 
 class FileHistoryStore(BaseHistoryStore):
+    """One JSONL file per session.
+
+    get_k reads the file backwards from the end, so its cost depends on k and
+    not on the length of the session. Each extend is a single append; with
+    fsync enabled it is also flushed to disk before returning.
+    """
+
     _cache_folder: Path
+    _tail_block_size: int
+    _fsync: bool
 
-    def __init__(self, cache_folder: Path) -> None:
+    def __init__(
+        self, cache_folder: Path, tail_block_size: int = 8192, fsync: bool = False
+    ) -> None:
         self._cache_folder = cache_folder
+        self._tail_block_size = tail_block_size
+        self._fsync = fsync
         cache_folder.mkdir(parents=True, exist_ok=True)
 
     def extend(self, session_id: str, msg: List[ProteusMessage]) -> None:
         file_path = self._cache_folder / f"{session_id}.jsonl"
-        with file_path.open("ab") as file:
-            file.write(b"\n".join([m.to_json() for m in msg]) + b"\n")
+        payload = b"".join([m.to_json() + b"\n" for m in msg])
+        with file_path.open("a+b") as file:
+            size = file.seek(0, os.SEEK_END)
+            if size > 0:
+                file.seek(size - 1)
+                if file.read(1) != b"\n":
+                    _truncate_torn_tail(file, size, self._tail_block_size)
+            file.write(payload)
+            if self._fsync:
+                file.flush()
+                os.fsync(file.fileno())
 
     def get_k(self, session_id: str, k: int) -> List[ProteusMessage]:
+        if k <= 0:
+            return []
         file_path = self._cache_folder / f"{session_id}.jsonl"
-        with file_path.open("r") as file:
-            lines = file.readlines()
-            return [ProteusMessage.from_json(line) for line in lines[-k:]]
+        with file_path.open("rb") as file:
+            lines = _read_tail_lines(file, k, self._tail_block_size)
+        return [ProteusMessage.from_json(line) for line in lines]
 
 
-class PGHistoryStore(BaseHistoryStore):
-    _conn_pool: ConnectionPool
+PGPartitioning = Literal["none", "hash", "time"]
 
-    def __init__(self, conn_pool: ConnectionPool) -> None:
-        self._conn_pool = conn_pool
-        with self._conn_pool.connection() as conn:
-            create_table_query = """
+_PG_TABLE = "proteus_chat_history"
+_PG_EPOCH = date(1970, 1, 1)
+_PG_INSERT = (
+    "INSERT INTO proteus_chat_history (SESSION_ID, ROLE, CONTENT) VALUES (%s, %s, %s)"
+)
+_PG_INSERT_TOKEN_CNT = "INSERT INTO proteus_chat_history (SESSION_ID, ROLE, CONTENT, TOKEN_CNT) VALUES (%s, %s, %s, %s)"
+_PG_COPY = "COPY proteus_chat_history (SESSION_ID, ROLE, CONTENT) FROM STDIN"
+_PG_COPY_TOKEN_CNT = (
+    "COPY proteus_chat_history (SESSION_ID, ROLE, CONTENT, TOKEN_CNT) FROM STDIN"
+)
+_PG_SELECT_K = "SELECT ROLE, CONTENT FROM proteus_chat_history WHERE SESSION_ID = %s ORDER BY MESSAGE_ID DESC LIMIT %s"
+_PG_SELECT_K_TOKEN_CNT = "SELECT ROLE, CONTENT, TOKEN_CNT FROM proteus_chat_history WHERE SESSION_ID = %s ORDER BY MESSAGE_ID DESC LIMIT %s"
+_PG_SELECT_K_MANY = """
+SELECT s.SESSION_ID, h.ROLE, h.CONTENT
+FROM unnest(%s::TEXT[]) AS s(SESSION_ID)
+CROSS JOIN LATERAL (
+    SELECT MESSAGE_ID, ROLE, CONTENT FROM proteus_chat_history
+    WHERE SESSION_ID = s.SESSION_ID ORDER BY MESSAGE_ID DESC LIMIT %s
+) AS h
+ORDER BY h.MESSAGE_ID"""
+# the kind of the table (r plain, p partitioned, NULL missing), its partition
+# strategy (h hash, r range), its columns and its valid indexes
+_PG_INSPECT = """
+SELECT
+    (SELECT relkind::TEXT FROM pg_class WHERE oid = to_regclass('proteus_chat_history')),
+    (SELECT partstrat::TEXT FROM pg_partitioned_table WHERE partrelid = to_regclass('proteus_chat_history')),
+    ARRAY(
+        SELECT column_name::TEXT FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'proteus_chat_history'
+    ),
+    ARRAY(
+        SELECT c.relname::TEXT FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = to_regclass('proteus_chat_history') AND i.indisvalid
+    )"""
+_PG_LIST_PARTITIONS = """
+SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = 'proteus_chat_history'::regclass"""
+
+
+class _PGSchema:
+    """
+    DDL of proteus_chat_history shared by the sync and async PG stores.
+
+    partitioning:
+        none: a single table keyed by a BIGINT identity column
+        hash: hash partitions on SESSION_ID, so a session lives in one partition
+        time: range partitions on CREATED_AT of partition_days days each, which can be dropped for retention
+    Partitioned tables draw MESSAGE_ID from a BIGINT sequence, as identity columns need PostgreSQL 17 there.
+    Partitioning only applies to new tables. An existing table keeps its layout
+    and its MESSAGE_ID type, e.g. the INT of tables created by earlier versions,
+    and asking for a different partitioning than it has raises ValueError.
+    Missing columns and indexes are added to an existing table, the index without
+    blocking writes. Nothing is run if the table is up to date.
+    """
+
+    partitioning: PGPartitioning
+    hash_partitions: int
+    partition_days: int
+
+    def __init__(
+        self,
+        partitioning: PGPartitioning = "none",
+        hash_partitions: int = 16,
+        partition_days: int = 30,
+    ) -> None:
+        self.partitioning = partitioning
+        self.hash_partitions = hash_partitions
+        self.partition_days = partition_days
+
+    def _index_statement(self, concurrently: bool) -> str:
+        return (
+            f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS index_session_id_message_id "
+            "ON proteus_chat_history (SESSION_ID, MESSAGE_ID DESC);"
+        )
+
+    def create_statements(self) -> List[str]:
+        """Create the table, run in one transaction."""
+        if self.partitioning == "none":
+            statements = [
+                """
 CREATE TABLE IF NOT EXISTS proteus_chat_history (
-    MESSAGE_ID      SERIAL  PRIMARY  KEY,
-    SESSION_ID      TEXT    NOT NULL,
-    ROLE            TEXT    NOT NULL,
-    CONTENT         TEXT    NOT NULL
+    MESSAGE_ID      BIGINT       GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    SESSION_ID      TEXT         NOT NULL,
+    ROLE            TEXT         NOT NULL,
+    CONTENT         TEXT         NOT NULL,
+    CREATED_AT      TIMESTAMPTZ  NOT NULL DEFAULT now(),
+    TOKEN_CNT       INTEGER
 ); """
-            conn.execute(create_table_query)
-            conn.execute(
-                "CREATE INDEX IF NOT EXISTS index_session_id ON proteus_chat_history (SESSION_ID);"
+            ]
+        else:
+            partition_key, primary_key = {
+                "hash": ("HASH (SESSION_ID)", "SESSION_ID, MESSAGE_ID"),
+                "time": ("RANGE (CREATED_AT)", "MESSAGE_ID, CREATED_AT"),
+            }[self.partitioning]
+            statements = [
+                "CREATE SEQUENCE IF NOT EXISTS proteus_chat_history_message_id_seq AS BIGINT;",
+                f"""
+CREATE TABLE IF NOT EXISTS proteus_chat_history (
+    MESSAGE_ID      BIGINT       NOT NULL DEFAULT nextval('proteus_chat_history_message_id_seq'),
+    SESSION_ID      TEXT         NOT NULL,
+    ROLE            TEXT         NOT NULL,
+    CONTENT         TEXT         NOT NULL,
+    CREATED_AT      TIMESTAMPTZ  NOT NULL DEFAULT now(),
+    TOKEN_CNT       INTEGER,
+    PRIMARY KEY ({primary_key})
+) PARTITION BY {partition_key}; """,
+            ]
+        if self.partitioning == "hash":
+            statements += [
+                f"CREATE TABLE IF NOT EXISTS {_PG_TABLE}_h{i} PARTITION OF {_PG_TABLE} "
+                f"FOR VALUES WITH (MODULUS {self.hash_partitions}, REMAINDER {i});"
+                for i in range(self.hash_partitions)
+            ]
+        else:
+            # the primary key of hash partitions already serves this lookup
+            statements.append(self._index_statement(concurrently=False))
+        return statements
+
+    def migrate_statements(
+        self,
+        relkind: Optional[str],
+        partstrat: Optional[str],
+        columns: List[str],
+        indexes: List[str],
+    ) -> Tuple[List[str], List[str]]:
+        """
+        Statements that bring the table inspected by _PG_INSPECT up to date.
+
+        Returns the statements run in one transaction, and those run after it
+        outside of any transaction, as CREATE INDEX CONCURRENTLY requires.
+        """
+        if relkind is None:
+            return self.create_statements(), []
+        expected = {"none": None, "hash": "h", "time": "r"}[self.partitioning]
+        if partstrat != expected:
+            found = {None: "none", "h": "hash", "r": "time"}.get(partstrat, partstrat)
+            raise ValueError(
+                f"{_PG_TABLE} exists with partitioning {found!r}, not {self.partitioning!r}. "
+                "Partitioning only applies to new tables."
+            )
+        statements = []
+        if "created_at" not in columns:
+            statements.append(
+                "ALTER TABLE proteus_chat_history ADD COLUMN CREATED_AT TIMESTAMPTZ NOT NULL DEFAULT now();"
+            )
+        if "token_cnt" not in columns:
+            statements.append(
+                "ALTER TABLE proteus_chat_history ADD COLUMN TOKEN_CNT INTEGER;"
+            )
+        concurrent = []
+        if self.partitioning != "hash" and "index_session_id_message_id" not in indexes:
+            if relkind == "p":
+                # partitioned tables cannot build an index concurrently
+                statements.append(self._index_statement(concurrently=False))
+            else:
+                concurrent += [
+                    # left invalid by an interrupted build
+                    "DROP INDEX CONCURRENTLY IF EXISTS index_session_id_message_id;",
+                    self._index_statement(concurrently=True),
+                ]
+        if "index_session_id" in indexes:
+            # superseded by the composite index
+            concurrent.append("DROP INDEX CONCURRENTLY IF EXISTS index_session_id;")
+        return statements, concurrent
+
+    def partition_start(self, day: date) -> date:
+        return _PG_EPOCH + timedelta(
+            days=(day - _PG_EPOCH).days // self.partition_days * self.partition_days
+        )
+
+    def create_partition_statements(self, day: date) -> List[str]:
+        """Create the time partitions holding `day` and the period after it."""
+        start = self.partition_start(day)
+        statements = []
+        for _ in range(2):
+            end = start + timedelta(days=self.partition_days)
+            statements.append(
+                f"CREATE TABLE IF NOT EXISTS {_PG_TABLE}_p{start:%Y%m%d} PARTITION OF {_PG_TABLE} "
+                f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00');"
             )
+            start = end
+        return statements
+
+    def expired_partitions(self, partitions: List[str], before: datetime) -> List[str]:
+        """Time partitions that only hold rows created before `before`."""
+        prefix = f"{_PG_TABLE}_p"
+        expired = []
+        for name in partitions:
+            if not name.startswith(prefix):
+                continue
+            start = datetime.strptime(name[len(prefix) :], "%Y%m%d").replace(tzinfo=UTC)
+            if start + timedelta(days=self.partition_days) <= before:
+                expired.append(name)
+        return sorted(expired)
+
+    def require_time_partitioning(self) -> None:
+        if self.partitioning != "time":
+            raise ValueError("Retention by partition requires time partitioning")
+
+
+def _pg_group_k_many(
+    session_ids: List[str], rows: List[Tuple[str, str, str]]
+) -> Dict[str, List[ProteusMessage]]:
+    retrieved: Dict[str, List[ProteusMessage]] = {
+        session_id: [] for session_id in session_ids
+    }
+    for session_id, role, content in rows:
+        retrieved[session_id].append(ProteusMessage(role=role, content=content))
+    return retrieved
+
+
+class PGHistoryStore(BaseHistoryStore):
+    """See _PGSchema for the partitioning options."""
+
+    _conn_pool: "ConnectionPool"
+    _schema: _PGSchema
+    _partitions_ready: Set[date]
+
+    def __init__(
+        self,
+        conn_pool: "ConnectionPool",
+        partitioning: PGPartitioning = "none",
+        hash_partitions: int = 16,
+        partition_days: int = 30,
+    ) -> None:
+        self._conn_pool = conn_pool
+        self._schema = _PGSchema(partitioning, hash_partitions, partition_days)
+        self._partitions_ready = set()
+        with self._conn_pool.connection() as conn:
+            inspected = conn.execute(_PG_INSPECT).fetchone()
+            assert inspected is not None
+            statements, concurrent = self._schema.migrate_statements(*inspected)
+            for statement in statements:
+                conn.execute(statement)
+            conn.commit()
+            if concurrent:
+                conn.autocommit = True
+                try:
+                    for statement in concurrent:
+                        conn.execute(statement)
+                finally:
+                    conn.autocommit = False
+        self._ensure_partitions()
+
+    def _ensure_partitions(self) -> None:
+        if self._schema.partitioning != "time":
+            return
+        today = datetime.now(UTC).date()
+        if self._schema.partition_start(today) in self._partitions_ready:
+            return
+        with self._conn_pool.connection() as conn:
+            for statement in self._schema.create_partition_statements(today):
+                conn.execute(statement)
             conn.commit()
+        self._partitions_ready.add(self._schema.partition_start(today))
 
     def extend(self, session_id: str, msg: List[ProteusMessage]) -> None:
+        self._ensure_partitions()
         with self._conn_pool.connection() as conn:
             with conn.cursor() as cur:
                 cur.executemany(
-                    "INSERT INTO proteus_chat_history (SESSION_ID, ROLE, CONTENT) VALUES (%s, %s, %s)",
+                    _PG_INSERT,
                     [(session_id, m.role, m.content) for m in msg],
                 )
             conn.commit()
 
     def get_k(self, session_id: str, k: int) -> List[ProteusMessage]:
         with self._conn_pool.connection() as conn, conn.cursor() as cur:
-            cur.execute(
-                "SELECT ROLE, CONTENT FROM proteus_chat_history WHERE SESSION_ID = %s ORDER BY MESSAGE_ID DESC LIMIT %s",
-                (session_id, k),
-            )
+            cur.execute(_PG_SELECT_K, (session_id, k), prepare=True)
             retrieved = [
                 ProteusMessage(role=role, content=content)
                 for role, content in cur.fetchall()
             ]
             retrieved.reverse()
         return retrieved
+
+    def extend_many(self, batch: List[Tuple[str, List[ProteusMessage]]]) -> None:
+        """Write the whole batch with one COPY in one transaction."""
+        self._ensure_partitions()
+        with self._conn_pool.connection() as conn:
+            with conn.cursor() as cur, cur.copy(_PG_COPY) as copy:
+                for session_id, msg in batch:
+                    for m in msg:
+                        copy.write_row((session_id, m.role, m.content))
+            conn.commit()
+
+    def extend_with_token_cnt(
+        self, session_id: str, msg: List[ProteusMessage], token_cnt: List[int]
+    ) -> None:
+        self._ensure_partitions()
+        with self._conn_pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.executemany(
+                    _PG_INSERT_TOKEN_CNT,
+                    [
+                        (session_id, m.role, m.content, n)
+                        for m, n in zip(msg, token_cnt, strict=True)
+                    ],
+                )
+            conn.commit()
+
+    def get_k_with_token_cnt(
+        self, session_id: str, k: int
+    ) -> List[Tuple[ProteusMessage, Optional[int]]]:
+        with self._conn_pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(_PG_SELECT_K_TOKEN_CNT, (session_id, k), prepare=True)
+            retrieved = [
+                (ProteusMessage(role=role, content=content), token_cnt)
+                for role, content, token_cnt in cur.fetchall()
+            ]
+            retrieved.reverse()
+        return retrieved
+
+    def extend_many_with_token_cnt(
+        self, batch: List[Tuple[str, List[ProteusMessage], Optional[List[int]]]]
+    ) -> None:
+        """Write the whole batch with one COPY in one transaction. Missing token counts are NULL."""
+        self._ensure_partitions()
+        with self._conn_pool.connection() as conn:
+            with conn.cursor() as cur, cur.copy(_PG_COPY_TOKEN_CNT) as copy:
+                for session_id, msg, token_cnt in batch:
+                    for m, n in zip(msg, token_cnt or [None] * len(msg), strict=True):
+                        copy.write_row((session_id, m.role, m.content, n))
+            conn.commit()
+
+    def get_k_many(
+        self, session_ids: List[str], k: int
+    ) -> Dict[str, List[ProteusMessage]]:
+        """Read the tails of all sessions in one round-trip."""
+        with self._conn_pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(_PG_SELECT_K_MANY, (session_ids, k), prepare=True)
+            return _pg_group_k_many(session_ids, cur.fetchall())
+
+    def drop_partitions_before(self, before: datetime) -> List[str]:
+        """Drop the time partitions whose rows were all created before `before`. Returns the dropped partitions."""
+        self._schema.require_time_partitioning()
+        with self._conn_pool.connection() as conn:
+            partitions = [row[0] for row in conn.execute(_PG_LIST_PARTITIONS)]
+            expired = self._schema.expired_partitions(partitions, before)
+            for name in expired:
+                conn.execute(f"DROP TABLE IF EXISTS {name};")
+            conn.commit()
+        self._partitions_ready.clear()
+        return expired
+
+
+class AsyncPGHistoryStore(BaseAsyncHistoryStore):
+    """Same table and options as PGHistoryStore, on an AsyncConnectionPool.
+
+    Construct it with `await AsyncPGHistoryStore.create(pool)`, which also
+    makes sure the table exists.
+    """
+
+    _conn_pool: "AsyncConnectionPool"
+    _schema: _PGSchema
+    _partitions_ready: Set[date]
+
+    def __init__(
+        self,
+        conn_pool: "AsyncConnectionPool",
+        partitioning: PGPartitioning = "none",
+        hash_partitions: int = 16,
+        partition_days: int = 30,
+    ) -> None:
+        self._conn_pool = conn_pool
+        self._schema = _PGSchema(partitioning, hash_partitions, partition_days)
+        self._partitions_ready = set()
+
+    @classmethod
+    async def create(
+        cls,
+        conn_pool: "AsyncConnectionPool",
+        partitioning: PGPartitioning = "none",
+        hash_partitions: int = 16,
+        partition_days: int = 30,
+    ) -> Self:
+        _self = cls(conn_pool, partitioning, hash_partitions, partition_days)
+        async with _self._conn_pool.connection() as conn:
+            inspected = await (await conn.execute(_PG_INSPECT)).fetchone()
+            assert inspected is not None
+            statements, concurrent = _self._schema.migrate_statements(*inspected)
+            for statement in statements:
+                await conn.execute(statement)
+            await conn.commit()
+            if concurrent:
+                await conn.set_autocommit(True)
+                try:
+                    for statement in concurrent:
+                        await conn.execute(statement)
+                finally:
+                    await conn.set_autocommit(False)
+        await _self._ensure_partitions()
+        return _self
+
+    async def _ensure_partitions(self) -> None:
+        if self._schema.partitioning != "time":
+            return
+        today = datetime.now(UTC).date()
+        if self._schema.partition_start(today) in self._partitions_ready:
+            return
+        async with self._conn_pool.connection() as conn:
+            for statement in self._schema.create_partition_statements(today):
+                await conn.execute(statement)
+            await conn.commit()
+        self._partitions_ready.add(self._schema.partition_start(today))
+
+    async def extend(self, session_id: str, msg: List[ProteusMessage]) -> None:
+        await self._ensure_partitions()
+        async with self._conn_pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.executemany(
+                    _PG_INSERT,
+                    [(session_id, m.role, m.content) for m in msg],
+                )
+            await conn.commit()
+
+    async def get_k(self, session_id: str, k: int) -> List[ProteusMessage]:
+        async with self._conn_pool.connection() as conn, conn.cursor() as cur:
+            await cur.execute(_PG_SELECT_K, (session_id, k), prepare=True)
+            retrieved = [
+                ProteusMessage(role=role, content=content)
+                for role, content in await cur.fetchall()
+            ]
+            retrieved.reverse()
+        return retrieved
+
+    async def extend_with_token_cnt(
+        self, session_id: str, msg: List[ProteusMessage], token_cnt: List[int]
+    ) -> None:
+        await self._ensure_partitions()
+        async with self._conn_pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.executemany(
+                    _PG_INSERT_TOKEN_CNT,
+                    [
+                        (session_id, m.role, m.content, n)
+                        for m, n in zip(msg, token_cnt, strict=True)
+                    ],
+                )
+            await conn.commit()
+
+    async def get_k_with_token_cnt(
+        self, session_id: str, k: int
+    ) -> List[Tuple[ProteusMessage, Optional[int]]]:
+        async with self._conn_pool.connection() as conn, conn.cursor() as cur:
+            await cur.execute(_PG_SELECT_K_TOKEN_CNT, (session_id, k), prepare=True)
+            retrieved = [
+                (ProteusMessage(role=role, content=content), token_cnt)
+                for role, content, token_cnt in await cur.fetchall()
+            ]
+            retrieved.reverse()
+        return retrieved
+
+    async def get_k_many(
+        self, session_ids: List[str], k: int
+    ) -> Dict[str, List[ProteusMessage]]:
+        """Read the tails of all sessions in one round-trip."""
+        async with self._conn_pool.connection() as conn, conn.cursor() as cur:
+            await cur.execute(_PG_SELECT_K_MANY, (session_ids, k), prepare=True)
+            return _pg_group_k_many(session_ids, await cur.fetchall())
+
+    async def drop_partitions_before(self, before: datetime) -> List[str]:
+        """Drop the time partitions whose rows were all created before `before`. Returns the dropped partitions."""
+        self._schema.require_time_partitioning()
+        async with self._conn_pool.connection() as conn:
+            cur = await conn.execute(_PG_LIST_PARTITIONS)
+            partitions = [row[0] for row in await cur.fetchall()]
+            expired = self._schema.expired_partitions(partitions, before)
+            for name in expired:
+                await conn.execute(f"DROP TABLE IF EXISTS {name};")
+            await conn.commit()
+        self._partitions_ready.clear()
+        return expired
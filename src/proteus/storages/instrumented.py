@@ -0,0 +1,86 @@
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from proteus.spec import ProteusMessage
+from proteus.storages.history_store import BaseHistoryStore
+from proteus.utils.metrics import Counter, Histogram, MetricsRegistry, registry
+
+T = TypeVar("T")
+
+
+class InstrumentedHistoryStore(BaseHistoryStore):
+    """
+    Record the latency and errors of the operations of a history store.
+
+    store: the history store
+    name: value of the store label. Defaults to the class name of store.
+    metrics: defaults to the shared registry of proteus.utils.metrics
+
+    proteus_history_seconds: latency by operation
+    proteus_history_errors_total: failed operations by exception type
+    """
+
+    _store: BaseHistoryStore
+    _name: str
+    _latency: Histogram
+    _errors: Counter
+
+    def __init__(
+        self,
+        store: BaseHistoryStore,
+        name: Optional[str] = None,
+        metrics: Optional[MetricsRegistry] = None,
+    ) -> None:
+        metrics = metrics if metrics is not None else registry
+        self._store = store
+        self._name = name if name is not None else type(store).__name__
+        self._latency = metrics.histogram(
+            "proteus_history_seconds", "Latency of history store operations"
+        )
+        self._errors = metrics.counter(
+            "proteus_history_errors_total", "Failed history store operations"
+        )
+
+    def _timed(self, op: str, call: Callable[..., T], *args: Any) -> T:
+        start = time.perf_counter()
+        try:
+            result = call(*args)
+        except Exception as e:
+            self._errors.inc(store=self._name, op=op, error=type(e).__name__)
+            raise
+        self._latency.observe(time.perf_counter() - start, store=self._name, op=op)
+        return result
+
+    def extend(self, session_id: str, msg: List[ProteusMessage]) -> None:
+        self._timed("extend", self._store.extend, session_id, msg)
+
+    def get_k(self, session_id: str, k: int) -> List[ProteusMessage]:
+        return self._timed("get_k", self._store.get_k, session_id, k)
+
+    def extend_many(self, batch: List[Tuple[str, List[ProteusMessage]]]) -> None:
+        self._timed("extend_many", self._store.extend_many, batch)
+
+    def get_k_many(
+        self, session_ids: List[str], k: int
+    ) -> Dict[str, List[ProteusMessage]]:
+        return self._timed("get_k_many", self._store.get_k_many, session_ids, k)
+
+    def extend_with_token_cnt(
+        self, session_id: str, msg: List[ProteusMessage], token_cnt: List[int]
+    ) -> None:
+        self._timed(
+            "extend", self._store.extend_with_token_cnt, session_id, msg, token_cnt
+        )
+
+    def get_k_with_token_cnt(
+        self, session_id: str, k: int
+    ) -> List[Tuple[ProteusMessage, Optional[int]]]:
+        return self._timed("get_k", self._store.get_k_with_token_cnt, session_id, k)
+
+    def extend_many_with_token_cnt(
+        self, batch: List[Tuple[str, List[ProteusMessage], Optional[List[int]]]]
+    ) -> None:
+        self._timed("extend_many", self._store.extend_many_with_token_cnt, batch)
+
+
+__all__ = ["InstrumentedHistoryStore"]
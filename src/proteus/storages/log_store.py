@@ -0,0 +1,417 @@
+import mmap
+import os
+import struct
+import zlib
+from collections import deque
+from pathlib import Path
+from threading import Condition, Event, Lock, Thread
+from typing import BinaryIO, Deque, Dict, Iterator, List, Optional, Self, Tuple
+
+import msgspec
+
+from proteus.spec import ProteusMessage
+from proteus.storages.history_store import BaseHistoryStore
+from proteus.utils.logger import logger
+
+# payload length, crc32 of the payload, session id length
+_HEADER = struct.Struct("<IIH")
+_SEGMENT_SUFFIX = ".seg"
+_decoder = msgspec.json.Decoder(ProteusMessage)
+
+# segment number, offset of the message JSON, length of the message JSON
+_Entry = Tuple[int, int, int]
+
+
+class _PendingAppend:
+    __slots__ = ("done", "error", "records", "session_id")
+
+    session_id: str
+    records: List[bytes]
+    done: bool
+    error: Optional[BaseException]
+
+    def __init__(self, session_id: str, records: List[bytes]) -> None:
+        self.session_id = session_id
+        self.records = records
+        self.done = False
+        self.error = None
+
+
+def _encode_record(sid: bytes, msg: ProteusMessage) -> bytes:
+    payload = sid + msg.to_json()
+    return _HEADER.pack(len(payload), zlib.crc32(payload), len(sid)) + payload
+
+
+def _scan_records(
+    buf: "mmap.mmap | bytes", size: int
+) -> Iterator[Tuple[int, str, int, int]]:
+    """Yield (record offset, session id, message offset, message length) until the first invalid record."""
+    pos = 0
+    while pos + _HEADER.size <= size:
+        length, crc, sid_len = _HEADER.unpack_from(buf, pos)
+        start = pos + _HEADER.size
+        end = start + length
+        if sid_len > length or end > size:
+            return
+        with memoryview(buf) as view, view[start:end] as payload:
+            if zlib.crc32(payload) != crc:
+                return
+            session_id = bytes(payload[:sid_len]).decode()
+        yield pos, session_id, start + sid_len, length - sid_len
+        pos = end
+
+
+class LogHistoryStore(BaseHistoryStore):
+    """
+    Append-only history log split into large segment files.
+
+    folder: where segment files are kept
+    segment_size: size in bytes after which a new segment is started
+    max_messages_per_session: messages kept per session. -1 means unlimited. Older messages become garbage for compaction.
+    fsync: whether each group commit is flushed to disk before extend returns
+    compact_interval: seconds between background compactions. 0 disables the background thread.
+    compact_ratio: sealed segments with a smaller fraction of live records are compacted
+
+    Concurrent extends are written together by whichever caller becomes the
+    writer (group commit). An in-memory index from session to record offsets
+    is rebuilt by scanning the segments on startup, and reads decode messages
+    directly from memory-mapped segments.
+    """
+
+    _folder: Path
+    _segment_size: int
+    _max_messages: int
+    _fsync: bool
+    _compact_ratio: float
+    _lock: Lock
+    _cond: Condition
+    _index: Dict[str, Deque[_Entry]]
+    _live: Dict[int, int]
+    _total: Dict[int, int]
+    _mmaps: Dict[int, mmap.mmap]
+    _queue: List[_PendingAppend]
+    _writing: bool
+    _active_no: int
+    _active_size: int
+    _active_file: BinaryIO
+    _compact_lock: Lock
+    _closed: Event
+    _compactor: Optional[Thread]
+
+    def __init__(
+        self,
+        folder: Path,
+        segment_size: int = 64 << 20,
+        max_messages_per_session: int = -1,
+        fsync: bool = False,
+        compact_interval: float = 0,
+        compact_ratio: float = 0.5,
+    ) -> None:
+        self._folder = folder
+        self._segment_size = segment_size
+        self._max_messages = max_messages_per_session
+        self._fsync = fsync
+        self._compact_ratio = compact_ratio
+        self._lock = Lock()
+        self._cond = Condition(self._lock)
+        self._index = {}
+        self._live = {}
+        self._total = {}
+        self._mmaps = {}
+        self._queue = []
+        self._writing = False
+        self._compact_lock = Lock()
+        self._closed = Event()
+        folder.mkdir(parents=True, exist_ok=True)
+        self._recover()
+        self._compactor = None
+        if compact_interval > 0:
+            self._compactor = Thread(
+                target=self._compact_loop,
+                args=(compact_interval,),
+                name="proteus-log-compactor",
+                daemon=True,
+            )
+            self._compactor.start()
+
+    def _segment_path(self, segment_no: int) -> Path:
+        return self._folder / f"{segment_no:010d}{_SEGMENT_SUFFIX}"
+
+    def _segments(self) -> List[int]:
+        return sorted(
+            int(path.stem) for path in self._folder.glob(f"*{_SEGMENT_SUFFIX}")
+        )
+
+    def _recover(self) -> None:
+        segments = self._segments()
+        for segment_no in segments:
+            path = self._segment_path(segment_no)
+            size = path.stat().st_size
+            self._live[segment_no] = 0
+            self._total[segment_no] = 0
+            valid = 0
+            if size > 0:
+                with (
+                    path.open("rb") as file,
+                    mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf,
+                ):
+                    for _, session_id, msg_offset, msg_len in _scan_records(buf, size):
+                        self._add_entry(session_id, (segment_no, msg_offset, msg_len))
+                        valid = msg_offset + msg_len
+            if valid < size:
+                logger.warning(
+                    "Truncating %d invalid bytes at the end of %s", size - valid, path
+                )
+                os.truncate(path, valid)
+        self._active_no = segments[-1] if segments else 0
+        self._open_active()
+
+    def _open_active(self) -> None:
+        path = self._segment_path(self._active_no)
+        self._active_file = path.open("ab")
+        self._active_size = self._active_file.tell()
+        self._live.setdefault(self._active_no, 0)
+        self._total.setdefault(self._active_no, 0)
+        if self._fsync:
+            dir_fd = os.open(self._folder, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def _add_entry(self, session_id: str, entry: _Entry) -> None:
+        """Index a committed record. Must hold the lock."""
+        entries = self._index.get(session_id)
+        if entries is None:
+            entries = self._index[session_id] = deque(
+                maxlen=self._max_messages if self._max_messages >= 0 else None
+            )
+        if entries.maxlen is not None and len(entries) == entries.maxlen:
+            if not entries.maxlen:
+                self._total[entry[0]] += 1
+                return
+            self._live[entries[0][0]] -= 1
+        entries.append(entry)
+        self._live[entry[0]] += 1
+        self._total[entry[0]] += 1
+
+    def _mmap(self, segment_no: int, end: int) -> mmap.mmap:
+        """Map a segment at least up to `end`. Must hold the lock."""
+        buf = self._mmaps.get(segment_no)
+        if buf is None or len(buf) < end:
+            if buf is not None:
+                buf.close()
+            with self._segment_path(segment_no).open("rb") as file:
+                buf = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mmaps[segment_no] = buf
+        return buf
+
+    def extend(self, session_id: str, msg: List[ProteusMessage]) -> None:
+        if not msg:
+            return
+        sid = session_id.encode()
+        pending = _PendingAppend(session_id, [_encode_record(sid, m) for m in msg])
+        with self._cond:
+            self._queue.append(pending)
+            while not pending.done:
+                if self._writing:
+                    self._cond.wait()
+                    continue
+                # become the writer and commit everything queued so far
+                self._writing = True
+                batch, self._queue = self._queue, []
+                committed: List[List[_Entry]] = []
+                error: Optional[BaseException] = None
+                self._cond.release()
+                try:
+                    committed = self._write_batch(batch)
+                except BaseException as e:
+                    error = e
+                finally:
+                    self._cond.acquire()
+                for pending_append, entries in zip(batch, committed, strict=False):
+                    for entry in entries:
+                        self._add_entry(pending_append.session_id, entry)
+                for pending_append in batch:
+                    pending_append.error = error
+                    pending_append.done = True
+                self._writing = False
+                self._cond.notify_all()
+        if pending.error is not None:
+            raise pending.error
+
+    def _write_batch(self, batch: List[_PendingAppend]) -> List[List[_Entry]]:
+        """Write a batch to the active segment. Only the writer calls this."""
+        committed: List[List[_Entry]] = []
+        # the segments written by this batch, with their sizes before it
+        starts = [(self._active_no, self._active_size)]
+        try:
+            chunks: List[bytes] = []
+            for pending in batch:
+                entries = []
+                sid_len = len(pending.session_id.encode())
+                for record in pending.records:
+                    if (
+                        self._active_size > 0
+                        and self._active_size + len(record) > self._segment_size
+                    ):
+                        self._active_file.write(b"".join(chunks))
+                        chunks = []
+                        self._roll()
+                        starts.append((self._active_no, 0))
+                    msg_offset = self._active_size + _HEADER.size + sid_len
+                    entries.append(
+                        (
+                            self._active_no,
+                            msg_offset,
+                            len(record) - _HEADER.size - sid_len,
+                        )
+                    )
+                    chunks.append(record)
+                    self._active_size += len(record)
+                committed.append(entries)
+            self._active_file.write(b"".join(chunks))
+            self._active_file.flush()
+            if self._fsync:
+                os.fsync(self._active_file.fileno())
+        except BaseException:
+            # drop the partial batch, also from the segments sealed during it,
+            # so that later appends stay readable and a restart does not
+            # replay writes whose callers got the error
+            for segment_no, size in starts:
+                if segment_no == self._active_no and not self._active_file.closed:
+                    self._active_file.truncate(size)
+                    self._active_size = size
+                else:
+                    os.truncate(self._segment_path(segment_no), size)
+            raise
+        return committed
+
+    def _roll(self) -> None:
+        """Seal the active segment and start a new one. Only the writer calls this."""
+        self._active_file.flush()
+        if self._fsync:
+            os.fsync(self._active_file.fileno())
+        self._active_file.close()
+        with self._lock:
+            self._active_no += 1
+            self._open_active()
+
+    def get_k(self, session_id: str, k: int) -> List[ProteusMessage]:
+        if k <= 0:
+            return []
+        with self._lock:
+            entries = self._index.get(session_id)
+            if not entries:
+                return []
+            retrieved = []
+            for i in range(-min(k, len(entries)), 0):
+                segment_no, msg_offset, msg_len = entries[i]
+                buf = self._mmap(segment_no, msg_offset + msg_len)
+                with (
+                    memoryview(buf) as view,
+                    view[msg_offset : msg_offset + msg_len] as data,
+                ):
+                    retrieved.append(_decoder.decode(data))
+            return retrieved
+
+    def compact(self) -> List[int]:
+        """Rewrite sealed segments that are mostly garbage. Returns the compacted segments."""
+        compacted = []
+        with self._compact_lock:
+            with self._lock:
+                candidates = [
+                    segment_no
+                    for segment_no, total in self._total.items()
+                    if segment_no != self._active_no
+                    and total > 0
+                    and self._live[segment_no] < total * self._compact_ratio
+                ]
+            for segment_no in candidates:
+                self._compact_segment(segment_no)
+                compacted.append(segment_no)
+        return compacted
+
+    def _positions(self, session_id: str, segment_no: int) -> Dict[_Entry, int]:
+        """Positions in the index of the session of its entries in segment_no. Must hold the lock."""
+        return {
+            entry: i
+            for i, entry in enumerate(self._index.get(session_id, ()))
+            if entry[0] == segment_no
+        }
+
+    def _compact_segment(self, segment_no: int) -> None:
+        path = self._segment_path(segment_no)
+        tmp_path = path.with_suffix(".tmp")
+        moved: List[Tuple[str, _Entry, _Entry]] = []
+        chunks: List[bytes] = []
+        size = 0
+        with self._lock:
+            buf = self._mmap(segment_no, 0)
+            live_entries: Dict[str, Dict[_Entry, int]] = {}
+            for pos, session_id, msg_offset, msg_len in _scan_records(buf, len(buf)):
+                old = (segment_no, msg_offset, msg_len)
+                positions = live_entries.get(session_id)
+                if positions is None:
+                    positions = live_entries[session_id] = self._positions(
+                        session_id, segment_no
+                    )
+                if old not in positions:
+                    continue
+                end = msg_offset + msg_len
+                chunks.append(buf[pos:end])
+                moved.append(
+                    (session_id, old, (segment_no, size + msg_offset - pos, msg_len))
+                )
+                size += end - pos
+        with tmp_path.open("wb") as file:
+            file.write(b"".join(chunks))
+            file.flush()
+            os.fsync(file.fileno())
+        with self._lock:
+            # the rewritten segment keeps its place in the log, so a crash
+            # leaves either the old or the new file and nothing is replayed twice
+            os.replace(tmp_path, path)
+            old_buf = self._mmaps.pop(segment_no, None)
+            if old_buf is not None:
+                old_buf.close()
+            live = 0
+            # appends may have dropped records in the meantime, which shifts positions
+            live_entries = {}
+            for session_id, old, new in moved:
+                positions = live_entries.get(session_id)
+                if positions is None:
+                    positions = live_entries[session_id] = self._positions(
+                        session_id, segment_no
+                    )
+                i = positions.get(old)
+                if i is not None:
+                    self._index[session_id][i] = new
+                    live += 1
+            self._live[segment_no] = live
+            self._total[segment_no] = len(moved)
+
+    def _compact_loop(self, interval: float) -> None:
+        while not self._closed.wait(interval):
+            try:
+                self.compact()
+            except Exception:
+                logger.exception("Failed to compact history segments")
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._compactor is not None:
+            self._compactor.join()
+        with self._cond:
+            while self._writing:
+                self._cond.wait()
+            self._active_file.close()
+            for buf in self._mmaps.values():
+                buf.close()
+            self._mmaps.clear()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
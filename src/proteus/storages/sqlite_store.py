@@ -0,0 +1,166 @@
+import sqlite3
+from pathlib import Path
+from threading import Lock, local
+from typing import Dict, List, Optional, Tuple
+
+from proteus.spec import ProteusMessage
+from proteus.storages.history_store import BaseHistoryStore
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS proteus_chat_history (
+    seq             INTEGER  PRIMARY  KEY,
+    session_id      TEXT     NOT NULL,
+    role            TEXT     NOT NULL,
+    content         TEXT     NOT NULL,
+    token_cnt       INTEGER
+);
+CREATE INDEX IF NOT EXISTS index_session_id_seq ON proteus_chat_history (session_id, seq);
+CREATE TABLE IF NOT EXISTS proteus_talkers (
+    talker_id       TEXT     PRIMARY  KEY,
+    state           BLOB     NOT NULL
+) WITHOUT ROWID;
+"""
+_SQLITE_INSERT = (
+    "INSERT INTO proteus_chat_history (session_id, role, content) VALUES (?, ?, ?)"
+)
+_SQLITE_INSERT_TOKEN_CNT = "INSERT INTO proteus_chat_history (session_id, role, content, token_cnt) VALUES (?, ?, ?, ?)"
+_SQLITE_SELECT_K = "SELECT role, content FROM proteus_chat_history WHERE session_id = ? ORDER BY seq DESC LIMIT ?"
+_SQLITE_SELECT_K_TOKEN_CNT = "SELECT role, content, token_cnt FROM proteus_chat_history WHERE session_id = ? ORDER BY seq DESC LIMIT ?"
+
+
+class SQLiteDatabase:
+    """
+    A SQLite database file in WAL mode, with one connection per thread.
+
+    It holds both the chat history and the persisted talker states, so one
+    file can back a whole ProteusManager.
+    """
+
+    _path: Path
+    _local: local
+    _conns: List[sqlite3.Connection]
+    _conns_lock: Lock
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._local = local()
+        self._conns = []
+        self._conns_lock = Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self.connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SQLITE_SCHEMA)
+        columns = [
+            row[1] for row in conn.execute("PRAGMA table_info(proteus_chat_history)")
+        ]
+        if "token_cnt" not in columns:
+            # databases created before token counts were kept
+            conn.execute(
+                "ALTER TABLE proteus_chat_history ADD COLUMN token_cnt INTEGER"
+            )
+            conn.commit()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=30, check_same_thread=False)
+            # WAL keeps the database consistent on crashes with NORMAL sync
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def close(self) -> None:
+        with self._conns_lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
+        self._local = local()
+
+
+class SQLiteHistoryStore(BaseHistoryStore):
+    _db: SQLiteDatabase
+
+    def __init__(self, db: SQLiteDatabase) -> None:
+        self._db = db
+
+    def extend(self, session_id: str, msg: List[ProteusMessage]) -> None:
+        self.extend_many([(session_id, msg)])
+
+    def extend_many(self, batch: List[Tuple[str, List[ProteusMessage]]]) -> None:
+        """Write the whole batch in one transaction."""
+        with self._db.connection() as conn:
+            conn.executemany(
+                _SQLITE_INSERT,
+                [
+                    (session_id, m.role, m.content)
+                    for session_id, msg in batch
+                    for m in msg
+                ],
+            )
+
+    def get_k(self, session_id: str, k: int) -> List[ProteusMessage]:
+        if k <= 0:
+            # a negative LIMIT means no limit in SQLite
+            return []
+        retrieved = [
+            ProteusMessage(role=role, content=content)
+            for role, content in self._db.connection().execute(
+                _SQLITE_SELECT_K, (session_id, k)
+            )
+        ]
+        retrieved.reverse()
+        return retrieved
+
+    def extend_with_token_cnt(
+        self, session_id: str, msg: List[ProteusMessage], token_cnt: List[int]
+    ) -> None:
+        with self._db.connection() as conn:
+            conn.executemany(
+                _SQLITE_INSERT_TOKEN_CNT,
+                [
+                    (session_id, m.role, m.content, n)
+                    for m, n in zip(msg, token_cnt, strict=True)
+                ],
+            )
+
+    def extend_many_with_token_cnt(
+        self, batch: List[Tuple[str, List[ProteusMessage], Optional[List[int]]]]
+    ) -> None:
+        """Write the whole batch in one transaction. Missing token counts are NULL."""
+        with self._db.connection() as conn:
+            conn.executemany(
+                _SQLITE_INSERT_TOKEN_CNT,
+                [
+                    (session_id, m.role, m.content, n)
+                    for session_id, msg, token_cnt in batch
+                    for m, n in zip(msg, token_cnt or [None] * len(msg), strict=True)
+                ],
+            )
+
+    def get_k_with_token_cnt(
+        self, session_id: str, k: int
+    ) -> List[Tuple[ProteusMessage, Optional[int]]]:
+        if k <= 0:
+            return []
+        retrieved = [
+            (ProteusMessage(role=role, content=content), token_cnt)
+            for role, content, token_cnt in self._db.connection().execute(
+                _SQLITE_SELECT_K_TOKEN_CNT, (session_id, k)
+            )
+        ]
+        retrieved.reverse()
+        return retrieved
+
+    def get_k_many(
+        self, session_ids: List[str], k: int
+    ) -> Dict[str, List[ProteusMessage]]:
+        conn = self._db.connection()
+        # one read transaction gives a consistent view of all sessions. A
+        # savepoint starts one, or nests in a transaction already open.
+        conn.execute("SAVEPOINT get_k_many")
+        try:
+            return {session_id: self.get_k(session_id, k) for session_id in session_ids}
+        finally:
+            conn.execute("RELEASE get_k_many")
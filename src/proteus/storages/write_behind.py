@@ -0,0 +1,206 @@
+import atexit
+from threading import Condition, Lock, Thread
+from time import monotonic
+from typing import Dict, List, Optional, Self, Tuple
+
+from proteus.spec import ProteusMessage
+from proteus.storages.history_store import BaseHistoryStore
+from proteus.utils.logger import logger
+
+# session id, messages, and their token counts if the writer gave them
+_Write = Tuple[str, List[ProteusMessage], Optional[List[int]]]
+
+
+class WriteBehindHistoryStore(BaseHistoryStore):
+    """
+    Queue writes in memory and flush them to the wrapped store in batches from a background thread.
+
+    max_batch: number of queued messages that triggers a flush
+    flush_interval: seconds after which queued messages are flushed anyway
+    get_k merges the queued messages of the session, so a session always reads its own writes.
+    Queued messages are flushed by close(), which also runs at interpreter exit.
+    A failed flush is logged and its messages are retried, after retry_backoff seconds at first, doubling after each failure up to max_retry_backoff.
+    """
+
+    _store: BaseHistoryStore
+    _max_batch: int
+    _flush_interval: float
+    _retry_backoff: float
+    _max_retry_backoff: float
+    _lock: Lock
+    _cond: Condition
+    _flush_lock: Lock
+    _pending: List[_Write]
+    _pending_cnt: int
+    _buffered: Dict[str, int]
+    _closed: bool
+    _thread: Thread
+
+    def __init__(
+        self,
+        store: BaseHistoryStore,
+        max_batch: int = 256,
+        flush_interval: float = 0.5,
+        retry_backoff: float = 0.1,
+        max_retry_backoff: float = 30,
+    ) -> None:
+        self._store = store
+        self._max_batch = max_batch
+        self._flush_interval = flush_interval
+        self._retry_backoff = retry_backoff
+        self._max_retry_backoff = max_retry_backoff
+        self._lock = Lock()
+        self._cond = Condition(self._lock)
+        self._flush_lock = Lock()
+        self._pending = []
+        self._pending_cnt = 0
+        self._buffered = {}
+        self._closed = False
+        self._thread = Thread(
+            target=self._run, name="proteus-write-behind", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _queue(
+        self, session_id: str, msg: List[ProteusMessage], token_cnt: Optional[List[int]]
+    ) -> None:
+        if not msg:
+            return
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("WriteBehindHistoryStore is closed")
+            self._pending.append((session_id, list(msg), token_cnt))
+            self._pending_cnt += len(msg)
+            self._buffered[session_id] = self._buffered.get(session_id, 0) + 1
+            if self._pending_cnt >= self._max_batch:
+                self._cond.notify()
+
+    def extend(self, session_id: str, msg: List[ProteusMessage]) -> None:
+        self._queue(session_id, msg, None)
+
+    def extend_many(self, batch: List[Tuple[str, List[ProteusMessage]]]) -> None:
+        for session_id, msg in batch:
+            self._queue(session_id, msg, None)
+
+    def extend_with_token_cnt(
+        self, session_id: str, msg: List[ProteusMessage], token_cnt: List[int]
+    ) -> None:
+        self._queue(session_id, msg, list(token_cnt))
+
+    def extend_many_with_token_cnt(self, batch: List[_Write]) -> None:
+        for session_id, msg, token_cnt in batch:
+            self._queue(
+                session_id, msg, list(token_cnt) if token_cnt is not None else None
+            )
+
+    def get_k(self, session_id: str, k: int) -> List[ProteusMessage]:
+        if k <= 0:
+            return []
+        with self._lock:
+            buffered = session_id in self._buffered
+        if not buffered:
+            return self._store.get_k(session_id, k)
+        # hold the flush lock so that no batch moves into the store while reading
+        with self._flush_lock:
+            with self._lock:
+                queued = [
+                    m for sid, msg, _ in self._pending if sid == session_id for m in msg
+                ]
+            if len(queued) >= k:
+                return queued[-k:]
+            return self._store.get_k(session_id, k - len(queued)) + queued
+
+    def get_k_with_token_cnt(
+        self, session_id: str, k: int
+    ) -> List[Tuple[ProteusMessage, Optional[int]]]:
+        if k <= 0:
+            return []
+        with self._lock:
+            buffered = session_id in self._buffered
+        if not buffered:
+            return self._store.get_k_with_token_cnt(session_id, k)
+        with self._flush_lock:
+            with self._lock:
+                queued: List[Tuple[ProteusMessage, Optional[int]]] = []
+                for sid, msg, token_cnt in self._pending:
+                    if sid == session_id:
+                        queued.extend(
+                            zip(msg, token_cnt or [None] * len(msg), strict=True)
+                        )
+            if len(queued) >= k:
+                return queued[-k:]
+            return (
+                self._store.get_k_with_token_cnt(session_id, k - len(queued)) + queued
+            )
+
+    def _unbuffer(self, written: List[_Write]) -> None:
+        """Must hold the lock."""
+        for session_id, _, _ in written:
+            left = self._buffered[session_id] - 1
+            if left:
+                self._buffered[session_id] = left
+            else:
+                del self._buffered[session_id]
+
+    def flush(self) -> None:
+        """Write all queued messages to the wrapped store before returning."""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._pending
+                self._pending = []
+                self._pending_cnt = 0
+            if not batch:
+                return
+            try:
+                # writes with and without token counts go in one batch
+                self._store.extend_many_with_token_cnt(batch)
+            except Exception:
+                with self._lock:
+                    self._pending = batch + self._pending
+                    self._pending_cnt += sum(len(msg) for _, msg, _ in batch)
+                raise
+            with self._lock:
+                self._unbuffer(batch)
+
+    def _run(self) -> None:
+        # seconds to wait before retrying a failed flush, 0 while flushes succeed
+        backoff = 0.0
+        while True:
+            with self._lock:
+                deadline = monotonic() + (backoff or self._flush_interval)
+                while (
+                    not self._closed
+                    # a full batch does not cut a backoff short
+                    and (backoff or self._pending_cnt < self._max_batch)
+                    and (remaining := deadline - monotonic()) > 0
+                ):
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                backoff = min(
+                    max(2 * backoff, self._retry_backoff), self._max_retry_backoff
+                )
+                logger.exception("Failed to flush history, retrying in %.2fs", backoff)
+            else:
+                backoff = 0.0
+
+    def close(self) -> None:
+        """Stop the background thread and flush everything still queued."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        atexit.unregister(self.close)
+        self._thread.join()
+        self.flush()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
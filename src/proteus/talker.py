@@ -1,12 +1,21 @@
-from threading import Lock
-from typing import Callable, List, Self
+import asyncio
+from threading import Condition, Lock
+from typing import AsyncIterator, Callable, List, Optional, Self
 from uuid import uuid4
 from weakref import finalize
 
 from proteus.config import LLMsConfig, PromptsConfig
 from proteus.llms import llm_from_config
 from proteus.llms.base import BaseLLM
-from proteus.spec import ProteusMessage, ProteusMessagePrompt, StructSpec
+from proteus.spec import (
+    ProteusLLMResponse,
+    ProteusMessage,
+    ProteusMessagePrompt,
+    ProteusTurn,
+    StructSpec,
+)
+from proteus.timing import SlowTurnLog, TurnTimer
+from proteus.tokens import TokenBudget
 
 
 class ProteusTalkerState(StructSpec, kw_only=True, frozen=True):
@@ -18,12 +27,18 @@ class ProteusTalkerState(StructSpec, kw_only=True, frozen=True):
 class ProteusTalker:
     state: ProteusTalkerState
     _state_lock: Lock
+    # saves run outside the state lock, in the order their turns joined live history
+    _save_cond: Condition
+    _saves_issued: int
+    _saves_done: int
     _prompts_config: PromptsConfig
     _llm: BaseLLM
     _prompt: ProteusMessagePrompt
     _live_history_size: int
     _save_history: Callable[[str, List[ProteusMessage]], None]
     _persist: Callable[[str, bytes], None]
+    _token_budget: Optional[TokenBudget]
+    _slow_turn_log: Optional[SlowTurnLog]
 
     @classmethod
     def create(
@@ -31,6 +46,7 @@ class ProteusTalker:
         message_prompt: ProteusMessagePrompt,
         llms_config: LLMsConfig,
         live_history_size: int = 0,
+        token_budget: Optional[TokenBudget] = None,
     ):
         """Create an independent ProteusTalker which is not managed by ProteusManager"""
         return cls.from_new(
@@ -38,15 +54,19 @@ class ProteusTalker:
             prompts_config=PromptsConfig(prompts={"default": message_prompt}),
             llm=llm_from_config(llms_config),
             live_history_size=live_history_size,
+            token_budget=token_budget,
         )
 
     def _finish_init(self) -> None:
         self._state_lock = Lock()
+        self._save_cond = Condition()
+        self._saves_issued = 0
+        self._saves_done = 0
         self._prompt = self._prompts_config.prompts[self.state.prompt_name]
         finalize(self, self.save)
 
     @classmethod
-    def from_new(
+    def from_new(  # noqa: PLR0913
         cls,
         prompt_name: str,
         prompts_config: PromptsConfig,
@@ -54,6 +74,9 @@ class ProteusTalker:
         live_history_size: int = 0,
         save_history: Callable[[str, List[ProteusMessage]], None] = lambda *args: None,
         persist: Callable[[str, bytes], None] = lambda *args: None,
+        token_budget: Optional[TokenBudget] = None,
+        *,
+        slow_turn_log: Optional[SlowTurnLog] = None,
     ) -> Self:
         _self = cls()
         # state things that can be serialized
@@ -67,12 +90,14 @@ class ProteusTalker:
         _self._live_history_size = live_history_size
         _self._save_history = save_history
         _self._persist = persist
+        _self._token_budget = token_budget
+        _self._slow_turn_log = slow_turn_log
         _self._finish_init()
 
         return _self
 
     @classmethod
-    def from_json(
+    def from_json(  # noqa: PLR0913
         cls,
         state_json: bytes,
         prompt_config: PromptsConfig,
@@ -80,6 +105,9 @@ class ProteusTalker:
         live_history_size: int = 0,
         save_history: Callable[[str, List[ProteusMessage]], None] = lambda *args: None,
         persist: Callable[[str, bytes], None] = lambda *args: None,
+        token_budget: Optional[TokenBudget] = None,
+        *,
+        slow_turn_log: Optional[SlowTurnLog] = None,
     ) -> Self:
         _self = cls()
         _self.state = ProteusTalkerState.from_json(state_json)
@@ -88,6 +116,8 @@ class ProteusTalker:
         _self._live_history_size = live_history_size
         _self._save_history = save_history
         _self._persist = persist
+        _self._token_budget = token_budget
+        _self._slow_turn_log = slow_turn_log
         _self._finish_init()
 
         return _self
@@ -95,37 +125,115 @@ class ProteusTalker:
     def _construct_prompt_msgs(
         self, new_inputs: List[ProteusMessage]
     ) -> List[ProteusMessage]:
+        fixed = self._prompt.identity + self._prompt.instruct + self._prompt.examples
         with self._state_lock:
-            return (
-                self._prompt.identity
-                + self._prompt.instruct
-                + self._prompt.examples
-                + self.state.live_history
-                + new_inputs
-            )
-
-    def _extend_history(self, new_turn: List[ProteusMessage]) -> None:
+            history = list(self.state.live_history)
+        if self._token_budget is not None:
+            # live_history_size still caps the messages kept in live history
+            history = self._token_budget.select_history(fixed + new_inputs, history)
+        return fixed + history + new_inputs
+
+    def _append_live_history(self, new_turn: List[ProteusMessage]) -> int:
+        """Returns the place of the turn in the order of saves."""
         with self._state_lock:
             self.state.live_history.extend(new_turn)
             while len(self.state.live_history) > self._live_history_size:
                 self.state.live_history.pop(0)
+            ticket = self._saves_issued
+            self._saves_issued += 1
+        return ticket
+
+    def _save_in_order(self, ticket: int, new_turn: List[ProteusMessage]) -> None:
+        with self._save_cond:
+            while self._saves_done != ticket:
+                self._save_cond.wait()
+        try:
             self._save_history(self.state.id, new_turn)
+        finally:
+            with self._save_cond:
+                self._saves_done += 1
+                self._save_cond.notify_all()
 
-    async def asay(self, user_input) -> str:
+    def _extend_history(self, new_turn: List[ProteusMessage]) -> None:
+        ticket = self._append_live_history(new_turn)
+        # saving may be slow, keep it out of the state lock
+        self._save_in_order(ticket, new_turn)
+
+    async def _aextend_history(self, new_turn: List[ProteusMessage]) -> None:
+        ticket = self._append_live_history(new_turn)
+        # saving and waiting for earlier saves may block, keep both off the event loop
+        await asyncio.to_thread(self._save_in_order, ticket, new_turn)
+
+    def _finish_turn(
+        self,
+        timer: TurnTimer,
+        user_input: str,
+        resp: ProteusLLMResponse,
+        msgs: List[ProteusMessage],
+    ) -> ProteusTurn:
+        turn = timer.finish(resp.message.content, resp.token_cnt, msgs)
+        if self._slow_turn_log is not None:
+            self._slow_turn_log.record(
+                turn, self.state.id, self.state.prompt_name, user_input
+            )
+        return turn
+
+    async def _afinish_turn(
+        self,
+        timer: TurnTimer,
+        user_input: str,
+        resp: ProteusLLMResponse,
+        msgs: List[ProteusMessage],
+    ) -> ProteusTurn:
+        turn = timer.finish(resp.message.content, resp.token_cnt, msgs)
+        if self._slow_turn_log is not None:
+            await self._slow_turn_log.arecord(
+                turn, self.state.id, self.state.prompt_name, user_input
+            )
+        return turn
+
+    async def asay_ex(self, user_input) -> ProteusTurn:
+        """Like asay, and also time the stages "prompt", "llm" and "save"."""
+        timer = TurnTimer()
         new_turn = [ProteusMessage(role="user", content=user_input)]
-        msgs = self._construct_prompt_msgs(new_inputs=new_turn)
-        resp = await self._llm.arequest(msgs)
+        with timer.stage("prompt"):
+            msgs = self._construct_prompt_msgs(new_inputs=new_turn)
+        with timer.stage("llm"):
+            resp = await self._llm.arequest(msgs)
         new_turn.append(resp.message)
-        self._extend_history(new_turn)
-        return resp.message.content
+        with timer.stage("save"):
+            await self._aextend_history(new_turn)
+        return await self._afinish_turn(timer, user_input, resp, msgs)
 
-    def say(self, user_input) -> str:
+    async def asay(self, user_input) -> str:
+        return (await self.asay_ex(user_input)).reply
+
+    async def asay_stream(self, user_input) -> AsyncIterator[str]:
+        """Yield the reply in chunks. The whole reply joins the history once the stream ends."""
         new_turn = [ProteusMessage(role="user", content=user_input)]
         msgs = self._construct_prompt_msgs(new_inputs=new_turn)
-        resp = self._llm.request(msgs)
+        chunks = []
+        async for chunk in self._llm.astream(msgs):
+            chunks.append(chunk)
+            yield chunk
+        new_turn.append(ProteusMessage(role="assistant", content="".join(chunks)))
+        await self._aextend_history(new_turn)
+
+    def say_ex(self, user_input) -> ProteusTurn:
+        """Like say, and also time the stages "prompt", "llm" and "save"."""
+        timer = TurnTimer()
+        new_turn = [ProteusMessage(role="user", content=user_input)]
+        with timer.stage("prompt"):
+            msgs = self._construct_prompt_msgs(new_inputs=new_turn)
+        with timer.stage("llm"):
+            resp = self._llm.request(msgs)
         new_turn.append(resp.message)
-        self._extend_history(new_turn)
-        return resp.message.content
+        with timer.stage("save"):
+            self._extend_history(new_turn)
+        return self._finish_turn(timer, user_input, resp, msgs)
+
+    def say(self, user_input) -> str:
+        return self.say_ex(user_input).reply
 
     def clear(self) -> None:
         with self._state_lock:
@@ -1,64 +1,253 @@
-from typing import List, Union
-
-import yaml
+from typing import Iterator, List, Optional, Tuple, Union
 
 from proteus.llms.base import BaseLLM
-from proteus.spec import ProteusMessage, ProteusMessagePrompt
-from proteus.storages.history_store import BaseHistoryStore
+from proteus.spec import (
+    ProteusLLMResponse,
+    ProteusMessage,
+    ProteusMessagePrompt,
+    ProteusTurn,
+)
+from proteus.storages.history_store import (
+    BaseAsyncHistoryStore,
+    BaseHistoryStore,
+    ThreadedHistoryStore,
+)
+from proteus.timing import SlowTurnLog, TurnTimer, stage
+from proteus.tokens import TokenBudget
+
+
+class _AsyncOnlyHistoryStore(BaseHistoryStore):
+    def extend(self, session_id: str, msg: List[ProteusMessage]) -> None:
+        raise TypeError("This teller has an async history store, use asay")
+
+    def get_k(self, session_id: str, k: int) -> List[ProteusMessage]:
+        raise TypeError("This teller has an async history store, use asay")
 
 
 class ProteusTeller:
-    """This is stateless and thread-safe."""
+    """
+    This is stateless and thread-safe.
+
+    history: with a sync store, asay runs its calls in the default executor. With an async store, only the async methods can be used.
+    token_budget: if set, history is filled newest-first until the whole prompt reaches the token limit, and live_history_size only caps how many messages are fetched.
+    prompt_name: name of prompt, only used in the slow-turn log
+    slow_turn_log: if set, turns slower than its threshold are logged to it
+    """
 
     id: str
     _llm: BaseLLM
     _prompt: ProteusMessagePrompt
     _history: BaseHistoryStore
+    _ahistory: BaseAsyncHistoryStore
     _live_history_size: int
     _save_history: bool
+    _token_budget: Optional[TokenBudget]
+    _prompt_name: Optional[str]
+    _slow_turn_log: Optional[SlowTurnLog]
 
-    def __init__(
+    def __init__(  # noqa: PLR0913
         self,
         id: str,
         llm: BaseLLM,
         prompt: ProteusMessagePrompt,
-        history: BaseHistoryStore,
+        history: Union[BaseHistoryStore, BaseAsyncHistoryStore],
         live_history_size: int = 0,
         save_history: bool = True,
+        token_budget: Optional[TokenBudget] = None,
+        *,
+        prompt_name: Optional[str] = None,
+        slow_turn_log: Optional[SlowTurnLog] = None,
     ) -> None:
         self.id = id
         self._llm = llm
         self._prompt = prompt
-        self._history = history
+        if isinstance(history, BaseAsyncHistoryStore):
+            self._history = _AsyncOnlyHistoryStore()
+            self._ahistory = history
+        else:
+            self._history = history
+            self._ahistory = ThreadedHistoryStore(history)
         self._live_history_size = live_history_size
         self._save_history = save_history
+        self._token_budget = token_budget
+        self._prompt_name = prompt_name
+        self._slow_turn_log = slow_turn_log
+
+    def _remember_token_cnt(
+        self, stored: List[Tuple[ProteusMessage, Optional[int]]]
+    ) -> List[ProteusMessage]:
+        assert self._token_budget is not None
+        counter = self._token_budget.counter
+        history = []
+        for m, token_cnt in stored:
+            if token_cnt is not None:
+                counter.remember(m, token_cnt)
+            history.append(m)
+        return history
+
+    def _get_history(self) -> List[ProteusMessage]:
+        with stage("history"):
+            if self._token_budget is None:
+                return self._history.get_k(self.id, self._live_history_size)
+            stored = self._history.get_k_with_token_cnt(
+                self.id, self._live_history_size
+            )
+        return self._remember_token_cnt(stored)
+
+    async def _aget_history(self) -> List[ProteusMessage]:
+        with stage("history"):
+            if self._token_budget is None:
+                return await self._ahistory.get_k(self.id, self._live_history_size)
+            stored = await self._ahistory.get_k_with_token_cnt(
+                self.id, self._live_history_size
+            )
+        return self._remember_token_cnt(stored)
+
+    def _assemble(
+        self, new_inputs: List[ProteusMessage], history: List[ProteusMessage]
+    ) -> List[ProteusMessage]:
+        fixed = self._prompt.identity + self._prompt.instruct + self._prompt.examples
+        if self._token_budget is not None:
+            history = self._token_budget.select_history(fixed + new_inputs, history)
+        return fixed + history + new_inputs
 
     def construct_prompt_msgs(
         self, new_inputs: List[ProteusMessage]
     ) -> List[ProteusMessage]:
         """Default implementation. Override this if you want to customize the prompt."""
-        return (
-            self._prompt.identity
-            + self._prompt.instruct
-            + self._prompt.examples
-            + self._history.get_k(self.id, self._live_history_size)
-            + new_inputs
+        return self._assemble(new_inputs, self._get_history())
+
+    async def aconstruct_prompt_msgs(
+        self, new_inputs: List[ProteusMessage]
+    ) -> List[ProteusMessage]:
+        """
+        Async version of construct_prompt_msgs, used by asay.
+
+        If only construct_prompt_msgs is overridden, it is run in the default
+        executor, which needs a sync history store. Override this too to avoid that.
+        """
+        if type(self).construct_prompt_msgs is not ProteusTeller.construct_prompt_msgs:
+            if isinstance(self._history, _AsyncOnlyHistoryStore):
+                raise TypeError(
+                    f"{type(self).__name__} overrides construct_prompt_msgs and has an async history store, override aconstruct_prompt_msgs too"
+                )
+            # only awaited inside a running loop, so asyncio is already loaded
+            import asyncio  # noqa: PLC0415
+
+            return await asyncio.to_thread(self.construct_prompt_msgs, new_inputs)
+        return self._assemble(new_inputs, await self._aget_history())
+
+    def _token_cnt(self, new_turn: List[ProteusMessage]) -> List[int]:
+        assert self._token_budget is not None
+        counter = self._token_budget.counter
+        return [counter.count(m) for m in new_turn]
+
+    def _extend_history(self, new_turn: List[ProteusMessage]) -> None:
+        if self._token_budget is None:
+            self._history.extend(self.id, new_turn)
+            return
+        self._history.extend_with_token_cnt(
+            self.id, new_turn, self._token_cnt(new_turn)
+        )
+
+    async def _aextend_history(self, new_turn: List[ProteusMessage]) -> None:
+        if self._token_budget is None:
+            await self._ahistory.extend(self.id, new_turn)
+            return
+        await self._ahistory.extend_with_token_cnt(
+            self.id, new_turn, self._token_cnt(new_turn)
         )
 
+    def _finish_turn(
+        self,
+        timer: TurnTimer,
+        user_input: str,
+        resp: ProteusLLMResponse,
+        msgs: List[ProteusMessage],
+    ) -> ProteusTurn:
+        turn = timer.finish(resp.message.content, resp.token_cnt, msgs)
+        if self._slow_turn_log is not None:
+            self._slow_turn_log.record(turn, self.id, self._prompt_name, user_input)
+        return turn
+
+    async def _afinish_turn(
+        self,
+        timer: TurnTimer,
+        user_input: str,
+        resp: ProteusLLMResponse,
+        msgs: List[ProteusMessage],
+    ) -> ProteusTurn:
+        turn = timer.finish(resp.message.content, resp.token_cnt, msgs)
+        if self._slow_turn_log is not None:
+            await self._slow_turn_log.arecord(
+                turn, self.id, self._prompt_name, user_input
+            )
+        return turn
+
     def say(self, user_input: str) -> str:
+        return self.say_ex(user_input).reply
+
+    def say_ex(self, user_input: str) -> ProteusTurn:
+        """Like say, and also time the stages "prompt", "history", "llm" and "save"."""
+        timer = TurnTimer()
+        new_turn = [ProteusMessage(role="user", content=user_input)]
+        with timer.current(), timer.stage("prompt"):
+            msgs = self.construct_prompt_msgs(new_inputs=new_turn)
+        with timer.stage("llm"):
+            resp = self._llm.request(msgs)
+        if self._save_history:
+            with timer.stage("save"):
+                self._extend_history([*new_turn, resp.message])
+        return self._finish_turn(timer, user_input, resp, msgs)
+
+    async def asay(self, user_input: str) -> str:
+        """Async version of say, which never blocks the event loop if the LLM and the history store do not."""
+        return (await self.asay_ex(user_input)).reply
+
+    async def asay_ex(self, user_input: str) -> ProteusTurn:
+        """Async version of say_ex."""
+        timer = TurnTimer()
+        new_turn = [ProteusMessage(role="user", content=user_input)]
+        with timer.current(), timer.stage("prompt"):
+            msgs = await self.aconstruct_prompt_msgs(new_inputs=new_turn)
+        with timer.stage("llm"):
+            resp = await self._llm.arequest(msgs)
+        if self._save_history:
+            with timer.stage("save"):
+                await self._aextend_history([*new_turn, resp.message])
+        return await self._afinish_turn(timer, user_input, resp, msgs)
+
+    def say_stream(self, user_input: str) -> Iterator[str]:
+        """Yield the reply in chunks. The whole reply is saved to history once the stream ends."""
         new_turn = [ProteusMessage(role="user", content=user_input)]
         msgs = self.construct_prompt_msgs(new_inputs=new_turn)
-        resp = self._llm.request(msgs)
+        chunks = []
+        for chunk in self._llm.stream(msgs):
+            chunks.append(chunk)
+            yield chunk
         if self._save_history:
-            self._history.extend(self.id, [*new_turn, resp.message])
-        return resp.message.content
+            self._extend_history(
+                [*new_turn, ProteusMessage(role="assistant", content="".join(chunks))]
+            )
 
-    def say_with_template(
+    def _apply_template(
         self, user_input: Union[str, dict, list], template_name: str
     ) -> str:
         if isinstance(user_input, str):
             str_input = user_input
         else:
+            import yaml  # noqa: PLC0415
+
             str_input = yaml.dump(user_input, allow_unicode=True, sort_keys=False)
         temp_input = self._prompt.templates.get(template_name, "{input}")
-        return self.say(temp_input.format(input=str_input))
+        return temp_input.format(input=str_input)
+
+    def say_with_template(
+        self, user_input: Union[str, dict, list], template_name: str
+    ) -> str:
+        return self.say(self._apply_template(user_input, template_name))
+
+    async def asay_with_template(
+        self, user_input: Union[str, dict, list], template_name: str
+    ) -> str:
+        return await self.asay(self._apply_template(user_input, template_name))
@@ -0,0 +1,181 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import msgspec
+
+from proteus.spec import ProteusMessage, ProteusTurn, TurnStage
+
+# timer of the turn running in this thread or task, for stages deep in overridable code
+_current: ContextVar[Optional["TurnTimer"]] = ContextVar(
+    "proteus_turn_timer", default=None
+)
+
+
+class TurnTimer:
+    """
+    Collect the stages of one turn.
+
+    A stage started within another one pauses it until it ends, so the stages
+    never overlap and the outer one may be recorded in several pieces.
+    """
+
+    started_at: float
+    stages: List[TurnStage]
+    # open stages, innermost last, with the start of their running piece
+    _open: List[Tuple[str, float]]
+
+    def __init__(self) -> None:
+        self.started_at = time.monotonic()
+        self.stages = []
+        self._open = []
+
+    def _end_piece(self, end: float) -> None:
+        name, start = self._open[-1]
+        self.stages.append(TurnStage(name=name, start=start, end=end))
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        now = time.monotonic()
+        if self._open:
+            self._end_piece(now)
+        self._open.append((name, now))
+        try:
+            yield
+        finally:
+            now = time.monotonic()
+            self._end_piece(now)
+            self._open.pop()
+            if self._open:
+                self._open[-1] = (self._open[-1][0], now)
+
+    @contextmanager
+    def current(self) -> Iterator[None]:
+        """Make this the timer that `stage` reports to."""
+        token = _current.set(self)
+        try:
+            yield
+        finally:
+            _current.reset(token)
+
+    def finish(
+        self, reply: str, token_cnt: Optional[int], prompt: List[ProteusMessage]
+    ) -> ProteusTurn:
+        return ProteusTurn(
+            reply=reply,
+            token_cnt=token_cnt,
+            started_at=self.started_at,
+            ended_at=time.monotonic(),
+            stages=self.stages,
+            prompt_messages=len(prompt),
+            prompt_chars=sum(len(m.content) for m in prompt),
+        )
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a stage of the current turn, if it is being timed."""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+class SlowTurn(msgspec.Struct, kw_only=True):
+    """Line of the slow-turn log. Times are in seconds."""
+
+    time: float
+    session_id: str
+    prompt_name: Optional[str]
+    duration: float
+    stages: Dict[str, float]
+    input_chars: int
+    prompt_messages: int
+    prompt_chars: int
+    reply_chars: int
+    token_cnt: Optional[int]
+
+
+class SlowTurnLog:
+    """
+    Append turns that took longer than threshold seconds to a JSONL file.
+
+    Each line is a SlowTurn, with the seconds per stage of the turn.
+    """
+
+    threshold: float
+    _path: Path
+    _lock: Lock
+    _encoder: msgspec.json.Encoder
+
+    def __init__(self, path: Path, threshold: float) -> None:
+        self.threshold = threshold
+        self._path = path
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        self._encoder = msgspec.json.Encoder()
+
+    def _encode(
+        self,
+        turn: ProteusTurn,
+        session_id: str,
+        prompt_name: Optional[str],
+        user_input: str,
+    ) -> Optional[bytes]:
+        """The log line of turn, or None if it was not slow."""
+        if turn.duration < self.threshold:
+            return None
+        return self._encoder.encode(
+            SlowTurn(
+                time=time.time(),
+                session_id=session_id,
+                prompt_name=prompt_name,
+                duration=turn.duration,
+                stages=turn.breakdown(),
+                input_chars=len(user_input),
+                prompt_messages=turn.prompt_messages,
+                prompt_chars=turn.prompt_chars,
+                reply_chars=len(turn.reply),
+                token_cnt=turn.token_cnt,
+            )
+        )
+
+    def _write(self, line: bytes) -> None:
+        # slow turns are rare, so the file is only open while writing one
+        with self._lock, self._path.open("ab") as f:
+            f.write(line + b"\n")
+
+    def record(
+        self,
+        turn: ProteusTurn,
+        session_id: str,
+        prompt_name: Optional[str],
+        user_input: str,
+    ) -> None:
+        line = self._encode(turn, session_id, prompt_name, user_input)
+        if line is not None:
+            self._write(line)
+
+    async def arecord(
+        self,
+        turn: ProteusTurn,
+        session_id: str,
+        prompt_name: Optional[str],
+        user_input: str,
+    ) -> None:
+        """Like record, writing the line in the default executor instead of blocking the event loop."""
+        line = self._encode(turn, session_id, prompt_name, user_input)
+        if line is None:
+            return
+        # a loop is running whenever this is awaited, so asyncio is already loaded
+        import asyncio  # noqa: PLC0415
+
+        await asyncio.to_thread(self._write, line)
+
+
+__all__ = ["SlowTurn", "SlowTurnLog", "TurnTimer", "stage"]
@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, List, Optional
+
+from proteus.spec import ProteusMessage
+
+Tokenizer = Callable[[str], int]
+
+
+def approx_token_count(text: str) -> int:
+    """Rough estimate of four characters per token, used when no tokenizer is given."""
+    return (len(text) + 3) // 4
+
+
+class TokenCounter:
+    """
+    Count the tokens of messages, memoizing the count of each message.
+
+    tokenizer: returns the number of tokens of a text, e.g. `lambda s: len(enc.encode(s))` with tiktoken
+    message_overhead: tokens added per message for the role and separators of the chat format
+    capacity: number of memoized counts. -1 means unlimited.
+    """
+
+    _tokenizer: Tokenizer
+    _message_overhead: int
+    _capacity: int
+    _counts: OrderedDict[ProteusMessage, int]
+    _counts_lock: Lock
+
+    def __init__(
+        self,
+        tokenizer: Tokenizer = approx_token_count,
+        message_overhead: int = 4,
+        capacity: int = 65536,
+    ) -> None:
+        self._tokenizer = tokenizer
+        self._message_overhead = message_overhead
+        self._capacity = capacity
+        self._counts = OrderedDict()
+        self._counts_lock = Lock()
+
+    def remember(self, msg: ProteusMessage, token_cnt: int) -> None:
+        """Seed the count of a message, e.g. one persisted by a history store."""
+        with self._counts_lock:
+            self._counts[msg] = token_cnt
+            self._counts.move_to_end(msg)
+            while 0 <= self._capacity < len(self._counts):
+                self._counts.popitem(last=False)
+
+    def count(self, msg: ProteusMessage) -> int:
+        with self._counts_lock:
+            token_cnt = self._counts.get(msg)
+            if token_cnt is not None:
+                self._counts.move_to_end(msg)
+                return token_cnt
+        token_cnt = self._tokenizer(msg.content) + self._message_overhead
+        self.remember(msg, token_cnt)
+        return token_cnt
+
+    def count_all(self, msgs: List[ProteusMessage]) -> int:
+        return sum(self.count(m) for m in msgs)
+
+
+class TokenBudget:
+    """Limit of tokens for a whole prompt, filled with history newest-first."""
+
+    limit: int
+    counter: TokenCounter
+
+    def __init__(self, limit: int, counter: Optional[TokenCounter] = None) -> None:
+        self.limit = limit
+        self.counter = counter if counter is not None else TokenCounter()
+
+    def select_history(
+        self,
+        fixed: List[ProteusMessage],
+        history: List[ProteusMessage],
+    ) -> List[ProteusMessage]:
+        """Return the newest messages of history that fit next to the fixed part of the prompt."""
+        remaining = self.limit - self.counter.count_all(fixed)
+        start = len(history)
+        while start > 0:
+            token_cnt = self.counter.count(history[start - 1])
+            if token_cnt > remaining:
+                break
+            remaining -= token_cnt
+            start -= 1
+        return history[start:]
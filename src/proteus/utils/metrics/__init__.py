@@ -0,0 +1,263 @@
+from abc import abstractmethod
+from bisect import bisect_left
+from threading import Lock
+from typing import Any, Callable, Dict, List, Literal, Tuple
+
+MetricKind = Literal["counter", "gauge", "histogram"]
+# label names and values, sorted by name
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# seconds, from a cache hit to a slow generation
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted(labels.items()))
+
+
+# help texts escape backslashes and newlines, label values also escape quotes
+def _escape_help(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape(value: str) -> str:
+    return _escape_help(value).replace('"', '\\"')
+
+
+def _format_labels(key: LabelKey, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind: MetricKind
+    name: str
+    help: str
+    _lock: Lock
+    _functions: Dict[LabelKey, Callable[[], float]]
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._lock = Lock()
+        self._functions = {}
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        """Read the value from function whenever the metric is exported."""
+        with self._lock:
+            self._functions[_label_key(labels)] = function
+
+    @abstractmethod
+    def _samples(self) -> Dict[LabelKey, Any]: ...
+
+
+class _Value(_Metric):
+    _values: Dict[LabelKey, float]
+
+    def __init__(self, name: str, help: str) -> None:
+        super().__init__(name, help)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> Dict[LabelKey, Any]:
+        with self._lock:
+            samples: Dict[LabelKey, Any] = dict(self._values)
+            functions = list(self._functions.items())
+        for key, function in functions:
+            samples[key] = function()
+        return samples
+
+
+class Counter(_Value):
+    kind = "counter"
+
+
+class Gauge(_Value):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "count", "sum")
+
+    # count per bucket, not cumulative, the last one is +Inf
+    buckets: List[int]
+    count: int
+    sum: float
+
+    def __init__(self, size: int) -> None:
+        self.buckets = [0] * size
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+    _bounds: Tuple[float, ...]
+    _values: Dict[LabelKey, _HistogramValue]
+
+    def __init__(
+        self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, help)
+        self._bounds = (*sorted(buckets), float("inf"))
+        self._values = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_key(labels)
+        i = bisect_left(self._bounds, value)
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = _HistogramValue(len(self._bounds))
+            histogram.buckets[i] += 1
+            histogram.count += 1
+            histogram.sum += value
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        raise TypeError("A histogram cannot be read from a function")
+
+    def _samples(self) -> Dict[LabelKey, Any]:
+        samples = {}
+        with self._lock:
+            for key, histogram in self._values.items():
+                cumulative = 0
+                buckets = {}
+                for bound, n in zip(self._bounds, histogram.buckets, strict=True):
+                    cumulative += n
+                    buckets[_format_value(bound)] = cumulative
+                samples[key] = {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "buckets": buckets,
+                }
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Named counters, gauges and histograms, exported as Prometheus text or as a snapshot dict.
+
+    Recording takes a lock and a dict lookup, so it is cheap enough for every
+    request. Values that a component already tracks can be read on export with
+    `set_function` instead.
+    """
+
+    _metrics: Dict[str, _Metric]
+    _lock: Lock
+
+    def __init__(self) -> None:
+        self._metrics = {}
+        self._lock = Lock()
+
+    def _get(self, cls: type, name: str, help: str, **kwargs: Any) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str = "") -> Gauge:
+        return self._get(Gauge, name, help)
+
+    def histogram(
+        self, name: str, help: str = "", buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def _sorted_metrics(self) -> List[_Metric]:
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        {name: {"type", "help", "samples": [{"labels", "value"}]}}.
+
+        The value of a histogram sample is {"count", "sum", "buckets"}, with
+        cumulative counts keyed by upper bound.
+        """
+        return {
+            metric.name: {
+                "type": metric.kind,
+                "help": metric.help,
+                "samples": [
+                    {"labels": dict(key), "value": value}
+                    for key, value in sorted(metric._samples().items())
+                ],
+            }
+            for metric in self._sorted_metrics()
+        }
+
+    def prometheus(self) -> str:
+        """Text exposition format of Prometheus."""
+        lines = []
+        for metric in self._sorted_metrics():
+            if metric.help:
+                lines.append(f"# HELP {metric.name} {_escape_help(metric.help)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for key, value in sorted(metric._samples().items()):
+                if metric.kind != "histogram":
+                    lines.append(
+                        f"{metric.name}{_format_labels(key)} {_format_value(value)}"
+                    )
+                    continue
+                for bound, n in value["buckets"].items():
+                    labels = _format_labels(key, f'le="{bound}"')
+                    lines.append(f"{metric.name}_bucket{labels} {n}")
+                labels = _format_labels(key)
+                lines.append(f"{metric.name}_sum{labels} {_format_value(value['sum'])}")
+                lines.append(f"{metric.name}_count{labels} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+
+# shared by the instrumented wrappers unless they are given another registry
+registry = MetricsRegistry()
+
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "MetricsRegistry",
+    "registry",
+]
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from pathlib import Path
+from typing import Dict, List, Set
+
+import pytest
+
+from proteus.batch import (
+    BatchProgress,
+    BatchResult,
+    SessionAborted,
+    collect_batch,
+    run_batch,
+)
+from proteus.config import LLMsConfig, ManagerConfig, PromptsConfig
+from proteus.manager import ProteusManager
+from proteus.spec import ProteusMessage, ProteusMessagePrompt
+
+CONCURRENCY = 3
+
+
+def test_run_batch():
+    said: Dict[str, List[str]] = {}
+    active = peak = 0
+
+    async def say(session_id: str, user_input: str) -> str:
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if user_input == "fail":
+            raise ValueError(user_input)
+        said.setdefault(session_id, []).append(user_input)
+        return user_input.upper()
+
+    items = [(f"s{i % 5}", f"{i // 5}") for i in range(20)]
+    items.insert(3, ("s0", "fail"))
+    progress: List[int] = []
+
+    def on_progress(p: BatchProgress) -> None:
+        progress.append(p.done)
+
+    results = asyncio.run(collect_batch(say, items, CONCURRENCY, on_progress))
+    assert [(r.session_id, r.user_input) for r in results] == items
+    assert peak == CONCURRENCY
+    assert progress == list(range(1, len(items) + 1))
+    # the inputs of each session ran in order, and s0 stopped at its failure
+    assert said["s0"] == ["0"]
+    assert said["s1"] == ["0", "1", "2", "3"]
+    assert results[0].reply == "0"
+    assert isinstance(results[3].error, ValueError)
+    aborted = [r for r in results if isinstance(r.error, SessionAborted)]
+    assert [r.user_input for r in aborted] == ["1", "2", "3"]
+
+
+def test_run_batch_concurrency():
+    async def say(session_id: str, user_input: str) -> str:
+        return user_input
+
+    # raised on the call, before any input is read
+    for concurrency in (0, -2):
+        with pytest.raises(ValueError, match="concurrency"):
+            run_batch(say, [("a", "x")], concurrency)
+    assert [r.reply for r in asyncio.run(collect_batch(say, [("a", "x")], -1))] == ["x"]
+
+
+def test_manager_run_batch(tmp_path: Path):
+    manager = ProteusManager(
+        LLMsConfig(
+            simulated=LLMsConfig.SimulatedConfig(
+                latency_ms=0, latency_sigma=0, tokens_per_second=-1, reply_tokens=2
+            )
+        ),
+        PromptsConfig(prompts={"default": ProteusMessagePrompt()}),
+        ManagerConfig(
+            live_history_size=4,
+            cache_folder=str(tmp_path),
+            cache_history_enabled=True,
+            cache_talkers_enabled=True,
+            cache_talkers_mem_capacity=1,
+            cache_backend="sqlite",
+        ),
+        llm_name="simulated",
+    )
+    saving_threads: Set[int] = set()
+    extend = manager.history_store.extend
+
+    def recording_extend(session_id: str, msg: List[ProteusMessage]) -> None:
+        saving_threads.add(threading.get_ident())
+        extend(session_id, msg)
+
+    manager.history_store.extend = recording_extend  # type: ignore[method-assign]
+    ids = [manager.new_talker("default") for _ in range(CONCURRENCY)]
+    items = [(id, text) for text in ("one", "two") for id in ids]
+    items.append(("missing", "three"))
+
+    async def run() -> List[BatchResult]:
+        # one session at a time, so a talker is only evicted between its sessions
+        return [r async for r in manager.run_batch(items, 1)]
+
+    results = sorted(asyncio.run(run()), key=lambda r: r.index)
+    assert [r.ok for r in results] == [True] * (len(items) - 1) + [False]
+    assert isinstance(results[-1].error, KeyError)
+    # talkers evicted to SQLite were loaded back, and kept their live history
+    for id in ids:
+        talker = manager.get_talker(id)
+        assert talker is not None
+        assert [m.content for m in talker.state.live_history][::2] == ["one", "two"]
+        assert len(manager.history_store.get_k(id, 10)) == len(["one", "two"]) * 2
+    # the history was saved in worker threads, not on the event loop
+    assert saving_threads
+    assert threading.get_ident() not in saving_threads
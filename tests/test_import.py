@@ -0,0 +1,19 @@
+import json
+import subprocess
+import sys
+
+# optional or slow to import, none of them is needed by the base package
+HEAVY_MODULES = ["asyncio", "httpx", "multiprocessing", "psycopg_pool", "xdg", "yaml"]
+
+
+def test_lazy_imports():
+    code = (
+        "import json, sys\n"
+        "from proteus import LLMsConfig, ProteusTeller, history_store, llm_from_config\n"
+        "print(json.dumps(sorted(sys.modules)))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, check=True, text=True
+    )
+    loaded = set(json.loads(result.stdout))
+    assert [m for m in HEAVY_MODULES if m in loaded] == []
@@ -0,0 +1,385 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock, current_thread
+from typing import AsyncIterator, ClassVar, Iterator, List, Optional, Set
+
+import pytest
+
+from proteus.config import LLMsConfig
+from proteus.llms import dashscope
+from proteus.llms.base import BaseLLM
+from proteus.llms.batching import MicroBatcher
+from proteus.llms.cache import CachedLLM
+from proteus.llms.coalesce import CoalescingLLM
+from proteus.llms.governor import GovernedLLM
+from proteus.llms.pool import ThreadPoolLLM
+from proteus.llms.router import RouterLLM
+from proteus.llms.simulated import SimulatedLLM
+from proteus.spec import ProteusLLMResponse, ProteusMessage
+
+MESSAGES = [ProteusMessage(role="user", content="Hi")]
+DELAY = 0.1
+
+
+class SleepLLM(BaseLLM):
+    """Blocks for a while and echoes the last message."""
+
+    def __init__(self, delay: float = 0.05) -> None:
+        self.delay = delay
+        self.calls = 0
+        self._lock = Lock()
+
+    async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        return self.request(messages)
+
+    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return ProteusLLMResponse(
+            message=ProteusMessage(role="assistant", content=messages[-1].content)
+        )
+
+
+class FailingLLM(SleepLLM):
+    down = True
+
+    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        response = super().request(messages)
+        if self.down:
+            raise ConnectionError("down")
+        return response
+
+
+class RateLimitError(Exception):
+    class Response:
+        status_code = 429
+        headers: ClassVar = {"retry-after-ms": "10"}
+
+    response = Response()
+
+
+class RateLimitedLLM(SleepLLM):
+    """Rejects the first request of each prompt, and records the peak concurrency."""
+
+    def __init__(self, delay: float = 0.05) -> None:
+        super().__init__(delay)
+        self.seen: Set[str] = set()
+        self.active = 0
+        self.peak = 0
+
+    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            rejected = messages[-1].content not in self.seen
+            self.seen.add(messages[-1].content)
+        try:
+            response = super().request(messages)
+        finally:
+            with self._lock:
+                self.active -= 1
+        if rejected:
+            raise RateLimitError
+        return response
+
+
+class AsyncSleepLLM(SleepLLM):
+    async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        with self._lock:
+            self.calls += 1
+        await asyncio.sleep(self.delay)
+        return ProteusLLMResponse(
+            message=ProteusMessage(role="assistant", content=str(self.delay))
+        )
+
+
+def test_thread_pool():
+    llm = ThreadPoolLLM(SleepLLM(DELAY), max_workers=4, max_pending=0)
+
+    async def run() -> List[ProteusLLMResponse]:
+        return await asyncio.gather(*[llm.arequest(MESSAGES) for _ in range(8)])
+
+    start = time.monotonic()
+    responses = asyncio.run(run())
+    # two rounds of four workers, instead of eight sequential requests
+    assert time.monotonic() - start < 6 * DELAY
+    assert {r.message.content for r in responses} == {"Hi"}
+    assert llm.request(MESSAGES).message.content == "Hi"
+    llm.shutdown()
+
+
+class ChunkLLM(SleepLLM):
+    """Streams the last message one character at a time, and records the threads."""
+
+    def __init__(self, delay: float = 0.05) -> None:
+        super().__init__(delay)
+        self.threads: Set[str] = set()
+
+    def stream(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        self.threads.add(current_thread().name)
+        yield from messages[-1].content
+
+    async def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        for chunk in messages[-1].content:
+            yield chunk
+
+
+def test_thread_pool_stream():
+    inner = ChunkLLM(0)
+    llm = ThreadPoolLLM(inner)
+    assert list(llm.stream(MESSAGES)) == ["H", "i"]
+
+    async def run() -> List[str]:
+        return [chunk async for chunk in llm.astream(MESSAGES)]
+
+    assert asyncio.run(run()) == ["H", "i"]
+    # the chunks came from the pool, not from the caller or the default executor
+    assert {name.split("_")[0] for name in inner.threads} == {"proteus-llm"}
+    llm.shutdown()
+
+
+def test_micro_batcher():
+    batches: List[List[int]] = []
+
+    def process(items: List[int]) -> List[int]:
+        batches.append(items)
+        return [i * 2 for i in items]
+
+    batcher = MicroBatcher(process, max_batch_size=4, max_wait=DELAY)
+    futures = [batcher.submit(i) for i in range(6)]
+    assert [f.result() for f in futures] == [0, 2, 4, 6, 8, 10]
+    assert batches == [[0, 1, 2, 3], [4, 5]]
+    batcher.close()
+
+
+def test_simulated_llm():
+    config = LLMsConfig.SimulatedConfig(
+        latency_ms=DELAY * 1000, latency_sigma=0, tokens_per_second=-1, reply_tokens=3
+    )
+    llm = SimulatedLLM(config)
+    start = time.monotonic()
+    response = llm.request(MESSAGES)
+    assert time.monotonic() - start >= DELAY
+    assert (
+        response.token_cnt
+        == len(response.message.content.split())
+        == config.reply_tokens
+    )
+    assert "".join(llm.stream(MESSAGES)) == response.message.content
+
+
+def test_cached_llm(tmp_path: Path):
+    inner = SleepLLM(0)
+    config = LLMsConfig.DashScopeConfig(parameters={"temperature": 0})
+    llm = CachedLLM(inner, config, cache_folder=tmp_path)
+    assert llm.request(MESSAGES) == llm.request(MESSAGES)
+    assert (inner.calls, llm.hits, llm.misses) == (1, 1, 1)
+    # a new process finds the reply on disk
+    assert CachedLLM(inner, config, cache_folder=tmp_path).request(MESSAGES)
+    assert inner.calls == 1
+
+    sampled = LLMsConfig.DashScopeConfig(parameters={"temperature": 0.8})
+    # without a temperature, the provider default samples
+    for config in (sampled, LLMsConfig.OpenAIConfig()):
+        llm = CachedLLM(inner, config)
+        llm.request(MESSAGES)
+        llm.request(MESSAGES)
+    assert inner.calls == 1 + 2 + 2
+    llm = CachedLLM(inner, sampled, ttl=0, force=True)
+    llm.request(MESSAGES)
+    llm.request(MESSAGES)
+    assert inner.calls == 1 + 2 + 2 + 2
+
+
+class ThreadRecordingCache(CachedLLM):
+    disk_threads: List[str]
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.disk_threads = []
+
+    def _lookup_disk(self, key: str) -> Optional[ProteusLLMResponse]:
+        self.disk_threads.append(current_thread().name)
+        return super()._lookup_disk(key)
+
+    def _write(self, key: str, cached) -> None:
+        self.disk_threads.append(current_thread().name)
+        super()._write(key, cached)
+
+
+def test_cached_llm_async(tmp_path: Path):
+    inner = SleepLLM(0)
+    config = LLMsConfig.DashScopeConfig(parameters={"temperature": 0})
+    llm = ThreadRecordingCache(inner, config, cache_folder=tmp_path)
+    first = asyncio.run(llm.arequest(MESSAGES))
+    assert asyncio.run(llm.arequest(MESSAGES)) == first
+    # a new process finds the reply on disk
+    reloaded = ThreadRecordingCache(inner, config, cache_folder=tmp_path)
+    assert asyncio.run(reloaded.arequest(MESSAGES)) == first
+    assert (inner.calls, llm.hits, llm.misses, reloaded.hits) == (1, 1, 1, 1)
+    # the miss read and the write, then the reload read, all off the loop thread
+    threads = llm.disk_threads + reloaded.disk_threads
+    assert (len(threads), "MainThread" in threads) == (3, False)
+
+
+def test_coalescing():
+    inner = SleepLLM(DELAY)
+    llm = CoalescingLLM(inner, LLMsConfig.OpenAIConfig())
+    with ThreadPoolExecutor(4) as executor:
+        responses = list(executor.map(llm.request, [MESSAGES] * 4))
+    assert {r.message.content for r in responses} == {"Hi"}
+    assert (inner.calls, llm.coalesced) == (1, 3)
+
+    inner = AsyncSleepLLM(DELAY)
+    llm = CoalescingLLM(inner, LLMsConfig.OpenAIConfig())
+
+    async def run() -> List[ProteusLLMResponse]:
+        return await asyncio.gather(*[llm.arequest(MESSAGES) for _ in range(4)])
+
+    assert len(set(asyncio.run(run()))) == 1
+    assert (inner.calls, llm.coalesced) == (1, 3)
+
+
+def test_coalescing_stream():
+    inner = ChunkLLM(0)
+    llm = CoalescingLLM(inner, LLMsConfig.OpenAIConfig())
+    assert list(llm.stream(MESSAGES)) == ["H", "i"]
+
+    async def run() -> List[str]:
+        return [chunk async for chunk in llm.astream(MESSAGES)]
+
+    assert asyncio.run(run()) == ["H", "i"]
+    assert llm.coalesced == 0
+
+
+def test_governor():
+    inner = RateLimitedLLM(DELAY / 10)
+    llm = GovernedLLM(inner, max_concurrency=2)
+    prompts = [[ProteusMessage(role="user", content=str(i))] for i in range(4)]
+    with ThreadPoolExecutor(4) as executor:
+        responses = list(executor.map(llm.request, prompts))
+    assert [r.message.content for r in responses] == ["0", "1", "2", "3"]
+    assert (inner.calls, inner.peak) == (8, 2)
+
+
+def test_router():
+    failing, healthy = FailingLLM(0), SleepLLM(0)
+    llm = RouterLLM({"failing": failing, "healthy": healthy}, failure_threshold=2)
+    for _ in range(4):
+        assert llm.request(MESSAGES).message.content == "Hi"
+    # the circuit of the failing backend opened after two failures
+    assert (failing.calls, healthy.calls) == (2, 4)
+    assert llm.stats()["failing"]["open"]
+
+
+def test_router_recovery():
+    flaky, healthy = FailingLLM(0), SleepLLM(0)
+    llm = RouterLLM(
+        {"flaky": flaky, "healthy": healthy},
+        failure_threshold=1,
+        recovery_time=DELAY,
+    )
+    llm.request(MESSAGES)
+    assert llm.stats()["flaky"]["open"]
+    # the backend comes back, and gets its trial while the other one is healthy
+    flaky.down = False
+    llm.request(MESSAGES)
+    assert (flaky.calls, healthy.calls) == (1, 2)
+    time.sleep(DELAY)
+    llm.request(MESSAGES)
+    assert (flaky.calls, healthy.calls) == (2, 2)
+    assert not llm.stats()["flaky"]["open"]
+
+
+def test_router_hedge():
+    slow, fast = AsyncSleepLLM(DELAY / 10), AsyncSleepLLM(DELAY)
+    llm = RouterLLM({"slow": slow, "fast": fast}, hedge=True)
+
+    async def run() -> None:
+        # make "slow" the preferred backend and learn its p95
+        for _ in range(20):
+            await llm._arequest(llm._backends[0], MESSAGES)
+        await llm._arequest(llm._backends[1], MESSAGES)
+        slow.delay, fast.delay = 10 * DELAY, 0
+        start = time.monotonic()
+        response = await llm.arequest(MESSAGES)
+        assert time.monotonic() - start < 5 * DELAY
+        assert response.message.content == "0"
+
+    asyncio.run(run())
+
+
+def test_openai_response():
+    pytest.importorskip("openai")
+    from proteus.llms.openai import _to_response  # noqa: PLC0415
+
+    response = _to_response(
+        b'{"id": "chatcmpl-1", "object": "chat.completion", "model": "gpt-4o",'
+        b' "choices": [{"index": 0, "finish_reason": "stop", "logprobs": null,'
+        b' "message": {"role": "assistant", "content": "Hello", "refusal": null}}],'
+        b' "usage": {"prompt_tokens": 9, "completion_tokens": 2, "total_tokens": 11}}'
+    )
+    assert response == ProteusLLMResponse(
+        message=ProteusMessage(role="assistant", content="Hello"), token_cnt=2
+    )
+    # some compatible servers leave out usage
+    response = _to_response(
+        b'{"choices": [{"message": {"role": "assistant", "content": "Hello"}}]}'
+    )
+    assert response.token_cnt is None
+
+
+def test_dashscope_payloads(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("DASHSCOPE_API_KEY", "test")
+    llm = dashscope.DashScopeLLM(
+        LLMsConfig.DashScopeConfig(model="qwen-max", parameters={"seed": 1})
+    )
+    assert json.loads(llm._body(MESSAGES)) == {
+        "model": "qwen-max",
+        "input": {"messages": [{"role": "user", "content": "Hi"}]},
+        "parameters": {"seed": 1},
+    }
+    parameters = json.loads(llm._body(MESSAGES, stream=True))["parameters"]
+    assert parameters == {
+        "seed": 1,
+        "incremental_output": True,
+        "result_format": "message",
+    }
+
+    response = dashscope._to_response(
+        b'{"output": {"choices": [{"finish_reason": "stop",'
+        b' "message": {"role": "assistant", "content": "Hello"}}]},'
+        b' "usage": {"total_tokens": 11, "output_tokens": 2, "input_tokens": 9},'
+        b' "request_id": "1"}'
+    )
+    assert (response.message.content, response.token_cnt) == ("Hello", 11)
+    response = dashscope._to_response(
+        b'{"output": {"choices": [{"message": {"role": "assistant", "content": "Hello"}}]}}'
+    )
+    assert response.token_cnt is None
+
+    lines = [
+        "id:1",
+        "event:result",
+        ":HTTP_STATUS/200",
+        'data:{"output":{"choices":[{"message":{"role":"assistant","content":"Hel"},'
+        '"finish_reason":"null"}]},"usage":{"output_tokens":1,"input_tokens":9},'
+        '"request_id":"1"}',
+        "",
+        'data:{"output":{"choices":[{"message":{"role":"assistant","content":"lo"}}]}}',
+        'data:{"output":{"choices":[{"message":{"role":"assistant","content":""},'
+        '"finish_reason":"stop"}]}}',
+    ]
+    assert [dashscope._sse_content(line) for line in lines] == [
+        None,
+        None,
+        None,
+        "Hel",
+        None,
+        "lo",
+        None,
+    ]
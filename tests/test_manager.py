@@ -0,0 +1,56 @@
+from pathlib import Path
+
+import pytest
+
+from proteus.config import LLMsConfig, ManagerConfig, PromptsConfig
+from proteus.manager import ProteusManager
+from proteus.manager.talker_store import SQLiteTalkerStorePersisted
+from proteus.spec import ProteusMessage, ProteusMessagePrompt
+from proteus.storages.sqlite_store import SQLiteDatabase
+
+PROMPTS = PromptsConfig(
+    prompts={
+        "default": ProteusMessagePrompt(
+            identity=[ProteusMessage(role="system", content="identity")]
+        )
+    }
+)
+INSTANT = LLMsConfig(
+    simulated=LLMsConfig.SimulatedConfig(
+        latency_ms=0, latency_sigma=0, tokens_per_second=-1, reply_tokens=2
+    )
+)
+
+
+def test_sqlite_talker_store(tmp_path: Path):
+    store = SQLiteTalkerStorePersisted(SQLiteDatabase(tmp_path / "proteus.sqlite3"))
+    store.upsert("a", b"one")
+    store.upsert("a", b"two")
+    assert store.get("a") == b"two"
+    with pytest.raises(KeyError):
+        store.get("missing")
+
+
+def test_sqlite_manager(tmp_path: Path):
+    config = ManagerConfig(
+        live_history_size=2,
+        cache_folder=str(tmp_path),
+        cache_history_enabled=True,
+        cache_talkers_enabled=True,
+        cache_backend="sqlite",
+    )
+    manager = ProteusManager(INSTANT, PROMPTS, config, llm_name="simulated")
+    id = manager.new_talker("default")
+    talker = manager.get_talker(id)
+    assert talker is not None
+    reply = talker.say("one")
+    manager.save_all_talkers()
+    assert (tmp_path / "proteus.sqlite3").exists()
+
+    # a new manager resumes the talker from the database
+    resumed = ProteusManager(INSTANT, PROMPTS, config, llm_name="simulated")
+    talker = resumed.get_talker(id)
+    assert talker is not None
+    assert [m.content for m in talker.state.live_history] == ["one", reply]
+    assert resumed.history_store.get_k(id, 2) == talker.state.live_history
+    assert resumed.get_talker("missing") is None
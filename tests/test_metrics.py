@@ -0,0 +1,175 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import AsyncIterator, Iterator, List
+
+import pytest
+
+from proteus.config import LLMsConfig, ManagerConfig, PromptsConfig
+from proteus.llms.base import BaseLLM
+from proteus.llms.instrumented import InstrumentedLLM
+from proteus.manager import ProteusManager
+from proteus.spec import ProteusLLMResponse, ProteusMessage, ProteusMessagePrompt
+from proteus.storages.history_store import MemoryHistoryStore
+from proteus.storages.instrumented import InstrumentedHistoryStore
+from proteus.utils.metrics import MetricsRegistry
+
+PROMPTS = PromptsConfig(
+    prompts={
+        "default": ProteusMessagePrompt(
+            identity=[ProteusMessage(role="system", content="identity")]
+        )
+    }
+)
+MESSAGES = [ProteusMessage(role="user", content="Hi")]
+DELAY = 0.05
+INSTANT = LLMsConfig.SimulatedConfig(
+    latency_ms=0, latency_sigma=0, tokens_per_second=-1, reply_tokens=4
+)
+
+
+def values(metrics: MetricsRegistry, name: str) -> list:
+    return [sample["value"] for sample in metrics.snapshot()[name]["samples"]]
+
+
+def test_manager_metrics(tmp_path: Path):
+    metrics = MetricsRegistry()
+    manager = ProteusManager(
+        LLMsConfig(simulated=INSTANT),
+        PROMPTS,
+        ManagerConfig(
+            live_history_size=2,
+            cache_folder=str(tmp_path),
+            cache_history_enabled=True,
+            cache_talkers_mem_capacity=1,
+        ),
+        llm_name="simulated",
+        metrics=metrics,
+    )
+    first = manager.new_talker("default")
+    second = manager.new_talker("default")
+    talker = manager.get_talker(second)
+    assert talker is not None
+    talker.say("one")
+    talker.say("two")
+    assert manager.get_talker(first) is None
+
+    (latency,) = values(metrics, "proteus_llm_request_seconds")
+    assert latency["count"] == len(["one", "two"])
+    assert latency["buckets"]["+Inf"] == latency["count"]
+    assert values(metrics, "proteus_llm_tokens_total") == [2 * INSTANT.reply_tokens]
+    assert values(metrics, "proteus_talker_store_hits_total") == [1]
+    assert values(metrics, "proteus_talker_store_misses_total") == [1]
+    assert values(metrics, "proteus_talker_store_evictions_total") == [1]
+    assert values(metrics, "proteus_talker_store_size") == [1]
+    history = metrics.snapshot()["proteus_history_seconds"]["samples"]
+    assert history[0]["labels"] == {"op": "extend", "store": "FileHistoryStore"}
+
+    text = metrics.prometheus()
+    assert (
+        'proteus_llm_request_seconds_bucket{backend="simulated",method="request",le="+Inf"} 2'
+        in text
+    )
+    assert (
+        'proteus_llm_request_seconds_count{backend="simulated",method="request"} 2'
+        in text
+    )
+    assert "# TYPE proteus_talker_store_size gauge" in text
+
+
+class FlakyLLM(BaseLLM):
+    """Fails while down, and streams its chunks after a delay."""
+
+    def __init__(self) -> None:
+        self.down = False
+
+    async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        return self.request(messages)
+
+    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        if self.down:
+            raise ConnectionError("down")
+        return ProteusLLMResponse(
+            message=ProteusMessage(role="assistant", content="ok"), token_cnt=2
+        )
+
+    def stream(self, messages: List[ProteusMessage]) -> Iterator[str]:
+        time.sleep(DELAY)
+        yield "o"
+        time.sleep(DELAY)
+        if self.down:
+            raise ConnectionError("down")
+        yield "k"
+
+    async def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        for chunk in self.stream(messages):
+            yield chunk
+
+
+def test_instrumented_llm():
+    metrics = MetricsRegistry()
+    inner = FlakyLLM()
+    llm = InstrumentedLLM(inner, "flaky", metrics)
+    llm.request(MESSAGES)
+    assert values(metrics, "proteus_llm_tokens_total") == [2]
+    inner.down = True
+    with pytest.raises(ConnectionError):
+        asyncio.run(llm.arequest(MESSAGES))
+    with pytest.raises(ConnectionError):
+        list(llm.stream(MESSAGES))
+
+    async def astream() -> List[str]:
+        return [chunk async for chunk in llm.astream(MESSAGES)]
+
+    inner.down = False
+    assert asyncio.run(astream()) == ["o", "k"]
+    errors = metrics.snapshot()["proteus_llm_errors_total"]["samples"]
+    assert [(e["labels"]["method"], e["value"]) for e in errors] == [
+        ("arequest", 1),
+        ("stream", 1),
+    ]
+    assert {e["labels"]["error"] for e in errors} == {"ConnectionError"}
+
+    latency = {
+        s["labels"]["method"]: s["value"]
+        for s in metrics.snapshot()["proteus_llm_request_seconds"]["samples"]
+    }
+    # a failed request is not timed
+    assert set(latency) == {"request", "stream", "astream"}
+    # streams are timed to their first chunk, once each
+    for method in ("stream", "astream"):
+        assert latency[method]["count"] == 1
+        assert DELAY <= latency[method]["sum"] < 2 * DELAY
+
+
+class BrokenStore(MemoryHistoryStore):
+    def extend(self, session_id: str, msg: List[ProteusMessage]) -> None:
+        raise OSError("disk full")
+
+
+def test_instrumented_history_store():
+    metrics = MetricsRegistry()
+    store = InstrumentedHistoryStore(BrokenStore(10), metrics=metrics)
+    with pytest.raises(OSError, match="disk full"):
+        store.extend("s", MESSAGES)
+    assert store.get_k("s", 1) == []
+    (error,) = metrics.snapshot()["proteus_history_errors_total"]["samples"]
+    assert error == {
+        "labels": {"error": "OSError", "op": "extend", "store": "BrokenStore"},
+        "value": 1,
+    }
+    latency = metrics.snapshot()["proteus_history_seconds"]["samples"]
+    assert [s["labels"]["op"] for s in latency] == ["get_k"]
+
+
+def test_prometheus_escaping():
+    metrics = MetricsRegistry()
+    metrics.counter("errors_total", 'Errors, by "kind"\\path\nsecond line').inc(
+        kind='say "hi"\\now\n'
+    )
+    lines = metrics.prometheus().splitlines()
+    assert lines == [
+        '# HELP errors_total Errors, by "kind"\\\\path\\nsecond line',
+        "# TYPE errors_total counter",
+        'errors_total{kind="say \\"hi\\"\\\\now\\n"} 1',
+    ]
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, List
+
+from proteus.config import PromptsConfig
+from proteus.llms.base import BaseLLM
+from proteus.spec import ProteusLLMResponse, ProteusMessage, ProteusMessagePrompt
+from proteus.talker import ProteusTalker
+from proteus.timing import SlowTurnLog
+
+PROMPTS = PromptsConfig(
+    prompts={
+        "default": ProteusMessagePrompt(
+            identity=[ProteusMessage(role="system", content="identity")]
+        )
+    }
+)
+DELAY = 0.05
+
+
+class EchoLLM(BaseLLM):
+    def __init__(self) -> None:
+        pass
+
+    async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        return self.request(messages)
+
+    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        return ProteusLLMResponse(
+            message=ProteusMessage(role="assistant", content=messages[-1].content)
+        )
+
+
+class ChunkLLM(EchoLLM):
+    """Streams the last message one character at a time, from an async backend."""
+
+    async def astream(self, messages: List[ProteusMessage]) -> AsyncIterator[str]:
+        for chunk in messages[-1].content:
+            await asyncio.sleep(0)
+            yield chunk
+
+
+def test_save_order():
+    saved: List[str] = []
+
+    def save_history(session_id: str, msg: List[ProteusMessage]) -> None:
+        # the first save is the slowest
+        if not saved and msg[0].content == "one":
+            time.sleep(DELAY)
+        saved.append(msg[0].content)
+
+    talker = ProteusTalker.from_new(
+        "default", PROMPTS, EchoLLM(), live_history_size=4, save_history=save_history
+    )
+    with ThreadPoolExecutor(2) as executor:
+        first = executor.submit(talker.say, "one")
+        time.sleep(DELAY / 5)
+        executor.submit(talker.say, "two").result()
+        first.result()
+    live = [m.content for m in talker.state.live_history][::2]
+    assert saved == live == ["one", "two"]
+
+
+def test_say_ex(tmp_path: Path):
+    path = tmp_path / "slow_turns.jsonl"
+    talker = ProteusTalker.from_new(
+        "default",
+        PROMPTS,
+        EchoLLM(),
+        live_history_size=2,
+        slow_turn_log=SlowTurnLog(path, threshold=0),
+    )
+    turn = talker.say_ex("one")
+    assert turn.reply == "one"
+    assert [s.name for s in turn.stages] == ["prompt", "llm", "save"]
+    assert asyncio.run(talker.asay("two")) == "two"
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["prompt_name"] for line in lines] == ["default", "default"]
+    for line in lines:
+        assert set(line["stages"]) == {"prompt", "llm", "save"}
+        assert sum(line["stages"].values()) <= line["duration"]
+    assert (lines[1]["input_chars"], lines[1]["prompt_messages"]) == (3, 4)
+
+
+def test_asay_stream():
+    saved: List[List[str]] = []
+    talker = ProteusTalker.from_new(
+        "default",
+        PROMPTS,
+        ChunkLLM(),
+        live_history_size=4,
+        save_history=lambda _, msg: saved.append([m.content for m in msg]),
+    )
+
+    async def run() -> None:
+        stream = talker.asay_stream("hi")
+        assert await anext(stream) == "h"
+        # nothing is written while the stream runs
+        assert (saved, talker.state.live_history) == ([], [])
+        assert [chunk async for chunk in stream] == ["i"]
+        assert saved == [["hi", "hi"]]
+
+        # an abandoned stream writes nothing
+        stream = talker.asay_stream("bye")
+        assert await anext(stream) == "b"
+        await stream.aclose()
+
+    asyncio.run(run())
+    assert saved == [["hi", "hi"]]
+    assert [m.content for m in talker.state.live_history] == ["hi", "hi"]
@@ -0,0 +1,158 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from proteus.llms.base import BaseLLM
+from proteus.spec import ProteusLLMResponse, ProteusMessage, ProteusMessagePrompt
+from proteus.storages.history_store import MemoryHistoryStore, ThreadedHistoryStore
+from proteus.storages.sqlite_store import SQLiteDatabase, SQLiteHistoryStore
+from proteus.teller import ProteusTeller
+from proteus.timing import SlowTurnLog
+from proteus.tokens import TokenBudget, TokenCounter
+
+
+class EchoLLM(BaseLLM):
+    def __init__(self) -> None:
+        self.requests: List[List[ProteusMessage]] = []
+
+    async def arequest(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        return self.request(messages)
+
+    def request(self, messages: List[ProteusMessage]) -> ProteusLLMResponse:
+        self.requests.append(messages)
+        return ProteusLLMResponse(
+            message=ProteusMessage(role="assistant", content=messages[-1].content)
+        )
+
+
+PROMPT = ProteusMessagePrompt(
+    identity=[ProteusMessage(role="system", content="identity")]
+)
+
+
+def test_say():
+    llm = EchoLLM()
+    teller = ProteusTeller(
+        "test", llm, PROMPT, MemoryHistoryStore(10), live_history_size=2
+    )
+    assert teller.say("one") == "one"
+    assert teller.say("two") == "two"
+    assert [m.content for m in llm.requests[-1]] == ["identity", "one", "one", "two"]
+
+
+def test_token_budget(tmp_path: Path):
+    llm = EchoLLM()
+    counter = TokenCounter(tokenizer=len, message_overhead=0)
+    store = SQLiteHistoryStore(SQLiteDatabase(tmp_path / "proteus.sqlite3"))
+    teller = ProteusTeller(
+        "test",
+        llm,
+        PROMPT,
+        store,
+        live_history_size=10,
+        token_budget=TokenBudget(len("identity") + 6, counter),
+    )
+    teller.say("aaaa")
+    teller.say("bbbb")
+    teller.say("cc")
+    # only the latest reply fits next to the identity and "cc"
+    assert [m.content for m in llm.requests[-1]] == ["identity", "bbbb", "cc"]
+    assert [n for _, n in store.get_k_with_token_cnt("test", 2)] == [2, 2]
+
+
+def test_say_stream():
+    llm = EchoLLM()
+    store = MemoryHistoryStore(10)
+    teller = ProteusTeller("test", llm, PROMPT, store, live_history_size=2)
+    stream = teller.say_stream("one")
+    assert store.get_k("test", 2) == []
+    assert list(stream) == ["one"]
+    assert [m.content for m in store.get_k("test", 2)] == ["one", "one"]
+
+    # an abandoned stream writes nothing
+    stream = teller.say_stream("two")
+    assert next(stream) == "two"
+    stream.close()
+    assert [m.content for m in store.get_k("test", 4)] == ["one", "one"]
+
+
+def test_slow_turn_log(tmp_path: Path):
+    path = tmp_path / "slow_turns.jsonl"
+    log = SlowTurnLog(path, threshold=0)
+    teller = ProteusTeller(
+        "test",
+        EchoLLM(),
+        PROMPT,
+        MemoryHistoryStore(10),
+        live_history_size=2,
+        prompt_name="default",
+        slow_turn_log=log,
+    )
+    turn = teller.say_ex("one")
+    assert turn.reply == "one"
+    # the history fetch splits the prompt stage, so no time is counted twice
+    names = ["prompt", "history", "prompt", "llm", "save"]
+    assert [s.name for s in turn.stages] == names
+    ends = [turn.started_at, *(t for s in turn.stages for t in (s.start, s.end))]
+    assert ends == sorted(ends)
+    assert ends[-1] <= turn.ended_at
+    assert sum(turn.breakdown().values()) <= turn.duration
+    assert teller.say("two") == "two"
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [(line["session_id"], line["prompt_name"]) for line in lines] == [
+        ("test", "default"),
+        ("test", "default"),
+    ]
+    assert set(lines[1]["stages"]) == {"history", "prompt", "llm", "save"}
+    assert (lines[1]["input_chars"], lines[1]["prompt_messages"]) == (3, 4)
+
+
+def test_asay():
+    llm = EchoLLM()
+    store = MemoryHistoryStore(10)
+    teller = ProteusTeller("test", llm, PROMPT, store, live_history_size=2)
+    assert asyncio.run(teller.asay("one")) == "one"
+    assert asyncio.run(teller.asay_with_template({"a": 1}, "missing")) == "a: 1\n"
+    assert [m.content for m in llm.requests[-1]] == ["identity", "one", "one", "a: 1\n"]
+
+    # an async store serves the async methods only
+    async_teller = ProteusTeller(
+        "test", llm, PROMPT, ThreadedHistoryStore(store), live_history_size=2
+    )
+    assert asyncio.run(async_teller.asay("two")) == "two"
+    assert [m.content for m in store.get_k("test", 2)] == ["two", "two"]
+    with pytest.raises(TypeError):
+        async_teller.say("three")
+
+
+class ReversedTeller(ProteusTeller):
+    def construct_prompt_msgs(
+        self, new_inputs: List[ProteusMessage]
+    ) -> List[ProteusMessage]:
+        return list(reversed(super().construct_prompt_msgs(new_inputs)))
+
+
+def test_asay_overridden_prompt(tmp_path: Path):
+    llm = EchoLLM()
+    store = MemoryHistoryStore(10)
+    path = tmp_path / "slow_turns.jsonl"
+    teller = ReversedTeller(
+        "test",
+        llm,
+        PROMPT,
+        store,
+        live_history_size=2,
+        slow_turn_log=SlowTurnLog(path, threshold=0),
+    )
+    # the override builds the prompt, and the slow turn is logged from the loop
+    asyncio.run(teller.asay("one"))
+    assert [m.content for m in llm.requests[-1]] == ["one", "identity"]
+    assert len(path.read_text().splitlines()) == 1
+
+    async_teller = ReversedTeller("test", llm, PROMPT, ThreadedHistoryStore(store))
+    with pytest.raises(TypeError, match="aconstruct_prompt_msgs"):
+        asyncio.run(async_teller.asay("two"))